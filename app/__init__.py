@@ -7,6 +7,13 @@ from flask_migrate import Migrate
 from flask_login import LoginManager
 from flask_bcrypt import Bcrypt
 from datetime import datetime
+from .settings_cache import SettingsCache
+from .catalogos_cache import CatalogoCache
+from .trabajos import Trabajos
+from .indice_personas import IndicePersonas
+from .en_vivo import RegistrosEnVivo
+from .estaticos import Estaticos
+from .fotos import ProcesadorFotos
 
 # 1. Inicializa las extensiones SIN importar nada de nuestra app todavía
 db = SQLAlchemy()
@@ -15,6 +22,13 @@ login_manager = LoginManager()
 login_manager.login_view = 'main.login'
 login_manager.login_message_category = 'info'
 bcrypt = Bcrypt()
+settings_cache = SettingsCache()
+catalogos = CatalogoCache()
+trabajos = Trabajos()
+indice_personas = IndicePersonas()
+registros_en_vivo = RegistrosEnVivo()
+estaticos = Estaticos()
+procesador_fotos = ProcesadorFotos()
 
 def create_app(config_class=Config):
     app = Flask(__name__)
@@ -25,12 +39,20 @@ def create_app(config_class=Config):
     migrate.init_app(app, db)
     login_manager.init_app(app)
     bcrypt.init_app(app)
+    settings_cache.init_app(app)
+    catalogos.init_app(app)
+    trabajos.init_app(app)
+    indice_personas.init_app(app)
+    registros_en_vivo.init_app(app)
+    estaticos.init_app(app)
+    procesador_fotos.init_app(app)
 
     # 3. Importa los modelos y las rutas DESPUÉS de que 'db' y 'app' estén listos
     from . import routes, models
     # --- INICIO DE CAMBIO ---
     # Importa la función de ayuda
     from .utils import convert_utc_to_local
+    from .fotos import foto_url, foto_srcset
 
     @app.template_filter('localtime')
     def localtime_filter(utc_dt, timezone_str="America/Bogota"):
@@ -52,19 +74,30 @@ def create_app(config_class=Config):
     @app.context_processor
     def inject_global_vars():
         """ Inyecta variables globales en todas las plantillas. """
-        # Ahora podemos usar 'models.Setting' de forma segura
-        try:
-            settings = models.Setting.query.all()
-            app_settings = {setting.key: setting.value for setting in settings}
-        except Exception:
-            app_settings = {'LOGO_FILENAME': 'default_logo.png', 'NOMBRE_COLEGIO': 'Control de Almuerzos'}
+        # La configuración se sirve desde la caché en memoria (ver settings_cache.py)
+        app_settings = settings_cache.todos()
 
         return {
             'now': datetime.utcnow,
-            'app_settings': app_settings
+            'app_settings': app_settings,
+            # Catálogos en memoria: evitan cargar dpto_ref/control_ref por cada fila
+            'catalogos': catalogos,
+            # Variantes de las fotos de personas según el tamaño mostrado (ver fotos.py)
+            'foto_url': foto_url,
+            'foto_srcset': foto_srcset
         }
 
     # 4. Registra el Blueprint
     app.register_blueprint(routes.bp)
+
+    # 5. Registra los comandos de consola (flask bench ...)
+    from . import commands
+    app.cli.add_command(commands.bench_cli)
+    app.cli.add_command(commands.verificar_planes)
+    app.cli.add_command(commands.verificar_consultas)
+    app.cli.add_command(commands.reconstruir_rollup_cmd)
+    app.cli.add_command(commands.verificar_importacion)
+    app.cli.add_command(commands.fotos_variantes)
+    app.cli.add_command(commands.fotos_limpiar)
     
     return app
\ No newline at end of file
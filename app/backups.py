@@ -0,0 +1,135 @@
+# app/backups.py
+"""
+Descarga de backups de MySQL en streaming.
+
+`mysqldump | gzip` se arma con dos procesos conectados por un pipe (listas de
+argumentos, sin shell) y la salida de gzip se envía al navegador en bloques
+de TAMANO_BLOQUE a medida que se produce: la memoria del worker no depende
+del tamaño de la BD y la descarga empieza enseguida.
+
+La contraseña va en un archivo de opciones temporal (permisos 0600) que se
+pasa con --defaults-extra-file, así no aparece en la línea de comandos que
+ve cualquier usuario con `ps`. El archivo se borra y los procesos se
+terminan cuando el servidor cierra la respuesta, también si el cliente
+cancela la descarga o nunca la empieza.
+"""
+import os
+import subprocess
+import tempfile
+
+# Bytes de la salida comprimida que se leen y envían en cada bloque
+TAMANO_BLOQUE = 64 * 1024
+
+
+class ErrorBackup(RuntimeError):
+    """mysqldump o gzip terminaron con error; el mensaje incluye su salida de error."""
+
+
+def _valor_opcion(valor):
+    # Entre comillas dobles, el archivo de opciones de MySQL interpreta \\ y \"
+    return '"' + str(valor).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def _escribir_opciones(db_config):
+    """Crea el archivo de opciones [client] con las credenciales y devuelve su ruta."""
+    descriptor, ruta = tempfile.mkstemp(prefix='backup-', suffix='.cnf')  # mkstemp crea el archivo con 0600
+    with os.fdopen(descriptor, 'w') as f:
+        f.write('[client]\n')
+        for clave in ('user', 'password', 'host', 'port'):
+            if db_config.get(clave) is not None:
+                f.write(f'{clave}={_valor_opcion(db_config[clave])}\n')
+    return ruta
+
+
+def _comprobar(procesos, errores):
+    for proceso in procesos:
+        proceso.wait()
+    fallido = next((p for p in procesos if p.returncode != 0), None)
+    if fallido is not None:
+        errores.seek(0)
+        mensaje = errores.read().decode('utf-8', errors='replace').strip()
+        raise ErrorBackup(mensaje or f'{fallido.args[0]} terminó con código {fallido.returncode}')
+
+
+def _cerrar(procesos, errores, opciones):
+    for proceso in procesos:
+        if proceso.poll() is None:  # Descarga cancelada: no dejar procesos huérfanos
+            proceso.kill()
+            proceso.wait()
+        if proceso.stdout is not None:
+            proceso.stdout.close()
+    errores.close()
+    if os.path.exists(opciones):
+        os.remove(opciones)
+
+
+class VolcadoComprimido:
+    """
+    Cuerpo de la respuesta: itera los bloques comprimidos y libera procesos y
+    archivos en close(). El servidor WSGI llama a close() al terminar la
+    respuesta aunque nunca haya empezado a iterarla (HEAD, cliente que se
+    desconecta antes del primer bloque), cosa que el finally de un generador
+    no garantiza.
+    """
+
+    def __init__(self, primero, procesos, errores, opciones, tamano_bloque):
+        self._primero = primero
+        self._procesos = procesos
+        self._errores = errores
+        self._opciones = opciones
+        self._tamano_bloque = tamano_bloque
+        self._cerrado = False
+
+    def __iter__(self):
+        comprimido = self._procesos[-1]
+        bloque, self._primero = self._primero, None
+        try:
+            while bloque:
+                yield bloque
+                bloque = comprimido.stdout.read(self._tamano_bloque)
+            _comprobar(self._procesos, self._errores)
+        finally:
+            self.close()
+
+    def close(self):
+        if not self._cerrado:
+            self._cerrado = True
+            _cerrar(self._procesos, self._errores, self._opciones)
+
+
+def volcado_comprimido(db_config, mysqldump_cmd, gzip_cmd, tamano_bloque=TAMANO_BLOQUE):
+    """
+    Arranca `mysqldump | gzip` y devuelve un VolcadoComprimido con la salida
+    comprimida en bloques de `tamano_bloque` bytes; se usa directamente como
+    cuerpo de la respuesta.
+
+    El primer bloque se lee antes de volver: si el volcado falla de entrada
+    (credenciales, BD inexistente) se lanza ErrorBackup y la vista aún puede
+    redirigir con un mensaje. Un fallo a mitad de la descarga
+    lanza ErrorBackup durante la iteración, lo que corta la respuesta y el
+    navegador marca la descarga como incompleta.
+    """
+    opciones = _escribir_opciones(db_config)
+    errores = tempfile.TemporaryFile()
+    procesos = []
+    try:
+        # --defaults-extra-file tiene que ser la primera opción
+        dump = subprocess.Popen(
+            [mysqldump_cmd, f'--defaults-extra-file={opciones}', '--single-transaction',
+             '--routines', '--triggers', db_config['database']],
+            stdout=subprocess.PIPE, stderr=errores,
+        )
+        procesos.append(dump)
+        comprimido = subprocess.Popen([gzip_cmd, '-c'], stdin=dump.stdout, stdout=subprocess.PIPE, stderr=errores)
+        procesos.append(comprimido)
+        # gzip es el único lector del pipe: si termina, mysqldump recibe SIGPIPE
+        dump.stdout.close()
+
+        primero = comprimido.stdout.read(tamano_bloque)
+        if len(primero) < tamano_bloque:
+            # Lectura corta = fin de la salida: el volcado ya terminó (bien o mal)
+            _comprobar(procesos, errores)
+    except BaseException:
+        _cerrar(procesos, errores, opciones)
+        raise
+    return VolcadoComprimido(primero, procesos, errores, opciones, tamano_bloque)
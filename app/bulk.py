@@ -0,0 +1,43 @@
+# app/bulk.py
+"""
+Utilidades para escrituras masivas: upsert nativo de cada dialecto y
+partición en lotes de tamaño fijo.
+"""
+from itertools import islice
+
+from app import db
+
+
+def sentencia_upsert(tabla, claves, actualizar):
+    """
+    INSERT en `tabla` que, si la fila ya existe (conflicto en `claves`), aplica
+    `actualizar(nuevos)`, un dict {columna: expresión} donde `nuevos` son los
+    valores que se intentaron insertar (excluded / inserted según el dialecto).
+
+    MySQL/MariaDB usan ON DUPLICATE KEY UPDATE; SQLite y PostgreSQL, ON
+    CONFLICT DO UPDATE. Devuelve None si el dialecto no tiene upsert nativo.
+    La sentencia admite una lista de filas (executemany en lotes).
+    """
+    dialecto = db.session.get_bind().dialect.name
+    if dialecto in ('mysql', 'mariadb'):
+        from sqlalchemy.dialects.mysql import insert as mysql_insert
+        stmt = mysql_insert(tabla)
+        return stmt.on_duplicate_key_update(actualizar(stmt.inserted))
+    if dialecto in ('sqlite', 'postgresql'):
+        if dialecto == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        stmt = dialect_insert(tabla)
+        return stmt.on_conflict_do_update(index_elements=list(claves), set_=actualizar(stmt.excluded))
+    return None
+
+
+def en_lotes(iterable, tamano):
+    """Parte `iterable` en listas de como máximo `tamano` elementos."""
+    iterador = iter(iterable)
+    while True:
+        lote = list(islice(iterador, tamano))
+        if not lote:
+            return
+        yield lote
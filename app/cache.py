@@ -0,0 +1,35 @@
+# app/cache.py
+"""
+Utilidades compartidas por las cachés en memoria (settings, catálogos).
+
+Cada worker de gunicorn tiene su propia copia de la caché. Para invalidarlas
+todas a la vez se usa un archivo "sello" en la carpeta instance: quien modifica
+los datos reemplaza el sello y cada worker compara (inode, mtime) con el que
+vio en su última carga. Comprobarlo es un os.stat(), sin consultas a la BD.
+"""
+import os
+import secrets
+
+
+class ArchivoSello:
+    """Archivo cuyo reemplazo señala a todos los workers que deben recargar."""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def leer(self):
+        """Identificador de la versión actual del sello (None si no existe)."""
+        try:
+            st = os.stat(self.path)
+            return (st.st_ino, st.st_mtime_ns)
+        except FileNotFoundError:
+            return None
+
+    def tocar(self):
+        """Reemplaza el sello. os.replace crea un inode nuevo, así el cambio se
+        detecta aunque el mtime no avance (sistemas de archivos con baja resolución)."""
+        tmp_path = f'{self.path}.{secrets.token_hex(4)}'
+        with open(tmp_path, 'w') as f:
+            f.write(secrets.token_hex(8))
+        os.replace(tmp_path, self.path)
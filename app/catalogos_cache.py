@@ -0,0 +1,152 @@
+# app/catalogos_cache.py
+"""
+Caché de lectura de las tablas de catálogo: Dpto, TipoPersona, TipoControl y Rol.
+
+Son tablas pequeñas que casi nunca cambian, así que cada worker las carga una
+vez y las sirve desde memoria, indexadas por id y por nombre. Los elementos se
+guardan como tuplas inmutables con los mismos nombres de atributo que los
+modelos (id_dpto, nombre_dpto, ...), de modo que formularios, plantillas,
+importadores y reportes pueden usarlos en lugar de las instancias ORM.
+
+Las rutas que modifican un catálogo llaman a invalidar(), que reemplaza el
+archivo sello y hace que todos los workers recarguen en la siguiente lectura.
+"""
+import os
+import threading
+from collections import namedtuple
+
+from flask import current_app
+
+from app.cache import ArchivoSello
+
+DptoInfo = namedtuple('DptoInfo', ['id_dpto', 'nombre_dpto'])
+TipoPersonaInfo = namedtuple('TipoPersonaInfo', ['id_tipopersona', 'nombre_tipopersona'])
+TipoControlInfo = namedtuple('TipoControlInfo', ['id_control', 'nombre_control'])
+RolInfo = namedtuple('RolInfo', ['id', 'nombre'])
+
+# catálogo -> (nombre del modelo, tupla, atributo id, atributo nombre)
+CATALOGOS = {
+    'dptos': ('Dpto', DptoInfo, 'id_dpto', 'nombre_dpto'),
+    'tipos_persona': ('TipoPersona', TipoPersonaInfo, 'id_tipopersona', 'nombre_tipopersona'),
+    'tipos_control': ('TipoControl', TipoControlInfo, 'id_control', 'nombre_control'),
+    'roles': ('Rol', RolInfo, 'id', 'nombre'),
+}
+
+# Nombre de tabla del modelo -> catálogo (para invalidar desde crud_view_factory)
+CATALOGO_POR_TABLA = {
+    'dptos': 'dptos',
+    'tipos_persona': 'tipos_persona',
+    'tipo_control': 'tipos_control',
+    'rol': 'roles',
+}
+
+
+class _Catalogo:
+    """Contenido de un catálogo: lista ordenada por id y diccionarios por id y por nombre."""
+
+    def __init__(self, elementos, attr_id, attr_nombre):
+        self.lista = elementos
+        self.por_id = {getattr(e, attr_id): e for e in elementos}
+        self.por_nombre = {getattr(e, attr_nombre): e for e in elementos}
+
+
+class _EstadoCatalogos:
+
+    def __init__(self, stamp_path):
+        self.sello_archivo = ArchivoSello(stamp_path)
+        self.datos = None
+        self.sello = None
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+
+class CatalogoCache:
+    """Caché de lectura de los catálogos con invalidación entre workers."""
+
+    def init_app(self, app):
+        stamp_path = app.config.get('CATALOGOS_STAMP_FILE') or os.path.join(app.instance_path, 'catalogos.stamp')
+        app.extensions['catalogos'] = _EstadoCatalogos(stamp_path)
+
+    @staticmethod
+    def _estado():
+        return current_app.extensions['catalogos']
+
+    @staticmethod
+    def _cargar():
+        from app import models
+        datos = {}
+        for nombre, (nombre_modelo, tupla, attr_id, attr_nombre) in CATALOGOS.items():
+            modelo = getattr(models, nombre_modelo)
+            filas = modelo.query.with_entities(*[getattr(modelo, campo) for campo in tupla._fields])\
+                                .order_by(getattr(modelo, attr_id))
+            datos[nombre] = _Catalogo([tupla(*fila) for fila in filas], attr_id, attr_nombre)
+        return datos
+
+    def _catalogo(self, nombre):
+        estado = self._estado()
+        sello = estado.sello_archivo.leer()
+        if estado.datos is not None and sello == estado.sello:
+            estado.hits += 1
+            return estado.datos[nombre]
+
+        with estado.lock:
+            estado.misses += 1
+            estado.datos = self._cargar()
+            estado.sello = sello
+            return estado.datos[nombre]
+
+    # --- Lectura ---
+
+    def listar(self, nombre):
+        """Elementos del catálogo ordenados por id (equivalente a Modelo.query.all())."""
+        return list(self._catalogo(nombre).lista)
+
+    def por_id(self, nombre, id_elemento):
+        try:
+            return self._catalogo(nombre).por_id.get(int(id_elemento))
+        except (TypeError, ValueError):
+            return None
+
+    def por_nombre(self, nombre, valor):
+        return self._catalogo(nombre).por_nombre.get(valor)
+
+    def mapa_nombres(self, nombre):
+        """Diccionario {nombre: id} del catálogo, útil para importaciones."""
+        _, _, attr_id, _ = CATALOGOS[nombre]
+        return {clave: getattr(e, attr_id) for clave, e in self._catalogo(nombre).por_nombre.items()}
+
+    def nombres_por_id(self, nombre):
+        """Diccionario {id: nombre} del catálogo, para resolver muchas filas sin volver a la caché."""
+        _, _, attr_id, attr_nombre = CATALOGOS[nombre]
+        return {getattr(e, attr_id): getattr(e, attr_nombre) for e in self._catalogo(nombre).lista}
+
+    def dpto(self, id_dpto):
+        return self.por_id('dptos', id_dpto)
+
+    def tipo_persona(self, id_tipopersona):
+        return self.por_id('tipos_persona', id_tipopersona)
+
+    def tipo_control(self, id_control):
+        return self.por_id('tipos_control', id_control)
+
+    def rol(self, id_rol):
+        return self.por_id('roles', id_rol)
+
+    def version(self):
+        """Sello actual de los catálogos (cambia con cada invalidar())."""
+        return self._estado().sello_archivo.leer()
+
+    # --- Invalidación y métricas ---
+
+    def invalidar(self):
+        """Descarta la caché local y avisa al resto de workers."""
+        estado = self._estado()
+        estado.sello_archivo.tocar()
+        with estado.lock:
+            estado.datos = None
+            estado.sello = None
+
+    def estadisticas(self):
+        estado = self._estado()
+        return {'hits': estado.hits, 'misses': estado.misses}
@@ -0,0 +1,304 @@
+# app/checkin.py
+"""
+Motor de registro de almuerzos (check-in).
+
+Cada escaneo se resuelve con un máximo de tres sentencias SQL:
+  1. Un SELECT por clave primaria de la persona. Los nombres de departamento y
+     tipo de control salen de la caché de catálogos y la configuración de
+     impresión de tickets de la caché de settings.
+  2. Un INSERT directo. El duplicado del día lo rechaza la restricción única
+     (persona_id, fecha_local, tipo_control_id), así que no hay carrera entre
+     workers ni consulta previa.
+  3. Un upsert que suma 1 al conteo del día en registro_daily_rollup, en la
+     misma transacción (ver rollup.py).
+
+registrar_lote() resuelve muchos escaneos (torniquetes, kioscos que
+sincronizan su cola sin conexión) por conjuntos, con cinco sentencias por
+lote en lugar de tres por escaneo: un SELECT de todas las personas, un SELECT
+de los registros que ya existen para esos días, un INSERT de varias filas, un
+upsert agregado del rollup y un SELECT de los ids asignados. Si otro worker
+registra a alguien entre la lectura y el INSERT, la restricción única rechaza
+el lote y se repite escaneo a escaneo, cada uno en su SAVEPOINT.
+"""
+from collections import Counter, namedtuple
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app
+from sqlalchemy import select, insert
+from sqlalchemy.exc import IntegrityError
+
+from app import db, settings_cache, catalogos
+from app.models import Persona, Registro
+from app.rollup import sumar_registro, sumar_conteos
+from app.utils import convert_utc_to_local
+
+CONTROL_NO_APLICA = 'no aplica'
+
+# 'estado' es un código estable para agrupar resultados (benchmarks, APIs por lotes).
+ResultadoCheckin = namedtuple('ResultadoCheckin', ['success', 'estado', 'message', 'registro'])
+
+# Escaneos por lote que acepta registrar_lote()
+MAX_LOTE_CHECKIN = 500
+
+# Un escaneo diferido se acepta si su hora no está en el futuro (con margen para
+# relojes desajustados) ni es más antigua que MAX_ANTIGUEDAD_ESCANEO
+TOLERANCIA_RELOJ = timedelta(minutes=5)
+MAX_ANTIGUEDAD_ESCANEO = timedelta(days=3)
+
+
+def _consultar_persona(id_persona):
+    """Sentencia 1: sólo las columnas de la persona que necesita el check-in."""
+    stmt = select(
+        Persona.id_persona,
+        Persona.nombre_persona,
+        Persona.dpto_id,
+        Persona.tipo_persona_id,
+        Persona.control_id
+    ).where(Persona.id_persona == id_persona)
+    return db.session.execute(stmt).first()
+
+
+def _insertar_registro(fila, ahora, fecha_local):
+    """
+    Sentencia 2: INSERT del registro con el dpto y tipo actuales de la persona.
+    Lanza IntegrityError si la persona ya tiene un registro ese día local.
+    Devuelve el id del nuevo registro.
+    """
+    stmt = insert(Registro).values(
+        fecha_hora_registro=ahora,
+        fecha_local=fecha_local,
+        persona_id=fila.id_persona,
+        tipo_control_id=fila.control_id,
+        dpto_id=fila.dpto_id,
+        tipo_persona_id=fila.tipo_persona_id
+    )
+    return db.session.execute(stmt).inserted_primary_key[0]
+
+
+def _rechazo(fila, control):
+    """ResultadoCheckin de rechazo si la persona no puede registrar almuerzo; None si puede."""
+    if not fila:
+        return RESULTADO_NO_ENCONTRADO
+    if control.nombre_control.lower() == CONTROL_NO_APLICA:
+        mensaje = f'"{fila.nombre_persona}" no está habilitado para tomar almuerzo.'
+        return ResultadoCheckin(False, 'no_habilitado', mensaje, None)
+    return None
+
+
+def _registrar(id_persona, ahora, timezone_str):
+    """
+    Valida e inserta el registro sin hacer commit. Lanza IntegrityError si la
+    persona ya tiene registro ese día.
+    """
+    hora_local_registro = convert_utc_to_local(ahora, timezone_str)
+
+    fila = _consultar_persona(id_persona)
+    control = catalogos.tipo_control(fila.control_id) if fila else None
+    rechazo = _rechazo(fila, control)
+    if rechazo:
+        return rechazo
+
+    fecha_local = hora_local_registro.date()
+    id_registro = _insertar_registro(fila, ahora, fecha_local)
+    sumar_registro(fecha_local, fila.dpto_id, fila.tipo_persona_id, fila.control_id)
+    return ResultadoCheckin(True, 'registrado', 'Registro exitoso.',
+                            _datos_registro(id_registro, fila, control, hora_local_registro))
+
+
+RESULTADO_VACIO = ResultadoCheckin(False, 'vacio', 'Debe ingresar un código.', None)
+RESULTADO_NO_ENCONTRADO = ResultadoCheckin(False, 'no_encontrado', 'Código no encontrado.', None)
+RESULTADO_DUPLICADO = ResultadoCheckin(False, 'duplicado', '¡Ya tomó almuerzo hoy!', None)
+RESULTADO_FECHA_INVALIDA = ResultadoCheckin(False, 'fecha_invalida', 'La hora del escaneo no es válida.', None)
+
+
+def registrar_almuerzo(id_persona, ahora=None):
+    """
+    Valida y registra el almuerzo de una persona en una sola transacción.
+    Devuelve un ResultadoCheckin con los datos listos para enviar al frontend.
+    """
+    if not id_persona:
+        return RESULTADO_VACIO
+
+    timezone_str = current_app.config.get('TIMEZONE', 'America/Bogota')
+    try:
+        resultado = _registrar(id_persona, ahora or datetime.utcnow(), timezone_str)
+        if resultado.success:
+            db.session.commit()
+    except IntegrityError:
+        # La restricción única rechazó el segundo almuerzo del día.
+        db.session.rollback()
+        return RESULTADO_DUPLICADO
+    except Exception:
+        db.session.rollback()
+        raise
+    return resultado
+
+
+def leer_hora_escaneo(valor, ahora):
+    """
+    Hora de un escaneo diferido (ISO 8601; sin zona se asume UTC) como datetime
+    UTC sin tzinfo, como se guarda en la BD. Vacío: `ahora`. None si no es válida
+    o está fuera de [ahora - MAX_ANTIGUEDAD_ESCANEO, ahora + TOLERANCIA_RELOJ].
+    """
+    if not valor:
+        return ahora
+    if isinstance(valor, datetime):
+        momento = valor
+    else:
+        try:
+            momento = datetime.fromisoformat(str(valor).strip())
+        except ValueError:
+            return None
+    if momento.tzinfo is not None:
+        momento = momento.astimezone(timezone.utc).replace(tzinfo=None)
+    if not ahora - MAX_ANTIGUEDAD_ESCANEO <= momento <= ahora + TOLERANCIA_RELOJ:
+        return None
+    return momento
+
+
+def registrar_lote(escaneos):
+    """
+    Registra una lista de escaneos (id_persona, hora) en una sola transacción;
+    la hora puede ser un datetime UTC, una cadena ISO 8601 o None (ahora).
+    Devuelve un ResultadoCheckin por escaneo, en el mismo orden.
+    """
+    timezone_str = current_app.config.get('TIMEZONE', 'America/Bogota')
+    ahora = datetime.utcnow()
+    resultados = [None] * len(escaneos)
+    validos = []
+    for indice, (id_persona, hora) in enumerate(escaneos):
+        id_persona = str(id_persona or '').strip()
+        momento = leer_hora_escaneo(hora, ahora)
+        if not id_persona:
+            resultados[indice] = RESULTADO_VACIO
+        elif momento is None:
+            resultados[indice] = RESULTADO_FECHA_INVALIDA
+        else:
+            validos.append((indice, id_persona, momento))
+    if not validos:
+        return resultados
+
+    try:
+        try:
+            _registrar_en_bloque(validos, resultados, timezone_str)
+        except IntegrityError:
+            # Un check-in concurrente ganó la carrera a algún escaneo del lote
+            db.session.rollback()
+            _registrar_uno_a_uno(validos, resultados, timezone_str)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return resultados
+
+
+def _consultar_personas(ids):
+    """Sentencia 1 del lote: las personas de todos los escaneos en un solo SELECT."""
+    stmt = select(
+        Persona.id_persona,
+        Persona.nombre_persona,
+        Persona.dpto_id,
+        Persona.tipo_persona_id,
+        Persona.control_id
+    ).where(Persona.id_persona.in_(ids))
+    return {fila.id_persona: fila for fila in db.session.execute(stmt)}
+
+
+def _registros_por_clave(claves):
+    """
+    Registros existentes de las claves (persona, día local, control) dadas,
+    como {clave: id_registro}. Filtra por persona y día sobre el índice de la
+    restricción única; las combinaciones sobrantes se descartan en Python.
+    """
+    stmt = select(
+        Registro.persona_id, Registro.fecha_local, Registro.tipo_control_id, Registro.id_registro
+    ).where(
+        Registro.persona_id.in_({clave[0] for clave in claves}),
+        Registro.fecha_local.in_({clave[1] for clave in claves})
+    )
+    return {(persona_id, fecha_local, control_id): id_registro
+            for persona_id, fecha_local, control_id, id_registro in db.session.execute(stmt)}
+
+
+def _registrar_en_bloque(validos, resultados, timezone_str):
+    """
+    Valida e inserta los escaneos `validos` (indice, id_persona, hora) por
+    conjuntos y escribe sus resultados en `resultados`. No hace commit; lanza
+    IntegrityError si otro worker insertó alguna clave mientras tanto.
+    """
+    personas = _consultar_personas({id_persona for _, id_persona, _ in validos})
+
+    aceptados = []
+    for indice, id_persona, momento in validos:
+        fila = personas.get(id_persona)
+        control = catalogos.tipo_control(fila.control_id) if fila else None
+        rechazo = _rechazo(fila, control)
+        if rechazo:
+            resultados[indice] = rechazo
+            continue
+        hora_local = convert_utc_to_local(momento, timezone_str)
+        clave = (fila.id_persona, hora_local.date(), fila.control_id)
+        aceptados.append((indice, fila, control, momento, hora_local, clave))
+    if not aceptados:
+        return
+
+    # Sentencia 2: duplicados contra la BD; los repetidos dentro del lote se detectan al añadirlos
+    existentes = set(_registros_por_clave([a[-1] for a in aceptados]))
+    nuevos = []
+    for aceptado in aceptados:
+        indice, clave = aceptado[0], aceptado[-1]
+        if clave in existentes:
+            resultados[indice] = RESULTADO_DUPLICADO
+        else:
+            existentes.add(clave)
+            nuevos.append(aceptado)
+    if not nuevos:
+        return
+
+    # Sentencias 3 y 4: INSERT de varias filas y un upsert por celda del rollup
+    db.session.execute(insert(Registro), [
+        {
+            'fecha_hora_registro': momento,
+            'fecha_local': clave[1],
+            'persona_id': fila.id_persona,
+            'tipo_control_id': fila.control_id,
+            'dpto_id': fila.dpto_id,
+            'tipo_persona_id': fila.tipo_persona_id,
+        }
+        for _, fila, _, momento, _, clave in nuevos
+    ])
+    sumar_conteos(Counter(
+        (clave[1], fila.dpto_id, fila.tipo_persona_id, fila.control_id)
+        for _, fila, _, _, _, clave in nuevos
+    ))
+
+    # Sentencia 5: ids asignados (MySQL no admite RETURNING)
+    ids = _registros_por_clave([n[-1] for n in nuevos])
+    for indice, fila, control, _, hora_local, clave in nuevos:
+        resultados[indice] = ResultadoCheckin(True, 'registrado', 'Registro exitoso.',
+                                              _datos_registro(ids[clave], fila, control, hora_local))
+
+
+def _registrar_uno_a_uno(validos, resultados, timezone_str):
+    """Camino lento del lote: cada escaneo en su SAVEPOINT, como registrar_almuerzo()."""
+    for indice, id_persona, momento in validos:
+        savepoint = db.session.begin_nested()
+        try:
+            resultados[indice] = _registrar(id_persona, momento, timezone_str)
+            savepoint.commit()
+        except IntegrityError:
+            savepoint.rollback()
+            resultados[indice] = RESULTADO_DUPLICADO
+
+
+def _datos_registro(id_registro, fila, control, hora_local_registro):
+    return {
+        'id_registro': id_registro,
+        'id_persona': fila.id_persona,
+        'nombre_persona': fila.nombre_persona,
+        'dpto': catalogos.dpto(fila.dpto_id).nombre_dpto,
+        'tipo_control': control.nombre_control,
+        'fecha_hora': hora_local_registro.strftime('%d/%m/%Y %I:%M:%S %p'),
+        # Por defecto, no imprimimos (más seguro) si la configuración no existe
+        'imprime_ticket': settings_cache.imprime_tickets
+    }
@@ -0,0 +1,790 @@
+# app/commands.py
+"""
+Comandos de consola (flask ...) para mantenimiento y benchmarks.
+
+Los benchmarks crean su propia aplicación contra una base de datos temporal
+(por defecto SQLite en memoria) para no tocar los datos reales.
+"""
+import gc
+import io
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import event, insert, text
+
+from app import db
+from app.consultas import parse_fecha
+from app.rollup import reconstruir as reconstruir_rollup
+
+bench_cli = AppGroup('bench', help='Benchmarks de rendimiento sobre una base de datos temporal.')
+
+
+# --- Utilidades compartidas por los benchmarks ---
+
+def _crear_app_benchmark(database_url):
+    """Crea una instancia de la app apuntando a la BD del benchmark."""
+    from app import create_app
+    from config import Config
+
+    class BenchmarkConfig(Config):
+        SQLALCHEMY_DATABASE_URI = database_url
+        WTF_CSRF_ENABLED = False
+
+    return create_app(BenchmarkConfig)
+
+
+def _poblar_catalogos():
+    """Crea los catálogos y la configuración mínima. Devuelve los ids creados."""
+    from app.models import Dpto, TipoPersona, TipoControl, Setting
+
+    dptos = [Dpto(nombre_dpto=n) for n in ('Administración', 'Primaria', 'Secundaria')]
+    tipos_persona = [TipoPersona(nombre_tipopersona=n) for n in ('Estudiante', 'Docente', 'Personal Adm.')]
+    tipos_control = [TipoControl(nombre_control=n) for n in ('Almuerzo Regular', 'Dieta Especial', 'No Aplica')]
+    db.session.add_all(dptos + tipos_persona + tipos_control)
+    db.session.add(Setting(key='IMPRIME_TICKETS', value='True'))
+    db.session.add(Setting(key='NOMBRE_COLEGIO', value='Colegio de Prueba'))
+    db.session.add(Setting(key='LOGO_FILENAME', value='default_logo.png'))
+    db.session.commit()
+    return {
+        'dptos': [d.id_dpto for d in dptos],
+        'tipos_persona': [tp.id_tipopersona for tp in tipos_persona],
+        'tipos_control': [tc.id_control for tc in tipos_control],
+    }
+
+
+NOMBRES_PRUEBA = ('José', 'María', 'Andrés', 'Sofía', 'Martín', 'Lucía', 'Julián', 'Camila',
+                  'Sebastián', 'Valentina', 'Nicolás', 'Isabella', 'Tomás', 'Daniela')
+APELLIDOS_PRUEBA = ('Gómez', 'Rodríguez', 'Martínez', 'López', 'Pérez', 'García', 'Hernández', 'Muñoz',
+                    'Díaz', 'Sánchez', 'Ramírez', 'Álvarez', 'Ortiz', 'Castaño', 'Peña', 'Quiñones')
+
+
+def nombre_realista(n):
+    """Nombre compuesto con tildes y eñes, determinista para el número `n`."""
+    nombres, apellidos = NOMBRES_PRUEBA, APELLIDOS_PRUEBA
+    return (f'{nombres[n % len(nombres)]} {nombres[(n // 7) % len(nombres)]} '
+            f'{apellidos[(n // 3) % len(apellidos)]} {apellidos[(n // 49) % len(apellidos)]}')
+
+
+def _poblar_roster(total, catalogos, lote=1000, nombre=None):
+    """
+    Inserta `total` personas sintéticas en lotes. `nombre(n)` da el nombre de
+    la persona n (por defecto 'Persona de Prueba n'). Devuelve la lista de ids.
+    """
+    from app.models import Persona
+
+    # La mayoría con almuerzo; el último tipo de control ('No Aplica') para un 5%.
+    controles = catalogos['tipos_control']
+    ids = []
+    for inicio in range(0, total, lote):
+        filas = []
+        for n in range(inicio, min(inicio + lote, total)):
+            id_persona = f'{n:07d}'
+            ids.append(id_persona)
+            filas.append({
+                'id_persona': id_persona,
+                'nombre_persona': nombre(n) if nombre else f'Persona de Prueba {n}',
+                'sexo': 'M' if n % 2 else 'F',
+                'foto': 'default.jpg',
+                'dpto_id': catalogos['dptos'][n % len(catalogos['dptos'])],
+                'tipo_persona_id': catalogos['tipos_persona'][n % len(catalogos['tipos_persona'])],
+                'control_id': controles[-1] if n % 20 == 0 else controles[n % 2],
+            })
+        db.session.execute(insert(Persona), filas)
+    db.session.commit()
+    return ids
+
+
+def _poblar_registros(ids, total, dias=30, lote=5000):
+    """
+    Inserta hasta `total` registros sintéticos repartidos en los últimos `dias` días,
+    respetando un almuerzo por persona y día. Devuelve el número insertado.
+    """
+    from app.models import Registro, Persona, fecha_local_de
+
+    personas = {fila.id_persona: fila for fila in db.session.execute(
+        db.select(Persona.id_persona, Persona.control_id, Persona.dpto_id, Persona.tipo_persona_id))}
+    ahora = datetime.utcnow()
+    insertados = 0
+    filas = []
+    for dia in range(dias):
+        for id_persona in ids:
+            if insertados + len(filas) >= total:
+                break
+            fecha_hora = ahora - timedelta(days=dia, minutes=random.randint(0, 120))
+            filas.append({
+                'fecha_hora_registro': fecha_hora,
+                'fecha_local': fecha_local_de(fecha_hora),
+                'persona_id': id_persona,
+                'tipo_control_id': personas[id_persona].control_id,
+                'dpto_id': personas[id_persona].dpto_id,
+                'tipo_persona_id': personas[id_persona].tipo_persona_id,
+            })
+            if len(filas) >= lote:
+                db.session.execute(insert(Registro), filas)
+                insertados += len(filas)
+                filas = []
+    if filas:
+        db.session.execute(insert(Registro), filas)
+        insertados += len(filas)
+    db.session.commit()
+    # Los INSERT directos no pasan por el check-in: se recalculan los conteos diarios
+    reconstruir_rollup()
+    return insertados
+
+
+def _crear_admin():
+    """Crea los roles y un usuario administrador 'admin'/'admin' para los recorridos HTTP."""
+    from app import bcrypt
+    from app.models import Rol, Usuario
+
+    rol_admin = Rol(nombre='Administrador')
+    db.session.add_all([rol_admin, Rol(nombre='Operador')])
+    db.session.flush()
+    db.session.add(Usuario(username='admin', password=bcrypt.generate_password_hash('admin').decode('utf-8'),
+                           rol_id=rol_admin.id))
+    db.session.commit()
+
+
+def _percentil(valores_ordenados, p):
+    """Percentil por el método del rango más cercano sobre una lista ya ordenada."""
+    if not valores_ordenados:
+        return 0.0
+    k = max(0, min(len(valores_ordenados) - 1, int(round(p / 100.0 * len(valores_ordenados))) - 1))
+    return valores_ordenados[k]
+
+
+@contextmanager
+def contar_sentencias(engine):
+    """Cuenta las sentencias SQL ejecutadas sobre `engine` dentro del bloque."""
+    contador = {'total': 0}
+
+    def _antes_de_ejecutar(conn, cursor, statement, parameters, context, executemany):
+        contador['total'] += 1
+
+    event.listen(engine, 'before_cursor_execute', _antes_de_ejecutar)
+    try:
+        yield contador
+    finally:
+        event.remove(engine, 'before_cursor_execute', _antes_de_ejecutar)
+
+
+def _imprimir_latencias(titulo, tiempos_ms):
+    tiempos_ms = sorted(tiempos_ms)
+    if not tiempos_ms:
+        click.echo(f'  {titulo}: sin muestras')
+        return
+    click.echo(
+        f'  {titulo}: n={len(tiempos_ms)} '
+        f'p50={_percentil(tiempos_ms, 50):.3f} ms '
+        f'p99={_percentil(tiempos_ms, 99):.3f} ms '
+        f'max={tiempos_ms[-1]:.3f} ms'
+    )
+
+
+# --- Benchmarks ---
+
+@bench_cli.command('checkin')
+@click.option('--personas', default=5000, show_default=True, help='Tamaño del roster sintético.')
+@click.option('--escaneos', default=2000, show_default=True, help='Número de escaneos a simular.')
+@click.option('--database-url', default='sqlite://', show_default=True, help='BD temporal del benchmark.')
+@click.option('--semilla', default=42, show_default=True)
+def bench_checkin(personas, escaneos, database_url, semilla):
+    """Latencia p50/p99 por escaneo de registrar_almuerzo()."""
+    from app import settings_cache, catalogos
+    from app.checkin import registrar_almuerzo
+
+    app = _crear_app_benchmark(database_url)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        ids = _poblar_roster(personas, _poblar_catalogos())
+        # Se incluyen códigos inexistentes y repetidos para medir todos los caminos.
+        rnd = random.Random(semilla)
+        muestra = [rnd.choice(ids) if rnd.random() > 0.02 else 'NO-EXISTE' for _ in range(escaneos)]
+        # Cachés de settings y catálogos cargadas, como en un worker ya en marcha
+        settings_cache.todos()
+        catalogos.listar('tipos_control')
+
+        tiempos = {}
+        max_sentencias = 0
+        for id_persona in muestra:
+            with contar_sentencias(db.engine) as contador:
+                t0 = time.perf_counter()
+                resultado = registrar_almuerzo(id_persona)
+                transcurrido = (time.perf_counter() - t0) * 1000
+            max_sentencias = max(max_sentencias, contador['total'])
+            tiempos.setdefault(resultado.estado, []).append(transcurrido)
+
+        click.echo(f'Benchmark check-in: roster={personas} escaneos={escaneos} bd={db.engine.url.drivername}')
+        _imprimir_latencias('todos', [t for lista in tiempos.values() for t in lista])
+        for clave, lista in sorted(tiempos.items()):
+            _imprimir_latencias(clave, lista)
+        click.echo(f'  sentencias SQL por escaneo (máx.): {max_sentencias}')
+        db.session.remove()
+        db.drop_all()
+
+
+@bench_cli.command('checkin-lote')
+@click.option('--personas', default=20000, show_default=True, help='Tamaño del roster sintético.')
+@click.option('--escaneos', default=10000, show_default=True, help='Escaneos de cada modo (uno a uno y por lotes).')
+@click.option('--lote', default=200, show_default=True, help='Escaneos por llamada a registrar_lote().')
+@click.option('--database-url', default='sqlite://', show_default=True, help='BD temporal del benchmark.')
+@click.option('--semilla', default=42, show_default=True)
+def bench_checkin_lote(personas, escaneos, lote, database_url, semilla):
+    """Escaneos por segundo de registrar_almuerzo() frente a registrar_lote()."""
+    from app import settings_cache, catalogos
+    from app.bulk import en_lotes
+    from app.checkin import registrar_almuerzo, registrar_lote, MAX_LOTE_CHECKIN
+
+    if lote > MAX_LOTE_CHECKIN:
+        raise click.BadParameter(f'máximo {MAX_LOTE_CHECKIN}', param_hint='--lote')
+    app = _crear_app_benchmark(database_url)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        ids = _poblar_roster(personas, _poblar_catalogos())
+        settings_cache.todos()
+        catalogos.listar('tipos_control')
+
+        # Cada modo registra a su propia mitad del roster, con un 5% de códigos
+        # repetidos y un 2% inexistentes, como la cola de un kiosco real
+        rnd = random.Random(semilla)
+        rnd.shuffle(ids)
+        mitades = {'uno a uno': ids[:len(ids) // 2], 'por lotes': ids[len(ids) // 2:]}
+        muestras = {}
+        for modo, grupo in mitades.items():
+            muestra = []
+            for i in range(escaneos):
+                azar = rnd.random()
+                if azar < 0.02:
+                    muestra.append('NO-EXISTE')
+                elif azar < 0.07 and muestra:
+                    muestra.append(rnd.choice(muestra))
+                else:
+                    muestra.append(grupo[i % len(grupo)])
+            muestras[modo] = muestra
+
+        click.echo(f'Benchmark check-in por lotes: roster={personas} escaneos={escaneos} '
+                   f'lote={lote} bd={db.engine.url.drivername}')
+        estados = {}
+        with contar_sentencias(db.engine) as contador:
+            t0 = time.perf_counter()
+            for id_persona in muestras['uno a uno']:
+                resultado = registrar_almuerzo(id_persona)
+                estados.setdefault('uno a uno', []).append(resultado.estado)
+            tiempos = {'uno a uno': time.perf_counter() - t0}
+        sentencias = {'uno a uno': contador['total'] / escaneos}
+
+        with contar_sentencias(db.engine) as contador:
+            t0 = time.perf_counter()
+            for grupo in en_lotes(muestras['por lotes'], lote):
+                estados.setdefault('por lotes', []).extend(r.estado for r in registrar_lote([(i, None) for i in grupo]))
+            tiempos['por lotes'] = time.perf_counter() - t0
+        sentencias['por lotes'] = contador['total'] / escaneos
+
+        for modo, segundos in tiempos.items():
+            conteo = ', '.join(f'{e}={n}' for e, n in sorted(
+                (e, estados[modo].count(e)) for e in set(estados[modo])))
+            click.echo(f'  {modo}: {escaneos / segundos:,.0f} escaneos/s, '
+                       f'{1000 * segundos / escaneos:.3f} ms/escaneo, '
+                       f'{sentencias[modo]:.2f} sentencias/escaneo ({conteo})')
+        click.echo(f'  aceleración por escaneo: x{tiempos["uno a uno"] / tiempos["por lotes"]:.1f}')
+        db.session.remove()
+        db.drop_all()
+
+
+class MuestreadorRSS:
+    """
+    Mide el pico de memoria residente (RSS) del proceso mientras dura el bloque,
+    muestreando /proc/self/statm en un hilo. Fuera de Linux usa ru_maxrss, que
+    es el pico de toda la vida del proceso.
+    """
+
+    def __init__(self, intervalo=0.005):
+        self.intervalo = intervalo
+        self.inicial = self.pico = 0
+        self._parar = threading.Event()
+        self._hilo = None
+
+    @staticmethod
+    def rss_actual():
+        try:
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, ValueError, AttributeError):
+            import resource
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def _muestrear(self):
+        while not self._parar.wait(self.intervalo):
+            self.pico = max(self.pico, self.rss_actual())
+
+    def __enter__(self):
+        gc.collect()
+        self.inicial = self.pico = self.rss_actual()
+        self._hilo = threading.Thread(target=self._muestrear, daemon=True)
+        self._hilo.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._parar.set()
+        self._hilo.join()
+        self.pico = max(self.pico, self.rss_actual())
+
+    @property
+    def crecimiento_mb(self):
+        return (self.pico - self.inicial) / (1024 * 1024)
+
+
+@bench_cli.command('reporte')
+@click.option('--registros', default=100000, show_default=True, help='Filas del reporte.')
+@click.option('--personas', default=5000, show_default=True, help='Tamaño del roster sintético.')
+@click.option('--database-url', default='sqlite://', show_default=True, help='BD temporal del benchmark.')
+def bench_reporte(registros, personas, database_url):
+    """Pico de RSS al exportar un reporte completo (HTML, CSV, XLSX) y tiempo de los resúmenes."""
+    from app.reportes import filas_reporte, generar_csv, generar_resumen, RESUMENES
+
+    app = _crear_app_benchmark(database_url)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        ids = _poblar_roster(personas, _poblar_catalogos())
+        total = _poblar_registros(ids, registros, dias=-(-registros // personas))
+        _crear_admin()
+
+    client = app.test_client()
+    client.post('/login', data={'username': 'admin', 'password': 'admin'})
+    click.echo(f'Benchmark de reportes: filas={total} bd={database_url.split(":")[0]}')
+
+    for formato in ('html', 'csv', 'xlsx'):
+        with MuestreadorRSS() as rss:
+            t0 = time.perf_counter()
+            respuesta = client.post('/reportes', data={'tipo_reporte': 'general', 'formato': formato})
+            enviados = sum(len(bloque) for bloque in respuesta.response)
+            respuesta.close()
+            transcurrido = time.perf_counter() - t0
+        click.echo(f'  {formato:<15} {enviados / 1e6:8.1f} MB en {transcurrido:6.2f} s  '
+                   f'pico RSS +{rss.crecimiento_mb:.1f} MB')
+
+    # Resúmenes con GROUP BY sobre el mismo rango (sólo viajan los conteos)
+    with app.test_request_context():
+        desde = datetime.utcnow().date() - timedelta(days=-(-registros // personas))
+        for tipo in RESUMENES:
+            t0 = time.perf_counter()
+            resumen, _, _ = generar_resumen(tipo, desde)
+            transcurrido = (time.perf_counter() - t0) * 1000
+            click.echo(f'  resumen {tipo:<16} {len(resumen.filas):6d} filas en {transcurrido:8.1f} ms')
+
+    # Referencia: lo que costaba materializar todas las filas antes de generar la salida
+    with app.test_request_context():
+        with MuestreadorRSS() as rss:
+            t0 = time.perf_counter()
+            filas = list(filas_reporte('general'))
+            enviados = sum(len(bloque) for bloque in generar_csv(filas))
+            transcurrido = time.perf_counter() - t0
+        del filas
+        click.echo(f'  {"csv con list()":<15} {enviados / 1e6:8.1f} MB en {transcurrido:6.2f} s  '
+                   f'pico RSS +{rss.crecimiento_mb:.1f} MB')
+        db.session.remove()
+        db.drop_all()
+
+
+def _excel_estudiantes(total, destino=None):
+    """
+    Excel con el formato del sistema académico y `total` estudiantes, escrito
+    en `destino` (ruta) o en memoria. Devuelve la ruta o el BytesIO.
+    """
+    from openpyxl import Workbook
+
+    secciones = ('Administración', 'Primaria', 'Secundaria')
+    grupos = ('ALMUERZO NORMAL', 'ALMUERZO ESPECIAL', 'SIN ALMUERZO')
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(['Sección', 'Estudiante', 'Grupos', 'Id', 'Sexo'])
+    for n in range(total):
+        ws.append([secciones[n % 3], f'Apellido {n}, Nombre {n}', grupos[n % 3], f'{n:07d}',
+                   'MASCULINO' if n % 2 else 'FEMENINO'])
+    archivo = destino or io.BytesIO()
+    wb.save(archivo)
+    if not destino:
+        archivo.seek(0)
+    return archivo
+
+
+def _csv_personas(total, destino):
+    """CSV de personas con `total` filas (en Latin-1, como lo exporta Excel en Windows)."""
+    import csv
+
+    secciones = ('Administración', 'Primaria', 'Secundaria')
+    tipos = ('Estudiante', 'Docente', 'Personal Adm.')
+    controles = ('Almuerzo Regular', 'Dieta Especial', 'No Aplica')
+    with open(destino, 'w', encoding='latin-1', newline='') as f:
+        writer = csv.writer(f, delimiter=';')
+        writer.writerow(['id_persona', 'nombre_persona', 'sexo', 'nombre_dpto', 'nombre_tipopersona', 'nombre_control'])
+        for n in range(total):
+            writer.writerow([f'{n:07d}', f'Persona Año {n}', 'MF'[n % 2], secciones[n % 3], tipos[n % 3], controles[n % 3]])
+    return destino
+
+
+@bench_cli.command('buscar')
+@click.option('--personas', default=50000, show_default=True, help='Tamaño del roster sintético.')
+@click.option('--busquedas', default=2000, show_default=True, help='Número de búsquedas a simular.')
+@click.option('--database-url', default='sqlite://', show_default=True, help='BD temporal del benchmark.')
+@click.option('--semilla', default=42, show_default=True)
+def bench_buscar(personas, busquedas, database_url, semilla):
+    """Latencia de la búsqueda por nombre: índice en memoria frente a ILIKE '%término%'."""
+    from app import indice_personas
+    from app.indice_personas import normalizar
+    from app.models import Persona
+
+    app = _crear_app_benchmark(database_url)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        _poblar_roster(personas, _poblar_catalogos(), nombre=nombre_realista)
+
+        # Fragmentos de nombres reales, con y sin tildes, en minúsculas, y algunos que no existen
+        rnd = random.Random(semilla)
+        terminos = []
+        for _ in range(busquedas):
+            nombre = nombre_realista(rnd.randrange(personas))
+            inicio = rnd.randrange(len(nombre) - 3)
+            termino = nombre[inicio:inicio + rnd.randint(3, 12)].strip()
+            termino = rnd.choice((termino, termino.lower(), normalizar(termino)))
+            terminos.append(termino if rnd.random() > 0.05 else 'Zzyzx')
+        terminos = [t for t in terminos if len(t) >= 3]
+
+        t0 = time.perf_counter()
+        indice_personas.buscar('precarga')
+        construccion = (time.perf_counter() - t0) * 1000
+
+        tiempos = []
+        for termino in terminos:
+            t0 = time.perf_counter()
+            indice_personas.buscar(termino, limite=20)
+            tiempos.append((time.perf_counter() - t0) * 1000)
+
+        tiempos_ilike = []
+        for termino in terminos[:200]:
+            t0 = time.perf_counter()
+            Persona.query.filter(Persona.nombre_persona.ilike(f'%{termino}%'))\
+                         .order_by(Persona.nombre_persona).limit(20).all()
+            tiempos_ilike.append((time.perf_counter() - t0) * 1000)
+
+        click.echo(f'Benchmark búsqueda por nombre: roster={personas} bd={db.engine.url.drivername}')
+        click.echo(f'  construcción del índice: {construccion:.0f} ms ({indice_personas.estadisticas()["trigramas"]} trigramas)')
+        _imprimir_latencias('índice en memoria', tiempos)
+        _imprimir_latencias("ILIKE '%término%'", tiempos_ilike)
+        db.session.remove()
+        db.drop_all()
+
+
+@bench_cli.command('importar')
+@click.option('--filas', default='1000,10000,50000', show_default=True, help='Tamaños de archivo, separados por comas.')
+@click.option('--database-url', default='sqlite://', show_default=True, help='BD temporal del benchmark.')
+def bench_importar(filas, database_url):
+    """Tiempo de la importación de estudiantes desde Excel (la mitad de las filas ya existe)."""
+    from app.importacion import importar_excel_estudiantes
+
+    click.echo(f'Benchmark importación Excel: bd={database_url.split(":")[0]}')
+    for total in (int(n) for n in filas.split(',')):
+        app = _crear_app_benchmark(database_url)
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            _poblar_roster(total // 2, _poblar_catalogos())
+            archivo = _excel_estudiantes(total)
+
+            # Segunda pasada con el mismo archivo: no hay nada que escribir
+            for etiqueta in ('importar', 'reimportar'):
+                archivo.seek(0)
+                with contar_sentencias(db.engine) as contador:
+                    t0 = time.perf_counter()
+                    resultado = importar_excel_estudiantes(archivo)
+                    db.session.commit()
+                    transcurrido = time.perf_counter() - t0
+
+                click.echo(
+                    f'  {total:>7} filas {etiqueta:<10}: {transcurrido:6.2f} s ({total / transcurrido:,.0f} filas/s), '
+                    f'{contador["total"]} sentencias SQL, {resultado.creados} creados, '
+                    f'{resultado.actualizados} actualizados, {resultado.sin_cambios} sin cambios, '
+                    f'{len(resultado.errores)} errores'
+                )
+            db.session.remove()
+            db.drop_all()
+
+
+@click.command('verificar-importacion')
+@click.option('--filas', default=100000, show_default=True, help='Filas del archivo grande.')
+@click.option('--max-mb', default=40.0, show_default=True, help='Crecimiento máximo de RSS permitido.')
+def verificar_importacion(filas, max_mb):
+    """
+    Falla si importar un Excel o un CSV de `filas` filas hace crecer la memoria
+    residente más de --max-mb. Compara con un archivo diez veces menor.
+    """
+    import tempfile
+    from app.importacion import importar_excel_estudiantes, importar_csv_personas, abrir_csv
+
+    def _importar_excel(ruta):
+        with open(ruta, 'rb') as f:
+            return importar_excel_estudiantes(f)
+
+    def _importar_csv(ruta):
+        with open(ruta, 'rb') as f:
+            reader = abrir_csv(f)
+            next(reader)
+            return importar_csv_personas(reader)
+
+    fallos = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        # BD en archivo: las filas importadas no cuentan como memoria del proceso
+        app = _crear_app_benchmark(f'sqlite:///{os.path.join(tmp, "importacion.db")}')
+        with app.app_context():
+            db.create_all()
+            _poblar_catalogos()
+            click.echo(f'Memoria de la importación (máx. +{max_mb:.0f} MB):')
+            for total in (filas // 10, filas):
+                archivos = (
+                    ('excel', _importar_excel, _excel_estudiantes(total, os.path.join(tmp, f'e{total}.xlsx'))),
+                    ('csv', _importar_csv, _csv_personas(total, os.path.join(tmp, f'p{total}.csv'))),
+                )
+                for formato, importar, ruta in archivos:
+                    db.session.execute(text('DELETE FROM personas'))
+                    db.session.commit()
+                    with MuestreadorRSS() as rss:
+                        resultado = importar(ruta)
+                        db.session.commit()
+                    estado = 'ok   ' if rss.crecimiento_mb <= max_mb and not resultado.errores else 'FALLO'
+                    fallos += estado == 'FALLO'
+                    click.echo(f'  {estado} {formato:<5} {total:>7} filas ({os.path.getsize(ruta) / 1e6:5.1f} MB): '
+                               f'pico RSS +{rss.crecimiento_mb:.1f} MB, {resultado.creados} creados, '
+                               f'{len(resultado.errores)} errores')
+            db.session.remove()
+            db.engine.dispose()
+
+    if fallos:
+        raise click.ClickException(f'{fallos} importación(es) superan el límite de memoria o tienen errores.')
+    click.echo('La memoria de la importación no depende del tamaño del archivo.')
+
+
+# --- Verificación de planes de ejecución ---
+
+# Tablas grandes en las que un escaneo completo se considera una regresión.
+TABLAS_VIGILADAS = ('registros', 'personas', 'registro_daily_rollup')
+
+
+def _explicar(conn, stmt):
+    """
+    Ejecuta EXPLAIN sobre `stmt` y devuelve una lista de (tabla, detalle, es_escaneo_completo).
+    Soporta SQLite (EXPLAIN QUERY PLAN) y MySQL/MariaDB (EXPLAIN, type = ALL).
+    """
+    sql = str(stmt.compile(dialect=conn.dialect, compile_kwargs={'literal_binds': True}))
+    pasos = []
+    if conn.dialect.name == 'sqlite':
+        for fila in conn.execute(text('EXPLAIN QUERY PLAN ' + sql)):
+            detalle = fila[-1]
+            # "SCAN tabla" sin "USING ... INDEX" es un recorrido completo de la tabla.
+            m = re.match(r'SCAN (\w+)(?: AS \w+)?(.*)$', detalle)
+            pasos.append((m.group(1) if m else None, detalle, bool(m) and 'INDEX' not in m.group(2)))
+    elif conn.dialect.name in ('mysql', 'mariadb'):
+        for fila in conn.execute(text('EXPLAIN ' + sql)).mappings():
+            detalle = f"type={fila['type']} key={fila['key']} rows={fila['rows']}"
+            pasos.append((fila['table'], detalle, fila['type'] == 'ALL'))
+    else:
+        raise click.UsageError(f'Dialecto no soportado para EXPLAIN: {conn.dialect.name}')
+    return pasos
+
+
+def _verificar_planes_en(engine, etiqueta):
+    """Revisa cada consulta vigilada sobre `engine`. Devuelve el número de regresiones."""
+    from app.consultas import consultas_vigiladas
+
+    regresiones = 0
+    click.echo(f'Planes de ejecución en {etiqueta} ({engine.dialect.name}):')
+    with engine.connect() as conn:
+        for nombre, stmt in consultas_vigiladas():
+            problemas = [
+                detalle for tabla, detalle, completo in _explicar(conn, stmt)
+                if completo and tabla in TABLAS_VIGILADAS
+            ]
+            if problemas:
+                regresiones += 1
+                click.echo(f'  FALLO {nombre}: escaneo completo -> {"; ".join(problemas)}')
+            else:
+                click.echo(f'  ok    {nombre}')
+    return regresiones
+
+
+@click.command('verificar-planes')
+@click.option('--solo-sqlite', is_flag=True, help='No revisar la BD configurada aunque sea MySQL.')
+def verificar_planes(solo_sqlite):
+    """Falla si alguna consulta caliente de registros hace un escaneo completo."""
+    regresiones = 0
+
+    # 1. Esquema de los modelos sobre SQLite en memoria.
+    app = _crear_app_benchmark('sqlite://')
+    with app.app_context():
+        db.create_all()
+        regresiones += _verificar_planes_en(db.engine, 'SQLite temporal')
+
+    # 2. BD configurada, si es MySQL (esquema real aplicado por las migraciones).
+    if not solo_sqlite and current_app.config.get('DB_CONFIG'):
+        regresiones += _verificar_planes_en(db.engine, 'BD configurada')
+
+    if regresiones:
+        raise click.ClickException(f'{regresiones} consulta(s) hacen un escaneo completo.')
+    click.echo('Todas las consultas vigiladas usan índices.')
+
+
+# --- Mantenimiento ---
+
+@click.command('reconstruir-rollup')
+@click.option('--desde', help='Primer día local (YYYY-MM-DD). Por defecto, desde el inicio.')
+@click.option('--hasta', help='Último día local (YYYY-MM-DD). Por defecto, hasta el último registro.')
+def reconstruir_rollup_cmd(desde, hasta):
+    """Recalcula registro_daily_rollup desde la tabla registros para un rango de días."""
+    fecha_inicio, fecha_fin = parse_fecha(desde), parse_fecha(hasta)
+    if (desde and not fecha_inicio) or (hasta and not fecha_fin):
+        raise click.BadParameter('Las fechas deben tener el formato YYYY-MM-DD.')
+    if fecha_inicio and fecha_fin and fecha_inicio > fecha_fin:
+        raise click.BadParameter('--desde no puede ser posterior a --hasta.')
+
+    t0 = time.perf_counter()
+    celdas = reconstruir_rollup(fecha_inicio, fecha_fin)
+    rango = f'{desde or "inicio"} a {hasta or "fin"}'
+    click.echo(f'Rollup reconstruido ({rango}): {celdas} celdas en {time.perf_counter() - t0:.2f} s.')
+
+
+@click.command('fotos-variantes')
+@click.option('--procesos', type=int, default=None, help='Procesos del pool. Por defecto, uno por CPU.')
+@click.option('--lote', default=200, show_default=True, help='Fotos convertidas por commit.')
+def fotos_variantes(procesos, lote):
+    """Genera las variantes (tamaños y WebP/JPEG) de las fotos antiguas y actualiza Persona.foto."""
+    from sqlalchemy import bindparam, select, update
+    from app.bulk import en_lotes
+    from app.fotos import carpeta_fotos, convertir_antiguas, es_foto_antigua
+    from app.models import Persona
+
+    fotos = [f for f in db.session.execute(select(Persona.foto).distinct()).scalars() if es_foto_antigua(f)]
+    if not fotos:
+        click.echo('No hay fotos antiguas que convertir.')
+        return
+
+    personas = Persona.__table__
+    cambiar = (update(personas).where(personas.c.foto == bindparam('antigua'))
+               .values(foto=bindparam('nueva')))
+    t0 = time.perf_counter()
+    convertidas, errores = 0, []
+    resultados = convertir_antiguas(fotos, carpeta_fotos(), procesos)
+    for grupo in en_lotes(resultados, lote):
+        cambios = [{'antigua': antigua, 'nueva': nueva} for antigua, nueva, _ in grupo if nueva]
+        errores.extend((antigua, error) for antigua, nueva, error in grupo if not nueva)
+        if cambios:
+            db.session.execute(cambiar, cambios)
+            db.session.commit()
+        convertidas += len(cambios)
+        click.echo(f'  {convertidas + len(errores)}/{len(fotos)} fotos procesadas')
+
+    for antigua, error in errores:
+        click.echo(f'  No se pudo convertir {antigua}: {error}', err=True)
+    click.echo(f'{convertidas} fotos convertidas y {len(errores)} con error en '
+               f'{time.perf_counter() - t0:.1f} s. Los archivos antiguos se borran con flask fotos-limpiar.')
+
+
+@click.command('fotos-limpiar')
+@click.option('--antiguedad', default=3600, show_default=True,
+              help='Segundos mínimos desde la última escritura para borrar un archivo sin referencias.')
+@click.option('--simular', is_flag=True, help='Sólo informa lo que se borraría.')
+def fotos_limpiar(antiguedad, simular):
+    """Borra las fotos que ya no referencia ninguna persona e informa del espacio liberado."""
+    from sqlalchemy import select
+    from app.fotos import carpeta_fotos, clave_almacen, limpiar_huerfanas
+    from app.models import Persona
+
+    t0 = time.perf_counter()
+    fotos = db.session.execute(select(Persona.foto).distinct().execution_options(yield_per=5000)).scalars()
+    referenciadas = {clave_almacen(foto) for foto in fotos if foto}
+    resultado = limpiar_huerfanas(carpeta_fotos(), referenciadas, antiguedad, simular)
+
+    accion = 'Se borrarían' if simular else 'Borrados'
+    click.echo(f'{accion} {resultado.borrados} archivos sin referencias '
+               f'({resultado.bytes_liberados / (1024 * 1024):.2f} MB liberados) en {time.perf_counter() - t0:.2f} s.')
+    click.echo(f'  {len(referenciadas)} fotos referenciadas, {resultado.conservados} archivos en uso, '
+               f'{resultado.recientes} sin referencias pero escritos hace menos de {antiguedad} s.')
+
+
+# --- Presupuesto de sentencias SQL por vista ---
+
+# (método, ruta, datos del formulario, máximo de sentencias por petición)
+# Incluye la carga de current_user. Settings y catálogos ya están en caché.
+PRESUPUESTO_SENTENCIAS = [
+    ('GET', '/registro', None, 2),
+    ('GET', '/personas', None, 2),
+    ('GET', '/personas?dpto=1&q=Prueba', None, 2),
+    ('GET', '/personas/pagina', None, 2),
+    # Sólo la carga del usuario: la búsqueda se resuelve en el índice en memoria
+    ('GET', '/buscar_persona?q=prueba', None, 1),
+    # Usuario y una sola lectura de personas; departamentos y controles salen de la caché
+    ('GET', '/api/roster', None, 2),
+    # Una consulta con registro y persona; el QR sale de la caché en memoria en reimpresiones
+    ('GET', '/imprimir_ticket/1', None, 2),
+    ('GET', '/imprimir_ticket/1/qr.svg', None, 2),
+    ('POST', '/reportes', {'tipo_reporte': 'general'}, 2),
+    ('POST', '/reportes', {'tipo_reporte': 'dpto', 'filtro_id': '1'}, 2),
+    ('POST', '/reportes', {'tipo_reporte': 'tipo_persona', 'filtro_id': '1'}, 2),
+    ('POST', '/reportes', {'tipo_reporte': 'general', 'formato': 'csv'}, 2),
+    ('POST', '/reportes', {'tipo_reporte': 'general', 'formato': 'xlsx'}, 2),
+    ('GET', '/reportes/resumen/diario', None, 2),
+    ('GET', '/reportes/resumen/dpto_control?formato=json', None, 2),
+    ('GET', '/reportes/resumen/mensual_persona', None, 2),
+]
+
+
+def medir_sentencias_por_peticion(client, engine, metodo, ruta, datos=None):
+    """Hace la petición con el cliente de pruebas y devuelve (respuesta, nº de sentencias)."""
+    with contar_sentencias(engine) as contador:
+        # buffered=True consume las respuestas en streaming dentro del bloque
+        respuesta = client.open(ruta, method=metodo, data=datos, buffered=True)
+    return respuesta, contador['total']
+
+
+@click.command('verificar-consultas')
+@click.option('--personas', default=500, show_default=True)
+@click.option('--registros', default=5000, show_default=True)
+def verificar_consultas(personas, registros):
+    """Falla si alguna vista supera su presupuesto de sentencias SQL (detecta N+1)."""
+    app = _crear_app_benchmark('sqlite://')
+    excedidas = 0
+    with app.app_context():
+        db.create_all()
+        ids = _poblar_roster(personas, _poblar_catalogos())
+        _poblar_registros(ids, registros, dias=max(1, registros // max(1, personas)))
+        _crear_admin()
+        engine = db.engine
+
+    # Las peticiones se hacen fuera del contexto anterior para que cada una use
+    # su propia sesión, como en producción (sin identity map compartido).
+    client = app.test_client()
+    client.post('/login', data={'username': 'admin', 'password': 'admin'})
+    click.echo(f'Sentencias SQL por petición (personas={personas}, registros={registros}):')
+    for metodo, ruta, datos, maximo in PRESUPUESTO_SENTENCIAS:
+        # Primera petición para calentar las cachés de settings y catálogos
+        client.open(ruta, method=metodo, data=datos, buffered=True)
+        respuesta, total = medir_sentencias_por_peticion(client, engine, metodo, ruta, datos)
+        estado = 'ok   ' if total <= maximo and respuesta.status_code == 200 else 'FALLO'
+        if estado == 'FALLO':
+            excedidas += 1
+        etiqueta = f'{metodo} {ruta}' + (f' {datos}' if datos else '')
+        click.echo(f'  {estado} {etiqueta}: {total} (máx. {maximo}, HTTP {respuesta.status_code})')
+
+    if excedidas:
+        raise click.ClickException(f'{excedidas} vista(s) superan su presupuesto de sentencias.')
+    click.echo('Todas las vistas respetan su presupuesto de sentencias.')
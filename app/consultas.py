@@ -0,0 +1,258 @@
+# app/consultas.py
+"""
+Consultas "calientes" sobre registros, compartidas entre las rutas y la
+verificación de planes de ejecución (flask verificar-planes).
+
+Todos los filtros de fecha se expresan como rangos sobre la columna
+fecha_hora_registro (sin funciones sobre la columna) para que puedan usar
+los índices de la tabla registros.
+
+Las consultas que se muestran en plantillas cargan la persona en el mismo
+SELECT (JOIN + contains_eager); departamento, tipo de persona y tipo de
+control salen de la caché de catálogos, así que no hay cargas perezosas por fila.
+"""
+import base64
+import json
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import exists, extract, func, select, tuple_
+from sqlalchemy.orm import contains_eager, load_only
+
+from app.models import Persona, Registro, RegistroDailyRollup
+from app.utils import local_day_bounds_utc
+
+
+def _timezone():
+    return current_app.config.get('TIMEZONE', 'America/Bogota')
+
+
+def registros_del_dia(fecha_local=None, limite=10):
+    """Últimos registros del día local indicado (por defecto, hoy)."""
+    inicio, fin = local_day_bounds_utc(fecha_local, _timezone())
+    return _registros_con_persona().filter(
+        Registro.fecha_hora_registro >= inicio,
+        Registro.fecha_hora_registro < fin
+    ).order_by(Registro.fecha_hora_registro.desc()).limit(limite)
+
+
+def _registros_con_persona():
+    """Registro.query con la persona cargada en el mismo SELECT."""
+    return Registro.query.join(Registro.persona_ref).options(contains_eager(Registro.persona_ref))
+
+
+def rango_utc(fecha_inicio=None, fecha_fin=None):
+    """
+    Convierte un rango de días locales (ambos inclusive, `date` o None) en el
+    rango [inicio, fin) en UTC que se usa para filtrar fecha_hora_registro.
+    """
+    inicio = fin = None
+    if fecha_inicio:
+        inicio, _ = local_day_bounds_utc(fecha_inicio, _timezone())
+    if fecha_fin:
+        _, fin = local_day_bounds_utc(fecha_fin, _timezone())
+    return inicio, fin
+
+
+def parse_fecha(valor):
+    """Convierte 'YYYY-MM-DD' (formulario) en `date`; vacío o inválido -> None."""
+    try:
+        return datetime.strptime(valor, '%Y-%m-%d').date() if valor else None
+    except ValueError:
+        return None
+
+
+def consulta_reporte(tipo_reporte, fecha_inicio=None, fecha_fin=None, filtro_id=None):
+    """
+    Consulta base del generador de reportes, ordenada por fecha descendente.
+    Selecciona sólo las columnas que se muestran o exportan (no entidades), para
+    poder recorrerla en streaming sin llenar el identity map de la sesión.
+    Departamento y tipo de persona son los guardados en cada registro, como en
+    el rollup, así el detalle cuadra con los resúmenes del mismo rango.
+    """
+    if tipo_reporte == 'dia' and fecha_inicio:
+        fecha_fin = fecha_inicio
+    inicio, fin = rango_utc(fecha_inicio, fecha_fin)
+
+    stmt = select(
+        Registro.fecha_hora_registro,
+        Persona.id_persona,
+        Persona.nombre_persona,
+        Registro.dpto_id,
+        Registro.tipo_persona_id,
+        Registro.tipo_control_id
+    ).join(Registro.persona_ref)
+    if inicio:
+        stmt = stmt.where(Registro.fecha_hora_registro >= inicio)
+    if fin:
+        stmt = stmt.where(Registro.fecha_hora_registro < fin)
+
+    # Filtros específicos
+    if tipo_reporte == 'persona' and filtro_id:
+        stmt = stmt.where(Registro.persona_id == filtro_id)
+    elif tipo_reporte == 'tipo_control' and filtro_id:
+        stmt = stmt.where(Registro.tipo_control_id == filtro_id)
+    elif tipo_reporte == 'dpto' and filtro_id:
+        stmt = stmt.where(Registro.dpto_id == filtro_id)
+    elif tipo_reporte == 'tipo_persona' and filtro_id:
+        stmt = stmt.where(Registro.tipo_persona_id == filtro_id)
+
+    return stmt.order_by(Registro.fecha_hora_registro.desc())
+
+
+# --- Resúmenes agregados (GROUP BY en la BD) ---
+# Los totales por día y por departamento leen la tabla registro_daily_rollup
+# (una fila por día y categoría), filtrada por su clave primaria fecha_local:
+# un año cuesta O(días x categorías), no O(registros). El resumen por persona
+# no cabe en el rollup y agrupa registros, filtrando el rango sobre el índice
+# de fecha_hora_registro; en ambos casos sólo viajan los conteos.
+
+def _en_rango(stmt, fecha_inicio, fecha_fin):
+    inicio, fin = rango_utc(fecha_inicio, fecha_fin)
+    if inicio:
+        stmt = stmt.where(Registro.fecha_hora_registro >= inicio)
+    if fin:
+        stmt = stmt.where(Registro.fecha_hora_registro < fin)
+    return stmt
+
+
+def _rollup_en_rango(stmt, fecha_inicio, fecha_fin):
+    if fecha_inicio:
+        stmt = stmt.where(RegistroDailyRollup.fecha_local >= fecha_inicio)
+    if fecha_fin:
+        stmt = stmt.where(RegistroDailyRollup.fecha_local <= fecha_fin)
+    return stmt
+
+
+def resumen_por_dia(fecha_inicio, fecha_fin):
+    """Registros por día local y tipo de control."""
+    total = func.sum(RegistroDailyRollup.total).label('total')
+    stmt = select(RegistroDailyRollup.fecha_local, RegistroDailyRollup.tipo_control_id, total)
+    return _rollup_en_rango(stmt, fecha_inicio, fecha_fin).group_by(
+        RegistroDailyRollup.fecha_local, RegistroDailyRollup.tipo_control_id
+    ).order_by(RegistroDailyRollup.fecha_local)
+
+
+def resumen_dpto_control(fecha_inicio, fecha_fin):
+    """Registros por departamento y tipo de control."""
+    total = func.sum(RegistroDailyRollup.total).label('total')
+    stmt = select(RegistroDailyRollup.dpto_id, RegistroDailyRollup.tipo_control_id, total)
+    return _rollup_en_rango(stmt, fecha_inicio, fecha_fin).group_by(
+        RegistroDailyRollup.dpto_id, RegistroDailyRollup.tipo_control_id
+    )
+
+
+def resumen_mensual_persona(fecha_inicio, fecha_fin):
+    """Registros por persona y mes (año, mes) de la fecha local."""
+    anio = extract('year', Registro.fecha_local).label('anio')
+    mes = extract('month', Registro.fecha_local).label('mes')
+    stmt = select(
+        Persona.id_persona, Persona.nombre_persona, anio, mes, func.count().label('total')
+    ).join(Registro.persona_ref)
+    return _en_rango(stmt, fecha_inicio, fecha_fin).group_by(
+        Persona.id_persona, Persona.nombre_persona, anio, mes
+    ).order_by(Persona.nombre_persona, Persona.id_persona, anio, mes)
+
+
+def datos_ticket(id_registro):
+    """
+    Todo lo que imprime el ticket en una sola consulta (registro + persona); los
+    nombres de departamento y tipo de control salen de la caché de catálogos.
+    """
+    return select(
+        Registro.id_registro,
+        Registro.fecha_hora_registro,
+        Registro.tipo_control_id,
+        Persona.id_persona,
+        Persona.nombre_persona,
+        Registro.dpto_id
+    ).join(Registro.persona_ref).where(Registro.id_registro == id_registro)
+
+
+def persona_tiene_registros(id_persona):
+    """SELECT EXISTS(...) que usa el índice por persona en lugar de cargar los registros."""
+    return select(exists().where(Registro.persona_id == id_persona))
+
+
+# --- Listado paginado de personas (keyset / seek) ---
+
+PERSONAS_POR_PAGINA = 50
+PERSONAS_POR_PAGINA_MAX = 200
+
+
+def codificar_cursor(persona):
+    """Cursor opaco con la clave de ordenación (nombre, id) de la última fila."""
+    crudo = json.dumps([persona.nombre_persona, persona.id_persona]).encode('utf-8')
+    return base64.urlsafe_b64encode(crudo).decode('ascii')
+
+
+def decodificar_cursor(cursor):
+    try:
+        nombre, id_persona = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return str(nombre), str(id_persona)
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+
+def consulta_personas(q=None, dpto_id=None, tipo_persona_id=None, control_id=None, despues_de=None):
+    """
+    Personas filtradas y ordenadas por (nombre, id). `despues_de` es la clave
+    (nombre, id) de la última fila de la página anterior: la siguiente página
+    empieza justo después usando el índice, sin OFFSET, así que el coste no
+    crece con el número de página ni con el tamaño del roster.
+    """
+    query = Persona.query.options(load_only(
+        Persona.id_persona, Persona.nombre_persona, Persona.foto,
+        Persona.dpto_id, Persona.tipo_persona_id, Persona.control_id
+    ))
+    if q:
+        query = query.filter(Persona.nombre_persona.ilike(f'%{q}%'))
+    if dpto_id:
+        query = query.filter(Persona.dpto_id == dpto_id)
+    if tipo_persona_id:
+        query = query.filter(Persona.tipo_persona_id == tipo_persona_id)
+    if control_id:
+        query = query.filter(Persona.control_id == control_id)
+    if despues_de:
+        query = query.filter(tuple_(Persona.nombre_persona, Persona.id_persona) > tuple_(*despues_de))
+    return query.order_by(Persona.nombre_persona, Persona.id_persona)
+
+
+def pagina_personas(limite=PERSONAS_POR_PAGINA, cursor=None, **filtros):
+    """Devuelve (personas, cursor_siguiente); cursor_siguiente es None en la última página."""
+    limite = max(1, min(int(limite), PERSONAS_POR_PAGINA_MAX))
+    despues_de = decodificar_cursor(cursor) if cursor else None
+    # Se pide una fila extra para saber si hay más páginas sin hacer un COUNT
+    filas = consulta_personas(despues_de=despues_de, **filtros).limit(limite + 1).all()
+    siguiente = codificar_cursor(filas[limite - 1]) if len(filas) > limite else None
+    return filas[:limite], siguiente
+
+
+def roster_personas():
+    """Columnas mínimas de todas las personas para la copia local del kiosco."""
+    return select(Persona.id_persona, Persona.nombre_persona, Persona.dpto_id, Persona.control_id)
+
+
+def consultas_vigiladas():
+    """
+    Consultas representativas de cada camino caliente, con parámetros de ejemplo.
+    Devuelve pares (nombre, sentencia) para la verificación de planes.
+    """
+    hoy = datetime.utcnow().date()
+    hace_un_mes = hoy - timedelta(days=30)
+    return [
+        ('registro_almuerzo: últimos del día', registros_del_dia(hoy).statement),
+        ('reportes: general por rango', consulta_reporte('general', hace_un_mes, hoy)),
+        ('reportes: por día', consulta_reporte('dia', hoy)),
+        ('reportes: por persona', consulta_reporte('persona', hace_un_mes, hoy, '0000001')),
+        ('reportes: por tipo de control', consulta_reporte('tipo_control', hace_un_mes, hoy, 1)),
+        ('reportes: por departamento', consulta_reporte('dpto', hace_un_mes, hoy, 1)),
+        ('reportes: por tipo de persona', consulta_reporte('tipo_persona', hace_un_mes, hoy, 1)),
+        ('resumen: totales por día', resumen_por_dia(hace_un_mes, hoy)),
+        ('resumen: departamento x control', resumen_dpto_control(hace_un_mes, hoy)),
+        ('resumen: mensual por persona', resumen_mensual_persona(hace_un_mes, hoy)),
+        ('delete_persona: tiene registros', persona_tiene_registros('0000001')),
+        ('list_personas: primera página', consulta_personas().limit(PERSONAS_POR_PAGINA + 1).statement),
+        ('list_personas: página siguiente',
+         consulta_personas(despues_de=('Persona de Prueba', '0000001')).limit(PERSONAS_POR_PAGINA + 1).statement),
+    ]
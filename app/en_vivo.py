@@ -0,0 +1,238 @@
+# app/en_vivo.py
+"""
+Transmisión en vivo de los check-ins (Server-Sent Events) para los monitores
+de cocina y los kioscos abiertos en /registro.
+
+Cada worker tiene un único hilo "sondeador" que, mientras haya algún cliente
+conectado, consulta cada FEED_INTERVALO segundos los registros con
+id_registro mayor que el último visto: un rango sobre la clave primaria que
+casi siempre devuelve cero filas. Así se ven también los check-ins hechos en
+otros workers, y el coste es una consulta por intervalo y por worker, sin
+importar cuántos monitores haya. Los eventos recientes se guardan en un
+búfer circular; cada conexión espera en una Condition y envía los que aún no
+ha visto (o los posteriores a su Last-Event-ID si se reconecta).
+
+Un check-in hecho en este mismo worker despierta al sondeador con avisar(),
+así su evento sale sin esperar al siguiente intervalo.
+
+Los id_registro no se confirman necesariamente en orden: un lote largo de
+registrar_lote() reserva sus ids y puede hacer commit después de un escaneo
+suelto con id mayor. Por eso cada sondeo vuelve a leer (sólo los ids, por la
+clave primaria) los VENTANA_IDS anteriores al último visto y descarta los ya
+enviados. Los eventos del búfer se numeran con una secuencia propia del
+worker, así los que llegan tarde con id menor también salen; los navegadores
+descartan los repetidos por id_registro. Un registro que se confirme más de
+VENTANA_IDS ids por detrás del último visto no se transmite (sigue visible
+al recargar la página).
+"""
+import json
+import threading
+import time
+from collections import deque
+
+from flask import current_app
+from sqlalchemy import func, select
+
+# Eventos recientes que se conservan para los clientes que se reconectan
+TAMANO_BUFER = 200
+
+# Cada cuánto se envía un comentario para que proxies y navegadores no cierren la conexión
+SEGUNDOS_LATIDO = 15
+
+# Ids por debajo del último visto que se vuelven a consultar en cada sondeo; cubre
+# los que reserva un lote de MAX_LOTE_CHECKIN (500) escaneos con la transacción abierta
+VENTANA_IDS = 1000
+
+# Lo que espera una conexión nueva a que el sondeador lea la BD por primera vez
+SEGUNDOS_ESPERA_INICIO = 5
+
+
+class TransmisionNoDisponible(RuntimeError):
+    """El sondeador aún no pudo leer la BD; la vista responde 503 y el cliente reintenta."""
+
+
+class _EstadoEnVivo:
+
+    def __init__(self, intervalo):
+        self.intervalo = intervalo
+        self.condicion = threading.Condition()
+        self.eventos = deque(maxlen=TAMANO_BUFER)   # (secuencia, id_registro, datos)
+        self.secuencia = 0
+        self.ultimo_id = None
+        self.vistos = set()   # ids enviados dentro de la ventana (sólo los toca el sondeador)
+        self.suscriptores = 0
+        self.despertar = threading.Event()
+        self.hilo = None
+        self.consultas = 0
+
+
+class RegistrosEnVivo:
+    """Difusión de registros nuevos a todas las conexiones SSE de un worker."""
+
+    def init_app(self, app):
+        app.extensions['registros_en_vivo'] = _EstadoEnVivo(app.config.get('FEED_INTERVALO', 1.0))
+
+    @staticmethod
+    def _estado():
+        return current_app.extensions['registros_en_vivo']
+
+    # --- Sondeo (un hilo por worker) ---
+
+    def _iniciar(self, estado):
+        # Se arranca con el primer cliente: gunicorn hace fork después de create_app()
+        with estado.condicion:
+            if estado.hilo is None:
+                app = current_app._get_current_object()
+                estado.hilo = threading.Thread(target=self._sondear, args=(app, estado),
+                                               name='registros-en-vivo', daemon=True)
+                estado.hilo.start()
+            # Sin tope, una BD caída dejaría cada conexión ocupando un hilo del worker
+            estado.condicion.wait_for(lambda: estado.ultimo_id is not None, SEGUNDOS_ESPERA_INICIO)
+            if estado.ultimo_id is None:
+                raise TransmisionNoDisponible('No se pudo leer la base de datos.')
+
+    def _sondear(self, app, estado):
+        from app import db
+        from app.models import Registro
+        with app.app_context():
+            while True:
+                try:
+                    ultimo = db.session.execute(select(func.max(Registro.id_registro))).scalar() or 0
+                    vistos = set(self._ids_desde(ultimo - VENTANA_IDS))
+                    break
+                except Exception:
+                    app.logger.exception('No se pudo leer el último registro')
+                    time.sleep(estado.intervalo)
+                finally:
+                    db.session.remove()
+            with estado.condicion:
+                estado.vistos = vistos
+                estado.ultimo_id = ultimo
+                estado.condicion.notify_all()
+
+            while True:
+                estado.despertar.wait(estado.intervalo)
+                estado.despertar.clear()
+                if not estado.suscriptores:
+                    continue
+                try:
+                    ids = [i for i in self._ids_desde(estado.ultimo_id - VENTANA_IDS) if i not in estado.vistos]
+                    ids = ids[:TAMANO_BUFER]
+                    nuevos = self._consultar_registros(ids) if ids else []
+                    estado.consultas += 1
+                except Exception:
+                    app.logger.exception('No se pudieron leer los registros nuevos')
+                    time.sleep(estado.intervalo)
+                    continue
+                finally:
+                    db.session.remove()
+                if ids:
+                    with estado.condicion:
+                        for id_registro, datos in nuevos:
+                            estado.secuencia += 1
+                            estado.eventos.append((estado.secuencia, id_registro, datos))
+                        estado.ultimo_id = max(estado.ultimo_id, ids[-1])
+                        piso = estado.ultimo_id - VENTANA_IDS
+                        # Los ids pedidos cuentan como vistos aunque se hayan borrado entre consultas
+                        estado.vistos = {i for i in estado.vistos.union(ids) if i > piso}
+                        estado.condicion.notify_all()
+
+    @staticmethod
+    def _ids_desde(piso):
+        """Ids de registro mayores que `piso`, en orden: un rango sobre la clave primaria sin leer las filas."""
+        from app import db
+        from app.models import Registro
+        stmt = (
+            select(Registro.id_registro)
+            .where(Registro.id_registro > piso)
+            .order_by(Registro.id_registro)
+            .limit(VENTANA_IDS + TAMANO_BUFER)
+        )
+        return db.session.execute(stmt).scalars().all()
+
+    @staticmethod
+    def _consultar_registros(ids):
+        """Los registros `ids`, ya formateados para el evento, en orden de id."""
+        from app import db, catalogos
+        from app.models import Persona, Registro
+        from app.utils import convert_utc_to_local
+
+        timezone_str = current_app.config.get('TIMEZONE', 'America/Bogota')
+        stmt = (
+            select(Registro.id_registro, Registro.fecha_hora_registro, Registro.tipo_control_id,
+                   Persona.id_persona, Persona.nombre_persona, Registro.dpto_id)
+            .join(Registro.persona_ref)
+            .where(Registro.id_registro.in_(ids))
+            .order_by(Registro.id_registro)
+        )
+        return [
+            (fila.id_registro, {
+                'id_registro': fila.id_registro,
+                'id_persona': fila.id_persona,
+                'nombre_persona': fila.nombre_persona,
+                'dpto': catalogos.dpto(fila.dpto_id).nombre_dpto,
+                'tipo_control': catalogos.tipo_control(fila.tipo_control_id).nombre_control,
+                'hora': convert_utc_to_local(fila.fecha_hora_registro, timezone_str).strftime('%I:%M:%S %p'),
+            })
+            for fila in db.session.execute(stmt)
+        ]
+
+    # --- Clientes ---
+
+    def avisar(self):
+        """Adelanta el siguiente sondeo (tras un check-in en este worker)."""
+        estado = current_app.extensions.get('registros_en_vivo')
+        if estado is not None and estado.hilo is not None:
+            estado.despertar.set()
+
+    def transmitir(self, ultimo_evento=None, duracion_maxima=None):
+        """
+        Generador con el flujo text/event-stream de una conexión. Si se indica
+        `ultimo_evento` (la cabecera Last-Event-ID al reconectarse) reenvía lo
+        que haya en el búfer desde VENTANA_IDS antes de ese id; si no, empieza
+        con los registros que lleguen. Termina a los `duracion_maxima` segundos;
+        el navegador se reconecta solo y el hilo queda libre para otras
+        peticiones. Lanza TransmisionNoDisponible si la BD no responde.
+        """
+        estado = self._estado()
+        self._iniciar(estado)
+        duracion_maxima = duracion_maxima or current_app.config.get('FEED_DURACION_MAX', 300)
+        return self._eventos(estado, ultimo_evento, time.monotonic() + duracion_maxima)
+
+    @staticmethod
+    def _eventos(estado, ultimo_evento, fin):
+        with estado.condicion:
+            estado.suscriptores += 1
+            visto = estado.secuencia
+            if ultimo_evento is not None:
+                # Al reconectarse también pudieron llegar registros tardíos con id menor;
+                # los que el cliente ya tiene los descarta él. Los eventos que ya salieron
+                # del búfer no se pueden recuperar.
+                piso = ultimo_evento - VENTANA_IDS
+                visto = next((s - 1 for s, i, _ in estado.eventos if i > piso), visto)
+        estado.despertar.set()
+        try:
+            yield 'retry: 3000\n\n'
+            while time.monotonic() < fin:
+                with estado.condicion:
+                    if estado.secuencia == visto:
+                        estado.condicion.wait(min(SEGUNDOS_LATIDO, max(fin - time.monotonic(), 0)))
+                    pendientes = [(i, d) for s, i, d in estado.eventos if s > visto]
+                    visto = estado.secuencia
+                    # El id del evento es el mayor registro visto: desde ahí se retoma al reconectar
+                    marca = estado.ultimo_id
+                if not pendientes:
+                    yield ': latido\n\n'
+                for id_registro, datos in pendientes:
+                    yield f'id: {marca}\nevent: registro\ndata: {json.dumps(datos)}\n\n'
+        finally:
+            with estado.condicion:
+                estado.suscriptores -= 1
+
+    def estadisticas(self):
+        estado = self._estado()
+        return {
+            'suscriptores': estado.suscriptores,
+            'ultimo_id': estado.ultimo_id,
+            'consultas': estado.consultas,
+        }
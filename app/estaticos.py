@@ -0,0 +1,143 @@
+# app/estaticos.py
+"""
+Archivos estáticos con huella de contenido, caché de larga duración y
+variantes precomprimidas.
+
+Cada url_for('static', filename=...) recibe un parámetro `v` con un hash del
+contenido del archivo (style.css, main.js, logos, fotos). Cuando una
+petición trae el `v` correcto, la respuesta se marca `immutable` por un
+año: el navegador no vuelve a preguntar, y si el archivo cambia, cambia su
+URL. Sin `v` (o con uno viejo) se responde como siempre, revalidando.
+
+Los archivos de texto (CSS, JS, SVG) se sirven comprimidos en brotli (si el
+paquete está instalado) o gzip según Accept-Encoding. La versión
+comprimida se genera una sola vez por huella en instance/estaticos y se
+reutiliza en las siguientes peticiones y en los demás workers.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import secrets
+
+from flask import current_app, request, send_file
+from werkzeug.exceptions import NotFound
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # Opcional: sin el paquete sólo se usa gzip
+    brotli = None
+
+UN_ANIO = 365 * 24 * 3600
+
+# Tipos que vale la pena comprimir (las imágenes ya vienen comprimidas)
+TIPOS_COMPRIMIBLES = {'text/css', 'text/javascript', 'application/javascript', 'image/svg+xml',
+                      'text/plain', 'application/json'}
+
+# Por debajo de este tamaño la compresión no compensa
+TAMANO_MINIMO_COMPRESION = 1024
+
+
+class _EstadoEstaticos:
+
+    def __init__(self, carpeta_static, carpeta_comprimidos):
+        self.carpeta_static = carpeta_static
+        self.carpeta_comprimidos = carpeta_comprimidos
+        os.makedirs(carpeta_comprimidos, exist_ok=True)
+        self.huellas = {}   # ruta -> (mtime_ns, tamaño, huella)
+
+
+class Estaticos:
+    """Huellas de contenido para las URLs de static/ y la vista que las sirve."""
+
+    def init_app(self, app):
+        carpeta = app.config.get('ESTATICOS_COMPRIMIDOS_DIR') or os.path.join(app.instance_path, 'estaticos')
+        app.extensions['estaticos'] = _EstadoEstaticos(app.static_folder, carpeta)
+        app.url_defaults(self._agregar_huella)
+        app.view_functions['static'] = self.servir
+
+    @staticmethod
+    def _estado():
+        return current_app.extensions['estaticos']
+
+    def huella(self, ruta):
+        """Hash del contenido del archivo; se recalcula sólo si cambian su mtime o su tamaño."""
+        st = os.stat(ruta)
+        huellas = self._estado().huellas
+        guardada = huellas.get(ruta)
+        if guardada and guardada[:2] == (st.st_mtime_ns, st.st_size):
+            return guardada[2]
+        with open(ruta, 'rb') as f:
+            huella = hashlib.file_digest(f, lambda: hashlib.blake2b(digest_size=8)).hexdigest()
+        huellas[ruta] = (st.st_mtime_ns, st.st_size, huella)
+        return huella
+
+    def _ruta(self, filename):
+        ruta = safe_join(self._estado().carpeta_static, filename)
+        if ruta is None or not os.path.isfile(ruta):
+            return None
+        return ruta
+
+    def _agregar_huella(self, endpoint, values):
+        if endpoint != 'static' or 'v' in values or 'filename' not in values:
+            return
+        ruta = self._ruta(values['filename'])
+        if ruta:
+            values['v'] = self.huella(ruta)
+
+    # --- Vista de static/ ---
+
+    def _codificacion(self, ruta, mimetype):
+        if mimetype not in TIPOS_COMPRIMIBLES or os.path.getsize(ruta) < TAMANO_MINIMO_COMPRESION:
+            return None
+        aceptadas = request.accept_encodings
+        if brotli is not None and aceptadas['br']:
+            return 'br'
+        if aceptadas['gzip']:
+            return 'gzip'
+        return None
+
+    def _comprimido(self, ruta, huella, codificacion):
+        """Ruta de la versión comprimida del archivo; la crea la primera vez."""
+        extension = 'br' if codificacion == 'br' else 'gz'
+        destino = os.path.join(self._estado().carpeta_comprimidos, f'{huella}.{extension}')
+        if not os.path.exists(destino):
+            with open(ruta, 'rb') as f:
+                datos = f.read()
+            if codificacion == 'br':
+                datos = brotli.compress(datos, quality=11)
+            else:
+                datos = gzip.compress(datos, compresslevel=9, mtime=0)
+            tmp_path = f'{destino}.{secrets.token_hex(4)}'
+            with open(tmp_path, 'wb') as f:
+                f.write(datos)
+            os.replace(tmp_path, destino)
+        return destino
+
+    def servir(self, filename):
+        ruta = self._ruta(filename)
+        if ruta is None:
+            raise NotFound()
+        huella = self.huella(ruta)
+        mimetype = mimetypes.guess_type(ruta)[0] or 'application/octet-stream'
+        codificacion = self._codificacion(ruta, mimetype)
+
+        if codificacion:
+            respuesta = send_file(self._comprimido(ruta, huella, codificacion), mimetype=mimetype,
+                                  etag=f'{huella}-{codificacion}', conditional=True)
+            respuesta.headers['Content-Encoding'] = codificacion
+        else:
+            respuesta = send_file(ruta, mimetype=mimetype, etag=huella, conditional=True)
+        if mimetype in TIPOS_COMPRIMIBLES:
+            respuesta.vary.add('Accept-Encoding')
+
+        if request.args.get('v') == huella:
+            # La URL lleva la huella del contenido: no cambia nunca
+            respuesta.cache_control.no_cache = None
+            respuesta.cache_control.public = True
+            respuesta.cache_control.max_age = UN_ANIO
+            respuesta.cache_control.immutable = True
+        else:
+            respuesta.cache_control.no_cache = True
+        return respuesta
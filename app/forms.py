@@ -3,20 +3,22 @@ from flask_wtf.file import FileField, FileAllowed
 from wtforms import StringField, PasswordField, SubmitField, SelectField, HiddenField
 from wtforms.validators import DataRequired, Length, EqualTo, ValidationError
 from wtforms_sqlalchemy.fields import QuerySelectField 
-from app.models import Usuario, Dpto, TipoControl, TipoPersona, Rol, Persona
+from app import catalogos
+from app.models import Usuario, Dpto, TipoControl, TipoPersona, Persona
 
 # --- Funciones para llenar los combos (SelectField) ---
+# Se sirven desde la caché de catálogos (ver catalogos_cache.py), sin consultar la BD.
 def get_dptos():
-    return Dpto.query.all()
+    return catalogos.listar('dptos')
 
 def get_tipos_persona():
-    return TipoPersona.query.all()
+    return catalogos.listar('tipos_persona')
 
 def get_tipos_control():
-    return TipoControl.query.all()
+    return catalogos.listar('tipos_control')
 
 def get_roles():
-    return Rol.query.all()
+    return catalogos.listar('roles')
 
 
 # --- Formularios de la App ---
@@ -74,9 +76,9 @@ class PersonaForm(FlaskForm):
     id_persona = StringField('Código / ID', validators=[DataRequired(), Length(min=1, max=20)])
     nombre_persona = StringField('Nombre Completo', validators=[DataRequired(), Length(min=3, max=150)])
     sexo = SelectField('Sexo', choices=[('M', 'Masculino'), ('F', 'Femenino')], validators=[DataRequired()])
-    dpto = QuerySelectField('Departamento', query_factory=get_dptos, get_label='nombre_dpto', allow_blank=False, validators=[DataRequired()])
-    tipo_persona = QuerySelectField('Tipo de Persona', query_factory=get_tipos_persona, get_label='nombre_tipopersona', allow_blank=False, validators=[DataRequired()])
-    control = QuerySelectField('Tipo de Control Asignado', query_factory=get_tipos_control, get_label='nombre_control', allow_blank=False, validators=[DataRequired()])
+    dpto = QuerySelectField('Departamento', query_factory=get_dptos, get_pk=lambda d: d.id_dpto, get_label='nombre_dpto', allow_blank=False, validators=[DataRequired()])
+    tipo_persona = QuerySelectField('Tipo de Persona', query_factory=get_tipos_persona, get_pk=lambda tp: tp.id_tipopersona, get_label='nombre_tipopersona', allow_blank=False, validators=[DataRequired()])
+    control = QuerySelectField('Tipo de Control Asignado', query_factory=get_tipos_control, get_pk=lambda tc: tc.id_control, get_label='nombre_control', allow_blank=False, validators=[DataRequired()])
     foto = FileField('Foto (Opcional)', validators=[FileAllowed(['jpg', 'png', 'jpeg'])])
     foto_webcam = HiddenField('Foto de Webcam')
     submit = SubmitField('Guardar Persona')
@@ -94,7 +96,7 @@ class UsuarioForm(FlaskForm):
     username = StringField('Nombre de Usuario', validators=[DataRequired(), Length(min=4, max=20)])
     password = PasswordField('Contraseña', validators=[Length(min=6)])
     confirm_password = PasswordField('Confirmar Contraseña', validators=[EqualTo('password')])
-    rol = QuerySelectField('Rol', query_factory=get_roles, get_label='nombre', allow_blank=False, validators=[DataRequired()])
+    rol = QuerySelectField('Rol', query_factory=get_roles, get_pk=lambda r: r.id, get_label='nombre', allow_blank=False, validators=[DataRequired()])
     submit = SubmitField('Guardar Usuario')
 
     # === REEMPLAZA ESTA FUNCIÓN COMPLETA ===
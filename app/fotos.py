@@ -0,0 +1,323 @@
+# app/fotos.py
+"""
+Procesamiento de las fotos de personas.
+
+Cada foto subida (archivo o cámara web) se convierte en variantes de tamaño
+fijo (TAMANOS, en px del lado mayor) en WebP y JPEG, así cada vista descarga
+sólo lo que muestra: el listado de personas usa la de 48 px (128 en
+pantallas de alta densidad) en lugar de la foto completa.
+
+Los archivos se llaman `<huella>-<tamaño>.<ext>`, donde la huella es un hash
+de los píxeles de la imagen procesada: el nombre cambia si cambia el
+contenido y dos subidas de la misma foto producen los mismos archivos.
+Persona.foto guarda el nombre de la variante mayor en JPEG
+(`<huella>-250.jpg`), que existe como archivo; las demás se derivan de él.
+
+Las fotos antiguas (un solo archivo con nombre aleatorio) se siguen
+sirviendo tal cual hasta que `flask fotos-variantes` las convierte en un
+pool de procesos.
+
+Como el nombre depende sólo del contenido, la carpeta funciona como un
+almacén direccionado por contenido: una foto repetida no se vuelve a
+escribir y las referencias son los valores de Persona.foto. Los archivos
+que ya nadie referencia (fotos reemplazadas, personas eliminadas, fotos
+antiguas ya convertidas) los borra `flask fotos-limpiar`.
+
+Las fotos subidas se decodifican y redimensionan en un pool de pocos hilos
+por worker (ProcesadorFotos), no en el hilo de la petición: así, aunque
+lleguen varias fotos grandes a la vez, sólo FOTOS_HILOS se procesan en
+paralelo. El tamaño en bytes se comprueba antes de leer la imagen y las
+dimensiones con sólo la cabecera, antes de decodificarla; los JPEG se
+decodifican directamente a escala reducida (modo draft de PIL).
+"""
+import hashlib
+import os
+import re
+import secrets
+import base64
+import binascii
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as TiempoAgotado
+from io import BytesIO
+
+from flask import current_app, url_for
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+TAMANOS = (48, 128, 250)
+TAMANO_MAXIMO = TAMANOS[-1]
+
+# extensión -> (formato de PIL, opciones de codificación)
+FORMATOS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+
+FOTO_POR_DEFECTO = 'default.jpg'
+
+# Límites de las fotos subidas: se comprueban antes de decodificar la imagen completa
+MAX_BYTES_FOTO = 15 * 1024 * 1024
+MAX_PIXELES_FOTO = 50_000_000
+MAX_LADO_FOTO = 12000
+
+# Un archivo sin referencias se borra sólo si no se ha escrito en este tiempo:
+# protege las fotos recién subidas cuyo formulario aún no ha hecho commit
+ANTIGUEDAD_MINIMA_HUERFANA = 3600
+
+ResultadoLimpieza = namedtuple('ResultadoLimpieza', ['borrados', 'bytes_liberados', 'conservados', 'recientes'])
+
+_NOMBRE_VARIANTE = re.compile(r'^([0-9a-f]{16})-(\d+)\.(webp|jpg)$')
+
+
+class FotoInvalida(ValueError):
+    """La foto subida no es una imagen legible o supera los límites; el mensaje es para el usuario."""
+
+
+def carpeta_fotos():
+    """Carpeta de las fotos: static/uploads, de donde las sirve url_for('static', ...)."""
+    return os.path.join(current_app.static_folder, 'uploads')
+
+
+def nombre_variante(huella, tamano, extension):
+    return f'{huella}-{tamano}.{extension}'
+
+
+def _a_rgb(img):
+    """Convierte a RGB; las transparencias quedan sobre fondo blanco (JPEG no tiene canal alfa)."""
+    if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+        img = img.convert('RGBA')
+        fondo = Image.new('RGB', img.size, (255, 255, 255))
+        fondo.paste(img, mask=img.getchannel('A'))
+        return fondo
+    return img.convert('RGB')
+
+
+def _decodificar(origen, max_pixeles):
+    """Abre la imagen, comprueba sus dimensiones con sólo la cabecera y la decodifica reducida."""
+    try:
+        original = Image.open(origen)
+    except Image.DecompressionBombError as e:  # PIL rechaza por su cuenta las dimensiones absurdas
+        raise FotoInvalida('La imagen es demasiado grande.') from e
+    except UnidentifiedImageError as e:
+        raise FotoInvalida('El archivo no es una imagen válida.') from e
+    with original:
+        ancho, alto = original.size
+        if ancho * alto > max_pixeles or max(ancho, alto) > MAX_LADO_FOTO:
+            raise FotoInvalida(f'La imagen es demasiado grande ({ancho}x{alto} px).')
+        # Los JPEG se decodifican a 1/2, 1/4 o 1/8 sin bajar de TAMANO_MAXIMO
+        original.draft('RGB', (TAMANO_MAXIMO, TAMANO_MAXIMO))
+        try:
+            # Las fotos de móviles suelen venir giradas con la orientación en EXIF
+            return _a_rgb(ImageOps.exif_transpose(original))
+        except (OSError, SyntaxError) as e:  # Archivo truncado o corrupto
+            raise FotoInvalida('No se pudo leer la imagen.') from e
+
+
+def procesar_imagen(origen, max_pixeles=MAX_PIXELES_FOTO):
+    """
+    Abre la imagen (ruta, archivo o stream) y genera todas sus variantes.
+    Devuelve (foto, {nombre_archivo: bytes}); `foto` es el valor para Persona.foto.
+    Lanza FotoInvalida si no es una imagen o supera `max_pixeles`.
+    """
+    img = _decodificar(origen, max_pixeles)
+    img.thumbnail((TAMANO_MAXIMO, TAMANO_MAXIMO), Image.LANCZOS)
+    huella = hashlib.blake2b(b'%dx%d' % img.size + img.tobytes(), digest_size=8).hexdigest()
+
+    archivos = {}
+    for tamano in sorted(TAMANOS, reverse=True):
+        img.thumbnail((tamano, tamano), Image.LANCZOS)
+        for extension, (formato, opciones) in FORMATOS.items():
+            buffer = BytesIO()
+            img.save(buffer, formato, **opciones)
+            archivos[nombre_variante(huella, tamano, extension)] = buffer.getvalue()
+    return nombre_variante(huella, TAMANO_MAXIMO, 'jpg'), archivos
+
+
+def escribir_variantes(archivos, carpeta):
+    """
+    Escribe las variantes de forma atómica. Las que ya existen tienen el mismo
+    contenido: no se reescriben, sólo se actualiza su fecha para que la
+    limpieza de huérfanas no las borre mientras se guarda la persona.
+    """
+    for nombre, datos in archivos.items():
+        ruta = os.path.join(carpeta, nombre)
+        try:
+            os.utime(ruta)
+            continue
+        except FileNotFoundError:
+            pass
+        tmp_path = f'{ruta}.{secrets.token_hex(4)}'
+        with open(tmp_path, 'wb') as f:
+            f.write(datos)
+        os.replace(tmp_path, ruta)
+
+
+def _procesar_subida(datos, es_base64, max_bytes, max_pixeles, carpeta):
+    """Trabajo del pool: decodifica, genera las variantes y las escribe."""
+    if es_base64:
+        try:
+            datos = base64.b64decode(datos, validate=True)
+        except (binascii.Error, ValueError) as e:
+            raise FotoInvalida('La foto de la cámara no es válida.') from e
+        if len(datos) > max_bytes:
+            raise FotoInvalida(_mensaje_tamano(max_bytes))
+    foto, archivos = procesar_imagen(BytesIO(datos), max_pixeles)
+    escribir_variantes(archivos, carpeta)
+    return foto
+
+
+def _mensaje_tamano(max_bytes):
+    return f'La imagen supera el tamaño máximo de {max_bytes // (1024 * 1024)} MB.'
+
+
+class _EstadoFotos:
+
+    def __init__(self, hilos, max_bytes, max_pixeles, espera):
+        self.hilos = hilos
+        self.max_bytes = max_bytes
+        self.max_pixeles = max_pixeles
+        self.espera = espera
+        self.pool = None
+        self.lock = threading.Lock()
+
+    def executor(self):
+        # Se crea al primer uso: gunicorn hace fork después de create_app()
+        with self.lock:
+            if self.pool is None:
+                self.pool = ThreadPoolExecutor(max_workers=self.hilos, thread_name_prefix='fotos')
+            return self.pool
+
+
+class ProcesadorFotos:
+    """Pool acotado por worker que procesa las fotos subidas fuera del hilo de la petición."""
+
+    def init_app(self, app):
+        app.extensions['procesador_fotos'] = _EstadoFotos(
+            app.config.get('FOTOS_HILOS', 2),
+            app.config.get('FOTOS_MAX_BYTES', MAX_BYTES_FOTO),
+            app.config.get('FOTOS_MAX_PIXELES', MAX_PIXELES_FOTO),
+            app.config.get('FOTOS_ESPERA_MAX', 30),
+        )
+
+    @staticmethod
+    def _estado():
+        return current_app.extensions['procesador_fotos']
+
+    def guardar(self, archivo=None, data_url=None):
+        """
+        Guarda la foto de un archivo subido (FileStorage) o de una data URL de la
+        cámara y devuelve el nombre para Persona.foto. Lanza FotoInvalida si la
+        foto no es válida, supera los límites o el pool no responde a tiempo.
+        """
+        estado = self._estado()
+        if data_url:
+            # Cada 4 caracteres base64 son 3 bytes: se descarta antes de decodificar
+            datos = data_url.split(',', 1)[-1]
+            if len(datos) // 4 * 3 > estado.max_bytes:
+                raise FotoInvalida(_mensaje_tamano(estado.max_bytes))
+        else:
+            datos = archivo.stream.read(estado.max_bytes + 1)
+            if len(datos) > estado.max_bytes:
+                raise FotoInvalida(_mensaje_tamano(estado.max_bytes))
+
+        futuro = estado.executor().submit(_procesar_subida, datos, bool(data_url), estado.max_bytes,
+                                          estado.max_pixeles, carpeta_fotos())
+        try:
+            return futuro.result(timeout=estado.espera)
+        except TiempoAgotado:
+            futuro.cancel()
+            raise FotoInvalida('El servidor está ocupado procesando otras fotos. Inténtalo de nuevo.')
+
+
+# --- Nombres y URLs de las variantes ---
+
+def variante(foto, tamano=TAMANO_MAXIMO, extension='jpg'):
+    """
+    Archivo de la variante más pequeña con lado >= `tamano`. Las fotos antiguas
+    sólo tienen un archivo (y ninguno en WebP: devuelve None).
+    """
+    foto = foto or FOTO_POR_DEFECTO
+    coincidencia = _NOMBRE_VARIANTE.match(foto)
+    if not coincidencia:
+        return foto if extension == 'jpg' else None
+    elegido = next((t for t in TAMANOS if t >= tamano), TAMANO_MAXIMO)
+    return nombre_variante(coincidencia.group(1), elegido, extension)
+
+
+def foto_url(foto, tamano=TAMANO_MAXIMO, extension='jpg'):
+    nombre = variante(foto, tamano, extension)
+    return url_for('static', filename='uploads/' + nombre) if nombre else None
+
+
+def foto_srcset(foto, tamano, extension='jpg'):
+    """srcset con la variante para `tamano` px (1x) y para el doble (2x); None si no hay en ese formato."""
+    una, doble = foto_url(foto, tamano, extension), foto_url(foto, 2 * tamano, extension)
+    return f'{una} 1x, {doble} 2x' if una else None
+
+
+# --- Conversión de fotos antiguas (flask fotos-variantes) ---
+
+def _convertir_archivo(args):
+    ruta, carpeta = args
+    try:
+        foto, archivos = procesar_imagen(ruta)
+        escribir_variantes(archivos, carpeta)
+        return foto, None
+    except Exception as e:  # Archivo inexistente o que no es una imagen
+        return None, f'{type(e).__name__}: {e}'
+
+
+def convertir_antiguas(fotos, carpeta, procesos=None):
+    """
+    Genera las variantes de las fotos antiguas `fotos` (nombres de archivo en
+    `carpeta`) en un pool de procesos. Produce (foto_antigua, foto_nueva, error)
+    en el mismo orden; foto_nueva es None si la foto no se pudo convertir.
+    """
+    with ProcessPoolExecutor(max_workers=procesos) as pool:
+        tareas = [(os.path.join(carpeta, foto), carpeta) for foto in fotos]
+        for antigua, (nueva, error) in zip(fotos, pool.map(_convertir_archivo, tareas, chunksize=8)):
+            yield antigua, nueva, error
+
+
+def es_foto_antigua(foto):
+    return bool(foto) and foto != FOTO_POR_DEFECTO and not _NOMBRE_VARIANTE.match(foto)
+
+
+# --- Limpieza de archivos sin referencias (flask fotos-limpiar) ---
+
+def clave_almacen(nombre):
+    """Clave de un archivo en el almacén: la huella para las variantes, el nombre para las fotos antiguas."""
+    coincidencia = _NOMBRE_VARIANTE.match(nombre)
+    return coincidencia.group(1) if coincidencia else nombre
+
+
+def limpiar_huerfanas(carpeta, referenciadas, antiguedad=ANTIGUEDAD_MINIMA_HUERFANA, simular=False):
+    """
+    Borra de `carpeta` los archivos cuya clave no está en `referenciadas`
+    (claves de las fotos en uso, ver clave_almacen) y que no se han escrito en
+    los últimos `antiguedad` segundos. También borra temporales abandonados de
+    escrituras interrumpidas. Con `simular` sólo cuenta. Devuelve un ResultadoLimpieza.
+    """
+    limite = time.time() - antiguedad
+    borrados = bytes_liberados = conservados = recientes = 0
+    with os.scandir(carpeta) as entradas:
+        for entrada in entradas:
+            if not entrada.is_file() or entrada.name.startswith('.') or entrada.name == FOTO_POR_DEFECTO:
+                continue
+            if clave_almacen(entrada.name) in referenciadas:
+                conservados += 1
+                continue
+            st = entrada.stat()
+            if st.st_mtime > limite:
+                recientes += 1
+                continue
+            if not simular:
+                try:
+                    os.remove(entrada.path)
+                except FileNotFoundError:
+                    continue
+            borrados += 1
+            bytes_liberados += st.st_size
+    return ResultadoLimpieza(borrados, bytes_liberados, conservados, recientes)
@@ -0,0 +1,440 @@
+# app/importacion.py
+"""
+Importación masiva de personas: Excel de estudiantes del sistema académico
+y CSV de personas.
+
+Los archivos se leen en streaming (openpyxl en modo read_only y CSV
+decodificado por partes), las filas se validan una a una y las válidas se
+escriben con un upsert nativo del dialecto cada LOTE_IMPORTACION filas, en
+una sola transacción. En cuanto aparece un error se deja de escribir (se
+sigue leyendo para informar de todos los errores) y el llamador hace
+rollback, así que el archivo se aplica entero o no se aplica.
+
+Cada fila se compara con la persona actual por una huella (hash de las
+columnas que importa la carga), así sólo se escriben las filas nuevas o que
+cambiaron: reimportar el mismo listado no genera UPDATEs ni bloqueos de
+filas. La misma comparación, sin escribir, es la simulación que se muestra
+antes de aplicar (creadas, actualizadas, sin cambios y ausentes del archivo).
+
+La memoria no depende del tamaño del archivo: sólo se mantiene un lote de
+filas, las huellas de la tabla, los ids ya vistos y, como mucho,
+MAX_ERRORES mensajes de error.
+
+Desde la web las importaciones se ejecutan como trabajos en segundo plano
+(trabajo_excel_estudiantes / trabajo_csv_personas, ver trabajos.py).
+"""
+import codecs
+import csv
+import hashlib
+import io
+from collections import namedtuple
+
+from openpyxl import load_workbook
+from sqlalchemy import select
+
+from app import db, catalogos, indice_personas
+from app.bulk import sentencia_upsert, en_lotes
+from app.models import Persona
+
+LOTE_IMPORTACION = 1000
+
+# Mensajes de error que se guardan para mostrar; del resto sólo se cuenta cuántos hay
+MAX_ERRORES = 500
+
+# Bytes del inicio del CSV con los que se detecta la codificación y el separador
+BYTES_DETECCION = 64 * 1024
+
+# Columnas que la importación actualiza en personas existentes (la foto se conserva)
+COLUMNAS_PERSONA = ('nombre_persona', 'sexo', 'dpto_id', 'control_id', 'tipo_persona_id')
+
+TIPO_PERSONA_ESTUDIANTE = 'Estudiante'
+CONTROL_REGULAR = 'Almuerzo Regular'
+CONTROL_ESPECIAL = 'Dieta Especial'
+CONTROL_NO_APLICA = 'No Aplica'
+
+ResultadoImportacion = namedtuple('ResultadoImportacion', ['creados', 'actualizados', 'sin_cambios', 'ausentes', 'errores'])
+
+# Conteos de la comparación del archivo con la tabla personas
+Diferencias = namedtuple('Diferencias', ['creados', 'actualizados', 'sin_cambios', 'ausentes'])
+
+
+class ErroresImportacion(list):
+    """Lista de errores que guarda como máximo MAX_ERRORES mensajes y cuenta el resto."""
+
+    def __init__(self):
+        super().__init__()
+        self.omitidos = 0
+
+    def agregar(self, mensaje):
+        if len(self) < MAX_ERRORES:
+            self.append(mensaje)
+        else:
+            self.omitidos += 1
+
+    @property
+    def total(self):
+        return len(self) + self.omitidos
+
+    def mensajes(self):
+        return list(self) + ([f"... y {self.omitidos} errores más."] if self.omitidos else [])
+
+
+def mapas_catalogos():
+    """
+    Mapas nombre -> id de los catálogos que usan las importaciones.
+    Devuelve (mapas, errores); hay error si falta alguno de los tipos base del Excel.
+    """
+    mapas = {
+        'dptos': catalogos.mapa_nombres('dptos'),
+        'tipos_persona': catalogos.mapa_nombres('tipos_persona'),
+        'tipos_control': catalogos.mapa_nombres('tipos_control'),
+    }
+    faltantes = [TIPO_PERSONA_ESTUDIANTE] if TIPO_PERSONA_ESTUDIANTE not in mapas['tipos_persona'] else []
+    faltantes += [c for c in (CONTROL_REGULAR, CONTROL_ESPECIAL, CONTROL_NO_APLICA) if c not in mapas['tipos_control']]
+    errores = []
+    if faltantes:
+        errores.append("Asegúrese de que los tipos de persona/control 'Estudiante', 'Almuerzo Regular', "
+                       "'Dieta Especial' y 'No Aplica' existan en la base de datos.")
+    return mapas, errores
+
+
+# --- Comparación con la tabla (huellas) ---
+
+def huella(valores):
+    """Hash corto (8 bytes) de los valores de COLUMNAS_PERSONA, en ese orden."""
+    texto = '\x1f'.join(str(v) for v in valores)
+    return hashlib.blake2b(texto.encode('utf-8'), digest_size=8).digest()
+
+
+def huellas_personas(lote=LOTE_IMPORTACION):
+    """{id_persona: huella} de toda la tabla, leída en streaming con un solo SELECT."""
+    columnas = [Persona.__table__.c[c] for c in COLUMNAS_PERSONA]
+    resultado = db.session.execute(
+        select(Persona.id_persona, *columnas).execution_options(yield_per=lote)
+    )
+    try:
+        return {fila[0]: huella(fila[1:]) for fila in resultado}
+    finally:
+        resultado.close()
+
+
+def contar_ausentes(vistos, tipos_persona, lote=LOTE_IMPORTACION):
+    """
+    Personas de los tipos que trae el archivo que no aparecen en él (las que
+    quedarían fuera del listado). Sólo se cuentan; la importación no las toca.
+    """
+    if not tipos_persona:
+        return 0
+    resultado = db.session.execute(
+        select(Persona.id_persona)
+        .where(Persona.tipo_persona_id.in_(tipos_persona))
+        .execution_options(yield_per=lote)
+    )
+    try:
+        return sum(1 for id_persona in resultado.scalars() if id_persona not in vistos)
+    finally:
+        resultado.close()
+
+
+# --- Escritura ---
+
+def _aplicar_sin_upsert(lote, existentes):
+    """Alternativa para dialectos sin upsert nativo: UPDATE e INSERT por lotes (executemany)."""
+    actualizar = [p for p in lote if p['id_persona'] in existentes]
+    insertar = [p for p in lote if p['id_persona'] not in existentes]
+    if actualizar:
+        db.session.execute(db.update(Persona), actualizar)
+    if insertar:
+        db.session.execute(db.insert(Persona), insertar)
+
+
+def aplicar_personas(personas, errores, lote=LOTE_IMPORTACION, escribir=True, commit_por_lote=False):
+    """
+    Consume el iterable de dicts de Persona, lo compara con la tabla y crea o
+    actualiza, en lotes de `lote` filas con un upsert nativo, sólo las filas
+    nuevas o con cambios. Deja de escribir en cuanto `errores` no está vacío.
+    Con `escribir=False` sólo valida y compara (simulación). Sin
+    `commit_por_lote` no hace commit. Devuelve Diferencias.
+    """
+    existentes = huellas_personas(lote)
+    vistos = set()
+    tipos_persona = set()
+    creados = actualizados = sin_cambios = 0
+
+    tabla = Persona.__table__
+    stmt = sentencia_upsert(tabla, ['id_persona'], lambda nuevos: {c: nuevos[c] for c in COLUMNAS_PERSONA})
+    for filas in en_lotes(personas, lote):
+        if errores:
+            continue  # Se sigue leyendo sólo para informar de todos los errores
+
+        cambiadas = []
+        for fila in filas:
+            id_persona = fila['id_persona']
+            actual = existentes.get(id_persona)
+            if id_persona in vistos:
+                cambiadas.append(fila)  # Repetido en el archivo: se escribe y gana la última fila
+                continue
+            vistos.add(id_persona)
+            tipos_persona.add(fila['tipo_persona_id'])
+            if actual is None:
+                creados += 1
+                cambiadas.append(fila)
+            elif actual != huella(fila[c] for c in COLUMNAS_PERSONA):
+                actualizados += 1
+                cambiadas.append(fila)
+            else:
+                sin_cambios += 1
+
+        if not escribir or not cambiadas:
+            continue
+        if stmt is None:
+            _aplicar_sin_upsert(cambiadas, existentes)
+        else:
+            # La foto por defecto sólo se usa al insertar; el upsert no la actualiza
+            db.session.execute(stmt, [dict(f, foto='default.jpg') for f in cambiadas])
+        if commit_por_lote:
+            db.session.commit()
+
+    ausentes = 0 if errores else contar_ausentes(vistos, tipos_persona, lote)
+    return Diferencias(creados, actualizados, sin_cambios, ausentes)
+
+
+def _con_progreso(filas, progreso, errores, cada=LOTE_IMPORTACION):
+    """
+    Pasa las filas tal cual, llamando a progreso(filas_leidas, errores_hasta_ahora)
+    cada `cada` filas y al final.
+    """
+    n = 0
+    for fila in filas:
+        yield fila
+        n += 1
+        if n % cada == 0:
+            progreso(n, errores.total)
+    progreso(n, errores.total)
+
+
+# --- Excel de estudiantes ---
+
+def _fila_estudiante(i, row, mapas):
+    """Convierte una fila del Excel en un dict de Persona. Devuelve (dict, None) o (None, error)."""
+    seccion, nombre_raw, grupos, id_persona, sexo_raw = (tuple(row) + (None,) * 5)[0:5]
+
+    if not id_persona or not nombre_raw:
+        return None, f"Fila {i}: Faltan el ID o el Nombre del estudiante. Se omitirá esta fila."
+
+    id_persona = str(id_persona).strip()
+
+    try:
+        apellido, nombre = [part.strip() for part in nombre_raw.split(',', 1)]
+        nombre_formateado = f"{nombre} {apellido}"
+    except (ValueError, TypeError, AttributeError):
+        nombre_formateado = str(nombre_raw).strip() if nombre_raw else ''
+
+    sexo = 'M' if sexo_raw and 'MASCULINO' in str(sexo_raw).upper() else 'F'
+
+    dpto_id = mapas['dptos'].get(str(seccion).strip()) if seccion else None
+    if not dpto_id:
+        return None, f"Fila {i} (ID: {id_persona}): El departamento '{seccion}' no existe o está vacío. Se omitirá esta fila."
+
+    grupos_str = str(grupos).upper() if grupos else ""
+    if 'ALMUERZO NORMAL' in grupos_str:
+        control = CONTROL_REGULAR
+    elif 'ALMUERZO ESPECIAL' in grupos_str:
+        control = CONTROL_ESPECIAL
+    else:
+        control = CONTROL_NO_APLICA
+
+    return {
+        'id_persona': id_persona,
+        'nombre_persona': nombre_formateado,
+        'sexo': sexo,
+        'dpto_id': dpto_id,
+        'control_id': mapas['tipos_control'][control],
+        'tipo_persona_id': mapas['tipos_persona'][TIPO_PERSONA_ESTUDIANTE],
+    }, None
+
+
+def leer_estudiantes(filas, mapas, errores, fila_inicial=2):
+    """
+    Generador de dicts de Persona a partir de las filas (tuplas de valores) del
+    Excel. Las filas con errores se omiten y su mensaje se añade a `errores`.
+    Si un id se repite, el upsert de la última fila es el que queda.
+    """
+    for i, row in enumerate(filas, start=fila_inicial):
+        if not any(row):
+            continue  # Saltar filas completamente vacías
+        estudiante, error = _fila_estudiante(i, row, mapas)
+        if error:
+            errores.agregar(error)
+        else:
+            yield estudiante
+
+
+def importar_excel_estudiantes(archivo, lote=LOTE_IMPORTACION, progreso=None, **opciones):
+    """
+    Importa el Excel de estudiantes (archivo binario) sin cargarlo entero: en
+    modo read_only openpyxl lee las filas del XML a medida que se itera.
+    `progreso(filas_leidas, errores)` se llama cada lote; `opciones` se pasan a
+    aplicar_personas(). Sin commit_por_lote, si hay errores el llamador debe
+    hacer rollback.
+    """
+    mapas, errores_catalogo = mapas_catalogos()
+    if errores_catalogo:
+        return ResultadoImportacion(0, 0, 0, 0, errores_catalogo)
+
+    errores = ErroresImportacion()
+    workbook = load_workbook(archivo, read_only=True, data_only=True)
+    try:
+        filas = workbook.active.iter_rows(min_row=2, values_only=True)
+        if progreso:
+            filas = _con_progreso(filas, progreso, errores, lote)
+        diferencias = aplicar_personas(leer_estudiantes(filas, mapas, errores), errores, lote, **opciones)
+    finally:
+        workbook.close()
+    return ResultadoImportacion(*diferencias, errores.mensajes())
+
+
+# --- CSV ---
+
+def detectar_codificacion(muestra):
+    """UTF-8 (con o sin BOM) si el inicio del archivo es UTF-8 válido; si no, Latin-1."""
+    try:
+        # final=False: un carácter multibyte cortado al final de la muestra no es un error
+        codecs.getincrementaldecoder('utf-8-sig')().decode(muestra, final=False)
+        return 'utf-8-sig'
+    except UnicodeDecodeError:
+        return 'latin-1'
+
+
+def abrir_csv(stream, detectar_dialecto=True):
+    """
+    csv.reader sobre el archivo binario `stream`, decodificado por partes con
+    la codificación detectada en los primeros BYTES_DETECCION bytes. Con
+    `detectar_dialecto`, el separador se deduce de la misma muestra (Sniffer).
+    """
+    muestra = stream.read(BYTES_DETECCION)
+    stream.seek(0)
+    codificacion = detectar_codificacion(muestra)
+
+    dialecto = 'excel'
+    if detectar_dialecto:
+        try:
+            dialecto = csv.Sniffer().sniff(muestra.decode(codificacion, errors='ignore')[:2048])
+        except csv.Error:
+            # Si el Sniffer falla (ej. archivo vacío o de una columna), asumimos comas.
+            dialecto = 'excel'
+
+    texto = io.TextIOWrapper(stream, encoding=codificacion, newline='')
+    return csv.reader(texto, dialecto)
+
+
+def leer_personas_csv(reader, mapas, errores, fila_inicial=2):
+    """
+    Generador de dicts de Persona a partir de las filas de datos del CSV de
+    personas (sin la cabecera). Los errores se añaden a `errores`.
+    """
+    ids_en_archivo = set()
+    for i, row in enumerate(reader, start=fila_inicial):
+        row_errors = []
+        if len(row) != 6:
+            row_errors.append(f"La fila debe tener 6 columnas, pero tiene {len(row)}.")
+        else:
+            id_p, nombre, sexo, dpto_n, tipo_p_n, control_n = [field.strip() for field in row]
+
+            if not all([id_p, nombre, sexo, dpto_n, tipo_p_n, control_n]): row_errors.append(f"ID '{id_p}': Todos los campos son obligatorios.")
+            if id_p in ids_en_archivo: row_errors.append(f"ID '{id_p}': está duplicado dentro del mismo archivo CSV.")
+            if sexo.upper() not in ['M', 'F']: row_errors.append(f"ID '{id_p}': El sexo ('{sexo}') debe ser 'M' o 'F'.")
+            if dpto_n not in mapas['dptos']: row_errors.append(f"ID '{id_p}': El departamento '{dpto_n}' no es válido.")
+            if tipo_p_n not in mapas['tipos_persona']: row_errors.append(f"ID '{id_p}': El tipo de persona '{tipo_p_n}' no es válido.")
+            if control_n not in mapas['tipos_control']: row_errors.append(f"ID '{id_p}': El tipo de control '{control_n}' no es válido.")
+
+        if row_errors:
+            for e in row_errors:
+                errores.agregar(f"Fila {i}: {e}")
+            continue
+
+        ids_en_archivo.add(id_p)
+        yield {
+            'id_persona': id_p,
+            'nombre_persona': nombre,
+            'sexo': sexo.upper(),
+            'dpto_id': mapas['dptos'][dpto_n],
+            'tipo_persona_id': mapas['tipos_persona'][tipo_p_n],
+            'control_id': mapas['tipos_control'][control_n],
+        }
+
+
+def importar_csv_personas(reader, lote=LOTE_IMPORTACION, progreso=None, **opciones):
+    """
+    Importa las filas de datos de un CSV de personas ya abierto con abrir_csv().
+    `progreso` y `opciones` como en importar_excel_estudiantes().
+    """
+    mapas, _ = mapas_catalogos()
+    errores = ErroresImportacion()
+    if progreso:
+        reader = _con_progreso(reader, progreso, errores, lote)
+    diferencias = aplicar_personas(leer_personas_csv(reader, mapas, errores), errores, lote, **opciones)
+    return ResultadoImportacion(*diferencias, errores.mensajes())
+
+
+# --- Importaciones como trabajos en segundo plano (ver trabajos.py) ---
+# Se hacen dos pasadas sobre el archivo guardado: la primera sólo valida y
+# compara, y si no hay errores la segunda escribe con un commit por lote. Así
+# no hay una transacción larga que bloquee a los check-ins (las claves
+# foráneas de registros sobre personas) y, si el archivo tiene errores, no se
+# escribe nada. En una simulación sólo se hace la primera pasada.
+
+def contar_filas_excel(ruta):
+    """Filas de datos según la dimensión de la hoja (None si el archivo no la declara, como
+    los que se escriben en modo write_only)."""
+    workbook = load_workbook(ruta, read_only=True)
+    try:
+        max_row = workbook.active.max_row
+    finally:
+        workbook.close()
+    return max_row - 1 if max_row else None
+
+
+def contar_filas_csv(ruta):
+    """Filas de datos contando saltos de línea por bloques (sin decodificar)."""
+    saltos = 0
+    ultimo = b''
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(BYTES_DETECCION), b''):
+            saltos += bloque.count(b'\n')
+            ultimo = bloque
+    if ultimo and not ultimo.endswith(b'\n'):
+        saltos += 1
+    return max(saltos - 1, 0)
+
+
+def _trabajo_en_dos_pasadas(importar, total, progreso, simular=False):
+    progreso.fase('validando', total)
+    resultado = importar(progreso=progreso.avance, escribir=False)
+    if resultado.errores or simular:
+        return resultado
+    # La pasada de validación ya contó las filas exactas (el estimado puede faltar)
+    progreso.fase('importando', progreso.datos['filas_procesadas'] or total)
+    try:
+        return importar(progreso=progreso.avance, commit_por_lote=True)
+    finally:
+        # Con un commit por lote, aun si falla a medias ya hay personas escritas
+        indice_personas.invalidar()
+
+
+def trabajo_excel_estudiantes(ruta, progreso, simular=False):
+    """Función de trabajo para el Excel de estudiantes guardado en `ruta`."""
+    def importar(**opciones):
+        with open(ruta, 'rb') as f:
+            return importar_excel_estudiantes(f, **opciones)
+    return _trabajo_en_dos_pasadas(importar, contar_filas_excel(ruta), progreso, simular)
+
+
+def trabajo_csv_personas(ruta, progreso, simular=False):
+    """Función de trabajo para el CSV de personas guardado en `ruta`."""
+    def importar(**opciones):
+        with open(ruta, 'rb') as f:
+            reader = abrir_csv(f)
+            next(reader, None)  # La cabecera ya se validó al subir el archivo
+            return importar_csv_personas(reader, **opciones)
+    return _trabajo_en_dos_pasadas(importar, contar_filas_csv(ruta), progreso, simular)
@@ -0,0 +1,193 @@
+# app/indice_personas.py
+"""
+Índice en memoria para la búsqueda de personas por nombre (/buscar_persona).
+
+Un `ILIKE '%término%'` no puede usar ningún índice de la BD, así que cada
+búsqueda recorría la tabla personas entera. Cada worker mantiene en su lugar
+un índice de trigramas de los nombres normalizados (minúsculas y sin tildes):
+una búsqueda toma la lista de posiciones del trigrama menos frecuente del
+término y comprueba la subcadena sólo en esos candidatos. Las posiciones
+siguen el orden alfabético de los nombres, así que los primeros `limite`
+aciertos ya salen ordenados.
+
+Como las cachés de catálogos y de configuración, el índice se invalida con un
+archivo sello (ver cache.py): quien crea, edita, borra o importa personas
+llama a invalidar() y cada worker lo reconstruye al ver el sello nuevo. La
+reconstrucción se hace en un hilo aparte y, mientras tanto, se sigue
+buscando en el índice anterior, así el kiosco nunca espera la recarga.
+"""
+import os
+import threading
+import unicodedata
+from array import array
+from collections import namedtuple
+
+from flask import current_app
+from sqlalchemy import select
+
+from app.cache import ArchivoSello
+
+PersonaBusqueda = namedtuple('PersonaBusqueda', ['id_persona', 'nombre_persona', 'dpto_id'])
+
+# Filas leídas de la BD por viaje al reconstruir el índice
+LOTE_CARGA = 5000
+
+
+# Letras acentuadas habituales; el resto de caracteres no ASCII pasa por NFKD
+_SIN_TILDES = str.maketrans('áéíóúüñàèìòùÁÉÍÓÚÜÑÀÈÌÒÙ', 'aeiouunaeiouAEIOUUNAEIOU')
+
+
+def normalizar(texto):
+    """Minúsculas, sin tildes ni diéresis (la ñ queda como n) y con los espacios colapsados."""
+    texto = (texto or '').translate(_SIN_TILDES)
+    if not texto.isascii():
+        descompuesto = unicodedata.normalize('NFKD', texto)
+        texto = ''.join(c for c in descompuesto if not unicodedata.combining(c))
+    return ' '.join(texto.casefold().split())
+
+
+def trigramas(texto):
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+class _Indice:
+    """Personas ordenadas por nombre normalizado y listas de posiciones por trigrama."""
+
+    def __init__(self, filas):
+        filas = sorted(((normalizar(nombre), nombre, id_persona, dpto_id)
+                        for id_persona, nombre, dpto_id in filas))
+        self.normalizados = [f[0] for f in filas]
+        self.personas = [PersonaBusqueda(f[2], f[1], f[3]) for f in filas]
+        self.posiciones = {}
+        for pos, nombre in enumerate(self.normalizados):
+            for trigrama in trigramas(nombre):
+                lista = self.posiciones.get(trigrama)
+                if lista is None:
+                    lista = self.posiciones[trigrama] = array('I')
+                lista.append(pos)
+
+    def buscar(self, termino, limite):
+        termino = normalizar(termino)
+        if not termino:
+            return []
+        if len(termino) < 3:
+            candidatos = range(len(self.normalizados))
+        else:
+            listas = [self.posiciones.get(t) for t in trigramas(termino)]
+            if not all(listas):
+                return []  # Algún trigrama no aparece en ningún nombre
+            candidatos = min(listas, key=len)
+
+        resultados = []
+        normalizados = self.normalizados
+        for pos in candidatos:
+            if termino in normalizados[pos]:
+                resultados.append(self.personas[pos])
+                if len(resultados) == limite:
+                    break
+        return resultados
+
+
+class _EstadoIndice:
+
+    def __init__(self, stamp_path):
+        self.sello_archivo = ArchivoSello(stamp_path)
+        self.indice = None
+        self.sello = None
+        self.lock = threading.Lock()
+        self.reconstruyendo = False
+        self.reconstrucciones = 0
+
+
+class IndicePersonas:
+    """Búsqueda de personas por nombre con un índice en memoria por worker."""
+
+    def init_app(self, app):
+        stamp_path = app.config.get('PERSONAS_STAMP_FILE') or os.path.join(app.instance_path, 'personas.stamp')
+        app.extensions['indice_personas'] = _EstadoIndice(stamp_path)
+
+    @staticmethod
+    def _estado():
+        return current_app.extensions['indice_personas']
+
+    @staticmethod
+    def _cargar():
+        from app import db
+        from app.models import Persona
+        resultado = db.session.execute(
+            select(Persona.id_persona, Persona.nombre_persona, Persona.dpto_id)
+            .execution_options(yield_per=LOTE_CARGA)
+        )
+        try:
+            return _Indice(resultado)
+        finally:
+            resultado.close()
+
+    def _indice(self):
+        estado = self._estado()
+        sello = estado.sello_archivo.leer()
+        if estado.indice is not None and sello == estado.sello:
+            return estado.indice
+
+        if estado.indice is not None:
+            # Índice desactualizado: se sigue usando mientras otro hilo lo reconstruye
+            with estado.lock:
+                if not estado.reconstruyendo:
+                    estado.reconstruyendo = True
+                    app = current_app._get_current_object()
+                    threading.Thread(target=self._reconstruir, args=(app, estado, sello),
+                                     name='indice-personas', daemon=True).start()
+            return estado.indice
+
+        # Primera carga del worker: no hay índice anterior que servir
+        with estado.lock:
+            if estado.indice is None:
+                estado.indice = self._cargar()
+                estado.sello = sello
+                estado.reconstrucciones += 1
+            return estado.indice
+
+    def _reconstruir(self, app, estado, sello):
+        from app import db
+        with app.app_context():
+            try:
+                indice = self._cargar()
+                with estado.lock:
+                    estado.indice = indice
+                    estado.sello = sello
+                    estado.reconstrucciones += 1
+            except Exception:
+                app.logger.exception('No se pudo reconstruir el índice de personas')
+            finally:
+                db.session.remove()
+                estado.reconstruyendo = False
+
+    # --- Lectura ---
+
+    def buscar(self, termino, limite=20):
+        """Personas cuyo nombre contiene `termino` sin distinguir mayúsculas ni tildes, por orden alfabético."""
+        return self._indice().buscar(termino, limite)
+
+    def version(self):
+        """Sello de la versión del índice con que se responde (para los ETag de /buscar_persona)."""
+        self._indice()
+        return self._estado().sello
+
+    def version_tabla(self):
+        """Sello actual de la tabla personas, aunque el índice aún no se haya reconstruido."""
+        return self._estado().sello_archivo.leer()
+
+    # --- Invalidación y métricas ---
+
+    def invalidar(self):
+        """Avisa a todos los workers (también a este) de que deben reconstruir el índice."""
+        self._estado().sello_archivo.tocar()
+
+    def estadisticas(self):
+        estado = self._estado()
+        indice = estado.indice
+        return {
+            'personas': len(indice.personas) if indice else 0,
+            'trigramas': len(indice.posiciones) if indice else 0,
+            'reconstrucciones': estado.reconstrucciones,
+        }
@@ -1,5 +1,7 @@
 from datetime import datetime
+from flask import current_app, has_app_context
 from app import db, login_manager
+from app.utils import convert_utc_to_local
 from flask_login import UserMixin
 
 @login_manager.user_loader
@@ -9,7 +11,8 @@ def load_user(user_id):
 class Rol(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     nombre = db.Column(db.String(50), unique=True, nullable=False)
-    usuarios = db.relationship('Usuario', backref='rol', lazy=True)
+    # El rol se carga junto con el usuario (current_user.rol se usa en cada petición)
+    usuarios = db.relationship('Usuario', backref=db.backref('rol', lazy='joined'), lazy=True)
 
 class Usuario(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
@@ -53,14 +56,62 @@ class Persona(db.Model):
     
     registros = db.relationship('Registro', backref='persona_ref', lazy=True)
 
+    __table_args__ = (
+        db.Index('ix_personas_dpto_id', 'dpto_id'),
+        db.Index('ix_personas_tipo_persona_id', 'tipo_persona_id'),
+        # (nombre, id) es la clave de ordenación del listado paginado por keyset
+        db.Index('ix_personas_nombre_id', 'nombre_persona', 'id_persona'),
+    )
+
+def fecha_local_de(fecha_hora_utc):
+    """Día local (zona horaria del colegio) al que pertenece una fecha/hora UTC."""
+    timezone_str = current_app.config.get('TIMEZONE', 'America/Bogota') if has_app_context() else 'America/Bogota'
+    return convert_utc_to_local(fecha_hora_utc, timezone_str).date()
+
+def _fecha_local_por_defecto(context):
+    fecha_hora = context.get_current_parameters().get('fecha_hora_registro') or datetime.utcnow()
+    return fecha_local_de(fecha_hora)
+
 class Registro(db.Model):
     __tablename__ = 'registros'
     id_registro = db.Column(db.Integer, primary_key=True, autoincrement=True)
     fecha_hora_registro = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # Día local del registro. Junto con la restricción única garantiza en la BD
+    # un solo almuerzo por persona, día y tipo de control.
+    fecha_local = db.Column(db.Date, nullable=False, default=_fecha_local_por_defecto)
     
     # Llaves foráneas
     persona_id = db.Column(db.String(20), db.ForeignKey('personas.id_persona'), nullable=False)
     tipo_control_id = db.Column(db.Integer, db.ForeignKey('tipo_control.id_control'), nullable=False)
+    # Departamento y tipo de la persona en el momento del check-in: si la persona
+    # cambia después, sus registros anteriores (y el rollup) no se mueven
+    dpto_id = db.Column(db.Integer, db.ForeignKey('dptos.id_dpto'), nullable=False)
+    tipo_persona_id = db.Column(db.Integer, db.ForeignKey('tipos_persona.id_tipopersona'), nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('persona_id', 'fecha_local', 'tipo_control_id', name='uq_registros_persona_dia_control'),
+        # Índices para los filtros por fecha, persona, tipo de control, dpto y tipo de persona (registro, reportes, eliminación)
+        db.Index('ix_registros_fecha_hora_registro', 'fecha_hora_registro'),
+        db.Index('ix_registros_persona_fecha', 'persona_id', 'fecha_hora_registro'),
+        db.Index('ix_registros_control_fecha', 'tipo_control_id', 'fecha_hora_registro'),
+        db.Index('ix_registros_dpto_fecha', 'dpto_id', 'fecha_hora_registro'),
+        db.Index('ix_registros_tipo_persona_fecha', 'tipo_persona_id', 'fecha_hora_registro'),
+    )
+
+class RegistroDailyRollup(db.Model):
+    """
+    Conteo de registros por día local, departamento, tipo de persona y tipo de
+    control. Lo mantienen el check-in y la eliminación de registros (ver
+    rollup.py) y se puede reconstruir con `flask reconstruir-rollup`.
+    Departamento y tipo de persona son los guardados en cada registro (los de
+    la persona al registrarse), no los actuales de la persona.
+    """
+    __tablename__ = 'registro_daily_rollup'
+    fecha_local = db.Column(db.Date, primary_key=True)
+    dpto_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    tipo_persona_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    tipo_control_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    total = db.Column(db.Integer, nullable=False, default=0)
 
 # app/models.py
 
@@ -0,0 +1,216 @@
+# app/reportes.py
+"""
+Motor de reportes en streaming.
+
+Los resultados se leen con un cursor del lado del servidor (yield_per, que
+activa stream_results) y se convierten en filas planas a medida que llegan,
+así que ni la consulta ni la salida (HTML, CSV o XLSX) se materializan
+completas en memoria: el consumo es el mismo para un día que para un año.
+
+Los resúmenes (totales por día, departamento x control, mensual por persona)
+se calculan con GROUP BY en la BD; aquí sólo se pivotan los conteos, que
+son pocas filas, a una tabla de columnas fijas.
+"""
+import csv
+import io
+import tempfile
+from collections import namedtuple, defaultdict
+
+from flask import current_app
+from openpyxl import Workbook
+
+from app import db, catalogos
+from app.consultas import consulta_reporte, resumen_por_dia, resumen_dpto_control, resumen_mensual_persona
+from app.utils import convert_utc_to_local, local_today
+
+# Filas leídas de la BD por viaje al cursor del servidor
+LOTE_REPORTE = 1000
+
+# Tamaño de los bloques en que se envía el XLSX ya generado
+BLOQUE_ARCHIVO = 64 * 1024
+
+COLUMNAS_REPORTE = ['Fecha y Hora', 'Código', 'Nombre', 'Departamento', 'Tipo Persona', 'Tipo Control']
+
+FilaReporte = namedtuple('FilaReporte', ['fecha_hora', 'id_persona', 'nombre_persona', 'dpto', 'tipo_persona', 'tipo_control'])
+
+
+def filas_reporte(tipo_reporte, fecha_inicio=None, fecha_fin=None, filtro_id=None, lote=LOTE_REPORTE):
+    """
+    Generador de FilaReporte con la hora ya en zona local y los nombres de
+    catálogo resueltos. Debe consumirse dentro del contexto de la aplicación
+    (en las respuestas, con stream_with_context).
+
+    Los catálogos se resuelven antes de abrir el cursor: con el cursor del
+    servidor a medio leer, una recarga de la caché haría otra consulta en la
+    misma conexión, que MySQL rechaza ("Commands out of sync").
+    """
+    timezone_str = current_app.config.get('TIMEZONE', 'America/Bogota')
+    dptos = catalogos.nombres_por_id('dptos')
+    tipos_persona = catalogos.nombres_por_id('tipos_persona')
+    tipos_control = catalogos.nombres_por_id('tipos_control')
+    stmt = consulta_reporte(tipo_reporte, fecha_inicio, fecha_fin, filtro_id)
+    resultado = db.session.execute(stmt.execution_options(yield_per=lote))
+    try:
+        for fila in resultado:
+            yield FilaReporte(
+                convert_utc_to_local(fila.fecha_hora_registro, timezone_str).strftime('%d/%m/%Y %I:%M:%S %p'),
+                fila.id_persona,
+                fila.nombre_persona,
+                dptos[fila.dpto_id],
+                tipos_persona[fila.tipo_persona_id],
+                tipos_control[fila.tipo_control_id]
+            )
+    finally:
+        # Si el cliente corta la descarga, se libera el cursor del servidor
+        resultado.close()
+
+
+def generar_csv(filas, columnas=COLUMNAS_REPORTE, lote=LOTE_REPORTE):
+    """Genera el CSV por bloques de `lote` filas (con BOM para que Excel respete las tildes)."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow(columnas)
+    for n, fila in enumerate(filas, 1):
+        writer.writerow(fila)
+        if n % lote == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def en_bloques(piezas, tamano=BLOQUE_ARCHIVO):
+    """
+    Agrupa las piezas de texto de una plantilla en streaming (una por cada
+    fragmento que emite Jinja) en bloques de ~`tamano` caracteres, para no hacer
+    una escritura al socket por cada celda.
+    """
+    bloque, longitud = [], 0
+    for pieza in piezas:
+        bloque.append(pieza)
+        longitud += len(pieza)
+        if longitud >= tamano:
+            yield ''.join(bloque)
+            bloque, longitud = [], 0
+    if bloque:
+        yield ''.join(bloque)
+
+
+def generar_xlsx(filas, titulo='Reporte', columnas=COLUMNAS_REPORTE):
+    """
+    Genera el XLSX con un libro write-only de openpyxl, que vuelca cada fila a
+    un temporal en disco en lugar de mantener las celdas en memoria. La
+    memoria queda acotada, pero el XLSX (a diferencia del CSV y del HTML) no
+    se transmite a medida que se lee: openpyxl sólo arma el .xlsx al guardar,
+    así que el primer bloque sale cuando ya se leyeron todas las filas. El
+    archivo final se envía por bloques desde otro temporal.
+
+    Los dos temporales se borran en el finally, que corre también si la
+    consulta falla o si el cliente se desconecta durante la descarga.
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title=titulo[:31])
+    archivo = tempfile.TemporaryFile()
+    try:
+        ws.append(columnas)
+        for fila in filas:
+            ws.append(list(fila))
+        wb.save(archivo)
+
+        archivo.seek(0)
+        while True:
+            bloque = archivo.read(BLOQUE_ARCHIVO)
+            if not bloque:
+                break
+            yield bloque
+    finally:
+        archivo.close()
+        # wb.save() borra el temporal de la hoja; si no se llegó a guardar,
+        # openpyxl lo dejaría hasta que termine el proceso. _writer es API
+        # interna: openpyxl está fijado a 3.1.x en requirements.txt por esto
+        if ws._writer is not None and not ws.closed:
+            ws.close()
+            ws._writer.cleanup()
+
+
+# --- Resúmenes agregados ---
+
+Resumen = namedtuple('Resumen', ['titulo', 'columnas', 'filas', 'totales'])
+
+
+def _controles_presentes(conteos):
+    """Tipos de control con algún registro, en el orden del catálogo."""
+    presentes = {tipo_control_id for _, tipo_control_id, _ in conteos}
+    return [c for c in catalogos.listar('tipos_control') if c.id_control in presentes]
+
+
+def _pivotar(conteos, etiqueta_fila, titulo, columna_fila):
+    """
+    Convierte conteos (clave_fila, tipo_control_id, total) en una tabla con una
+    columna por tipo de control más el total de la fila, y una fila de totales.
+    """
+    controles = _controles_presentes(conteos)
+    tabla = defaultdict(dict)
+    for clave, tipo_control_id, total in conteos:
+        tabla[clave][tipo_control_id] = total
+
+    filas = []
+    for clave, por_control in tabla.items():
+        valores = [por_control.get(c.id_control, 0) for c in controles]
+        filas.append([etiqueta_fila(clave)] + valores + [sum(valores)])
+
+    totales = ['Total'] + [sum(columna) for columna in zip(*(f[1:] for f in filas))] if filas else []
+    columnas = [columna_fila] + [c.nombre_control for c in controles] + ['Total']
+    return Resumen(titulo, columnas, filas, totales)
+
+
+def _resumen_diario(fecha_inicio, fecha_fin):
+    conteos = db.session.execute(resumen_por_dia(fecha_inicio, fecha_fin)).all()
+    return _pivotar(conteos, lambda dia: dia.strftime('%d/%m/%Y'), 'Totales por día', 'Fecha')
+
+
+def _resumen_dpto_control(fecha_inicio, fecha_fin):
+    conteos = db.session.execute(resumen_dpto_control(fecha_inicio, fecha_fin)).all()
+    resumen = _pivotar(conteos, lambda dpto_id: catalogos.dpto(dpto_id).nombre_dpto,
+                       'Departamento x tipo de control', 'Departamento')
+    return resumen._replace(filas=sorted(resumen.filas, key=lambda f: f[0]))
+
+
+def _resumen_mensual_persona(fecha_inicio, fecha_fin):
+    conteos = db.session.execute(resumen_mensual_persona(fecha_inicio, fecha_fin)).all()
+    meses = sorted({(c.anio, c.mes) for c in conteos})
+    posicion = {mes: i for i, mes in enumerate(meses)}
+
+    # Las filas llegan ordenadas por persona: se agrupan consecutivas
+    filas = []
+    for c in conteos:
+        if not filas or filas[-1][0] != c.id_persona:
+            filas.append([c.id_persona, c.nombre_persona] + [0] * len(meses))
+        filas[-1][2 + posicion[(c.anio, c.mes)]] = c.total
+    for fila in filas:
+        fila.append(sum(fila[2:]))
+
+    totales = ['Total', ''] + [sum(columna) for columna in zip(*(f[2:] for f in filas))] if filas else []
+    columnas = ['Código', 'Nombre'] + [f'{anio:04d}-{mes:02d}' for anio, mes in meses] + ['Total']
+    return Resumen('Registros mensuales por persona', columnas, filas, totales)
+
+
+RESUMENES = {
+    'diario': _resumen_diario,
+    'dpto_control': _resumen_dpto_control,
+    'mensual_persona': _resumen_mensual_persona,
+}
+
+
+def rango_resumen(fecha_inicio=None, fecha_fin=None):
+    """Rango por defecto de los resúmenes: desde el día 1 del mes de `fecha_fin` (hoy) hasta `fecha_fin`."""
+    fecha_fin = fecha_fin or local_today(current_app.config.get('TIMEZONE', 'America/Bogota'))
+    fecha_inicio = fecha_inicio or fecha_fin.replace(day=1)
+    return fecha_inicio, fecha_fin
+
+
+def generar_resumen(tipo, fecha_inicio=None, fecha_fin=None):
+    """Calcula el resumen `tipo` (clave de RESUMENES). Devuelve (Resumen, fecha_inicio, fecha_fin)."""
+    fecha_inicio, fecha_fin = rango_resumen(fecha_inicio, fecha_fin)
+    return RESUMENES[tipo](fecha_inicio, fecha_fin), fecha_inicio, fecha_fin
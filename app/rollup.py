@@ -0,0 +1,108 @@
+# app/rollup.py
+"""
+Mantenimiento de la tabla registro_daily_rollup (conteos diarios precalculados).
+
+Cada check-in suma 1 a su celda (día local, dpto, tipo de persona, tipo de
+control) con un upsert atómico en la misma transacción que el INSERT del
+registro, y delete_registro resta 1. Así los resúmenes por día y por
+departamento leen O(días x categorías) filas en lugar de O(registros).
+`reconstruir()` recalcula un rango desde registros si algo se desincroniza
+(restauraciones, cargas masivas, cambios manuales en la BD).
+
+El dpto y el tipo de persona de cada celda salen de las columnas del propio
+registro, guardadas al hacer el check-in; nunca de la persona, que puede
+haber cambiado de departamento o de tipo desde entonces.
+"""
+from sqlalchemy import delete, func, select, update
+
+from app import db
+from app.bulk import sentencia_upsert
+from app.consultas import rango_utc
+from app.models import Registro, RegistroDailyRollup
+
+rollup = RegistroDailyRollup.__table__
+CLAVE_ROLLUP = ('fecha_local', 'dpto_id', 'tipo_persona_id', 'tipo_control_id')
+
+
+def sumar_registro(fecha_local, dpto_id, tipo_persona_id, tipo_control_id):
+    """Suma un registro a su celda. No hace commit: va en la transacción del check-in."""
+    sumar_conteos({(fecha_local, dpto_id, tipo_persona_id, tipo_control_id): 1})
+
+
+def sumar_conteos(conteos):
+    """
+    Suma varios registros de una vez. `conteos` es {(fecha_local, dpto_id,
+    tipo_persona_id, tipo_control_id): cantidad}; todas las celdas van en un
+    solo upsert. No hace commit.
+    """
+    filas = [dict(zip(CLAVE_ROLLUP, clave), total=cantidad) for clave, cantidad in conteos.items()]
+    stmt = sentencia_upsert(rollup, CLAVE_ROLLUP, lambda nuevos: {'total': rollup.c.total + nuevos.total})
+    if stmt is not None:
+        db.session.execute(stmt, filas)
+        return
+
+    # Dialecto sin upsert nativo: UPDATE y, si no había celda, INSERT
+    for valores in filas:
+        clave = {k: valores[k] for k in CLAVE_ROLLUP}
+        result = db.session.execute(
+            update(rollup).where(*(rollup.c[k] == v for k, v in clave.items()))
+            .values(total=rollup.c.total + valores['total'])
+        )
+        if not result.rowcount:
+            db.session.execute(rollup.insert().values(**valores))
+
+
+def restar_registro(registro):
+    """Resta un registro (que se va a eliminar) de su celda. No hace commit."""
+    condicion = (
+        rollup.c.fecha_local == registro.fecha_local,
+        rollup.c.dpto_id == registro.dpto_id,
+        rollup.c.tipo_persona_id == registro.tipo_persona_id,
+        rollup.c.tipo_control_id == registro.tipo_control_id,
+    )
+    db.session.execute(update(rollup).where(*condicion).values(total=rollup.c.total - 1))
+    db.session.execute(delete(rollup).where(*condicion, rollup.c.total <= 0))
+
+
+def consulta_conteos(fecha_inicio=None, fecha_fin=None):
+    """
+    SELECT agrupado de registros con la misma forma que el rollup. El rango
+    (días locales, ambos inclusive) se filtra sobre el índice de fecha_hora_registro.
+    """
+    stmt = select(
+        Registro.fecha_local,
+        Registro.dpto_id,
+        Registro.tipo_persona_id,
+        Registro.tipo_control_id,
+        func.count().label('total')
+    )
+    inicio, fin = rango_utc(fecha_inicio, fecha_fin)
+    if inicio:
+        stmt = stmt.where(Registro.fecha_hora_registro >= inicio)
+    if fin:
+        stmt = stmt.where(Registro.fecha_hora_registro < fin)
+    return stmt.group_by(Registro.fecha_local, Registro.dpto_id, Registro.tipo_persona_id, Registro.tipo_control_id)
+
+
+def reconstruir(fecha_inicio=None, fecha_fin=None):
+    """
+    Recalcula el rollup de un rango de días locales (todo, si no se indica)
+    con un DELETE y un INSERT ... SELECT en una sola transacción.
+    Devuelve el número de celdas escritas.
+    """
+    borrar = delete(rollup)
+    if fecha_inicio:
+        borrar = borrar.where(rollup.c.fecha_local >= fecha_inicio)
+    if fecha_fin:
+        borrar = borrar.where(rollup.c.fecha_local <= fecha_fin)
+
+    try:
+        db.session.execute(borrar)
+        result = db.session.execute(
+            rollup.insert().from_select(list(CLAVE_ROLLUP) + ['total'], consulta_conteos(fecha_inicio, fecha_fin))
+        )
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return result.rowcount
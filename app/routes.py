@@ -4,25 +4,31 @@ import csv
 import io
 from flask import Response
 # ... el resto de tus importaciones ...
-from flask import Blueprint, render_template, url_for, flash, redirect, request, jsonify, current_app, send_from_directory
+from flask import Blueprint, render_template, url_for, flash, redirect, request, jsonify, current_app, abort, send_from_directory, stream_template, stream_with_context
 from flask_login import login_user, current_user, logout_user, login_required
 from functools import wraps
 from wtforms.validators import ValidationError
-from app import db, bcrypt
+from app import db, bcrypt, settings_cache, catalogos, trabajos, indice_personas, registros_en_vivo, procesador_fotos
+from app.catalogos_cache import CATALOGO_POR_TABLA
 from app.models import Usuario, Persona, Dpto, TipoControl, TipoPersona, Registro, Setting
 from app.forms import (LoginForm, DptoForm, TipoControlForm, TipoPersonaForm, PersonaForm, UsuarioForm)
-from app.utils import generate_qr_code
+from app.utils import generate_qr_svg
+from app.fotos import FotoInvalida, foto_url, foto_srcset
+from app.checkin import registrar_almuerzo, registrar_lote, MAX_LOTE_CHECKIN, CONTROL_NO_APLICA
+from app.rollup import restar_registro
+from app.importacion import abrir_csv, trabajo_excel_estudiantes, trabajo_csv_personas
+from app.indice_personas import normalizar
+from app.consultas import registros_del_dia, datos_ticket, persona_tiene_registros, parse_fecha, pagina_personas, roster_personas
+from app.backups import volcado_comprimido
+from app.en_vivo import TransmisionNoDisponible
+from app.reportes import filas_reporte, generar_csv, generar_xlsx, en_bloques, RESUMENES, generar_resumen
 import os
-import secrets
-from PIL import Image
-from datetime import date, datetime
-import base64
-from io import BytesIO
+import hashlib
+from datetime import datetime
 from werkzeug.utils import secure_filename
 import subprocess
 from .utils import convert_utc_to_local
 
-from openpyxl import load_workbook
 
 
 bp = Blueprint('main', __name__)
@@ -67,10 +73,8 @@ def index():
 @bp.route('/registro')
 @login_required
 def registro_almuerzo():
-    # Obtener los últimos 10 registros del día
-    today = date.today()
-    registros_hoy = Registro.query.filter(db.func.date(Registro.fecha_hora_registro) == today)\
-                                  .order_by(Registro.fecha_hora_registro.desc()).limit(10).all()
+    # Obtener los últimos 10 registros del día (rango sobre la columna indexada)
+    registros_hoy = registros_del_dia(limite=10).all()
     return render_template('registro_almuerzo.html', title='Registro de Almuerzo', registros=registros_hoy)
 
 # app/routes.py
@@ -82,86 +86,159 @@ def procesar_registro():
     if not id_persona:
         return jsonify({'success': False, 'message': 'Debe ingresar un código.'})
 
-    persona = Persona.query.get(id_persona)
-    if not persona:
-        return jsonify({'success': False, 'message': 'Código no encontrado.'})
+    # La validación, el control de duplicados, la inserción y el conteo diario se
+    # resuelven en el motor de check-in con un máximo de tres sentencias SQL
+    # (SELECT de la persona, INSERT del registro y upsert del rollup).
+    resultado = registrar_almuerzo(id_persona)
+    if not resultado.success:
+        return jsonify({'success': False, 'estado': resultado.estado, 'message': resultado.message})
 
-    if persona.control_ref and persona.control_ref.nombre_control.lower() == 'no aplica':
-        mensaje = f'"{persona.nombre_persona}" no está habilitado para tomar almuerzo.'
-        return jsonify({'success': False, 'message': mensaje})
+    registros_en_vivo.avisar()
 
-    hoy_inicio = datetime.combine(date.today(), datetime.min.time())
-    registro_existente = Registro.query.filter(Registro.persona_id == id_persona, Registro.fecha_hora_registro >= hoy_inicio).first()
-    if registro_existente:
-        return jsonify({'success': False, 'message': '¡Ya tomó almuerzo hoy!'})
+    return jsonify({'success': True, 'estado': resultado.estado, 'message': resultado.message,
+                    'registro': resultado.registro})
 
-    nuevo_registro = Registro(
-        persona_id=persona.id_persona,
-        tipo_control_id=persona.control_id
-    )
-    db.session.add(nuevo_registro)
-    db.session.commit()
-
-    # === INICIO DE LA LÓGICA CORREGIDA Y MÁS ROBUSTA ===
-    imprime_tickets_enabled = False # Por defecto, no imprimimos (más seguro)
-    imprime_setting = Setting.query.get('IMPRIME_TICKETS')
-    
-    if imprime_setting:
-        # Comparamos el valor de la BD de forma insensible a mayúsculas/minúsculas
-        if imprime_setting.value.lower() == 'true':
-            imprime_tickets_enabled = True
-    # Si 'imprime_setting' no existe, se mantiene en False.
-    # === FIN DE LA LÓGICA CORREGIDA ===
-    # === CAMBIO CLAVE ===
-    # Convertir la hora del nuevo registro a la hora local ANTES de enviarla al frontend
-    hora_local_registro = convert_utc_to_local(nuevo_registro.fecha_hora_registro)
-    registro_data = {
-        'id_registro': nuevo_registro.id_registro,
-        'id_persona': persona.id_persona,
-        'nombre_persona': persona.nombre_persona,
-        'dpto': persona.dpto_ref.nombre_dpto,
-        'tipo_control': persona.control_ref.nombre_control,
-         # Usar la hora local formateada
-        'fecha_hora': hora_local_registro.strftime('%d/%m/%Y %I:%M:%S %p'),
-        'imprime_ticket': imprime_tickets_enabled
-    }
 
-    return jsonify({'success': True, 'message': 'Registro exitoso.', 'registro': registro_data})
+@bp.route('/api/registros/batch', methods=['POST'])
+@login_required
+def registrar_registros_lote():
+    """
+    Check-in por lotes para la cola sin conexión del kiosco. Recibe
+    {"registros": [{"id_persona": ..., "scanned_at": "<ISO 8601>"}, ...]} y
+    devuelve un resultado por escaneo, en el mismo orden.
+    """
+    datos = request.get_json(silent=True)
+    escaneos = datos.get('registros') if isinstance(datos, dict) else datos
+    if not isinstance(escaneos, list) or not all(isinstance(e, dict) for e in escaneos):
+        return jsonify({'success': False, 'message': 'Formato de lote no válido.'}), 400
+    if len(escaneos) > MAX_LOTE_CHECKIN:
+        return jsonify({'success': False, 'message': f'Máximo {MAX_LOTE_CHECKIN} registros por lote.'}), 413
+
+    resultados = registrar_lote([(e.get('id_persona'), e.get('scanned_at')) for e in escaneos])
+    if any(r.success for r in resultados):
+        registros_en_vivo.avisar()
+    return jsonify({
+        'success': True,
+        'resultados': [
+            {
+                'indice': i,
+                'id_persona': escaneo.get('id_persona'),
+                'estado': resultado.estado,
+                'success': resultado.success,
+                'message': resultado.message,
+                'id_registro': resultado.registro['id_registro'] if resultado.success else None,
+            }
+            for i, (escaneo, resultado) in enumerate(zip(escaneos, resultados))
+        ],
+    })
+
+
+@bp.route('/api/roster')
+@login_required
+def roster_kiosco():
+    """
+    Copia compacta de las personas para validar escaneos sin conexión:
+    [id, nombre, departamento, habilitado, tipo de control]. Sólo cambia con
+    la tabla personas o los catálogos, así que el kiosco la revalida con ETag.
+    """
+    version = f'{indice_personas.version_tabla()}|{catalogos.version()}'
+    etag = hashlib.sha1(version.encode('utf-8')).hexdigest()
+    if etag in request.if_none_match:
+        respuesta = Response(status=304)
+    else:
+        personas = []
+        for id_persona, nombre, dpto_id, control_id in db.session.execute(roster_personas()):
+            control = catalogos.tipo_control(control_id).nombre_control
+            personas.append([id_persona, nombre, catalogos.dpto(dpto_id).nombre_dpto,
+                             control.lower() != CONTROL_NO_APLICA, control])
+        respuesta = jsonify({'version': etag, 'personas': personas})
+    respuesta.set_etag(etag)
+    respuesta.cache_control.private = True
+    respuesta.cache_control.no_cache = True
+    return respuesta
+
+@bp.route('/registro/stream')
+@login_required
+def stream_registros():
+    """Check-ins nuevos en tiempo real (Server-Sent Events) para monitores y kioscos."""
+    # Last-Event-ID lo envía EventSource al reconectarse solo; `ultimo`, la página cuando abre una conexión nueva
+    ultimo_evento = request.headers.get('Last-Event-ID', type=int) or request.args.get('ultimo', type=int)
+    try:
+        flujo = registros_en_vivo.transmitir(ultimo_evento)
+    except TransmisionNoDisponible:
+        return Response('Transmisión no disponible', 503, {'Retry-After': '5'}, mimetype='text/plain')
+    respuesta = Response(flujo, mimetype='text/event-stream')
+    respuesta.cache_control.no_cache = True
+    # Nginx no debe acumular el flujo en su búfer
+    respuesta.headers['X-Accel-Buffering'] = 'no'
+    return respuesta
 
 @bp.route('/imprimir_ticket/<int:id_registro>')
 @login_required
 def imprimir_ticket(id_registro):
-    registro = Registro.query.get_or_404(id_registro)
-    persona = registro.persona_ref
-    
-    # === CAMBIO CLAVE ===
+    ticket, fecha_hora_str, texto_qr = _datos_ticket(id_registro)
+    # El QR se pide aparte (qr_ticket) para que el navegador lo guarde en caché;
+    # la huella del contenido en la URL cambia si cambian los datos del ticket
+    qr_url = url_for('main.qr_ticket', id_registro=id_registro, v=_huella_qr(texto_qr))
+
+    # El nombre del colegio sale de la caché de configuración (sin consultar la BD)
+    return render_template('ticket.html',
+                           ticket=ticket,
+                           fecha_hora=fecha_hora_str,
+                           qr_url=qr_url,
+                           nombre_colegio=settings_cache.nombre_colegio)
+
+
+@bp.route('/imprimir_ticket/<int:id_registro>/qr.svg')
+@login_required
+def qr_ticket(id_registro):
+    """Código QR del ticket como SVG, cacheable por el navegador."""
+    _, _, texto_qr = _datos_ticket(id_registro)
+    etag = _huella_qr(texto_qr)
+    if etag in request.if_none_match:
+        respuesta = Response(status=304)
+    else:
+        respuesta = Response(generate_qr_svg(texto_qr), mimetype='image/svg+xml')
+    respuesta.set_etag(etag)
+    respuesta.cache_control.private = True
+    if request.args.get('v') == etag:
+        # URL con la huella del contenido: nunca cambia, se guarda un año
+        respuesta.cache_control.max_age = 365 * 24 * 3600
+        respuesta.cache_control.immutable = True
+    else:
+        respuesta.cache_control.no_cache = True
+    return respuesta
+
+
+def _datos_ticket(id_registro):
+    """Fila del ticket (una consulta), su fecha local formateada y el texto del QR."""
+    ticket = db.session.execute(datos_ticket(id_registro)).first()
+    if ticket is None:
+        abort(404)
+
     # Convertir la hora del registro a hora local
-    hora_local_registro = convert_utc_to_local(registro.fecha_hora_registro)
-    fecha_hora_str = hora_local_registro.strftime('%d/%m/%Y %I:%M:%S %p')
-    
-    ticket_data_str = (
-        f"ID: {persona.id_persona}\n"
-        f"Nombre: {persona.nombre_persona}\n"
-        f"Dpto: {persona.dpto_ref.nombre_dpto}\n"
-        f"Control: {registro.tipo_control_ref.nombre_control}\n"
+    timezone_str = current_app.config.get('TIMEZONE', 'America/Bogota')
+    fecha_hora_str = convert_utc_to_local(ticket.fecha_hora_registro, timezone_str).strftime('%d/%m/%Y %I:%M:%S %p')
+    texto_qr = (
+        f"ID: {ticket.id_persona}\n"
+        f"Nombre: {ticket.nombre_persona}\n"
+        f"Dpto: {catalogos.dpto(ticket.dpto_id).nombre_dpto}\n"
+        f"Control: {catalogos.tipo_control(ticket.tipo_control_id).nombre_control}\n"
         f"Fecha: {fecha_hora_str}"
     )
-    
-    qr_code_b64 = generate_qr_code(ticket_data_str)
-    # === CAMBIO CLAVE: Leer el nombre del colegio desde la BD ===
-    nombre_colegio_setting = Setting.query.get('NOMBRE_COLEGIO')
-    nombre_colegio = nombre_colegio_setting.value if nombre_colegio_setting else "Colegio Privado"
-    # =========================================================
+    return ticket, fecha_hora_str, texto_qr
 
-    return render_template('ticket.html',
-                           registro=registro,
-                           persona=persona,
-                           fecha_hora=fecha_hora_str,
-                           qr_code=qr_code_b64,
-                           nombre_colegio=nombre_colegio)
+
+def _huella_qr(texto_qr):
+    return hashlib.blake2b(texto_qr.encode('utf-8'), digest_size=8).hexdigest()
 
 # --- Rutas de Administración (CRUDs) ---
 
+def _invalidar_catalogo(model):
+    """Invalida la caché de catálogos si el modelo es uno de ellos."""
+    if model.__tablename__ in CATALOGO_POR_TABLA:
+        catalogos.invalidar()
+
 # CRUD Genérico para modelos simples (VERSIÓN CORREGIDA)
 def crud_view_factory(model, form_class, template_name, list_title, form_title_singular):
     
@@ -219,6 +296,7 @@ def crud_view_factory(model, form_class, template_name, list_title, form_title_s
                 flash(f'{form_title_singular} creado correctamente!', 'success')
             
             db.session.commit()
+            _invalidar_catalogo(model)
         else:
             # Si la validación falla, mostrar los errores
             for field, errors in form.errors.items():
@@ -235,6 +313,7 @@ def crud_view_factory(model, form_class, template_name, list_title, form_title_s
         item = model.query.get_or_404(item_id)
         db.session.delete(item)
         db.session.commit()
+        _invalidar_catalogo(model)
         flash(f'{form_title_singular} eliminado.', 'success')
         return redirect(url_for(f'main.list_{model.__tablename__}'))
 
@@ -253,44 +332,63 @@ tipos_persona_list, tipos_persona_save, tipos_persona_delete = crud_view_factory
 
 # --- CRUD para Personas (es más complejo) ---
 def save_picture(form_picture, foto_webcam_data):
+    """
+    Guarda la foto subida o capturada con la cámara en todas sus variantes (ver
+    fotos.py). Lanza FotoInvalida si no es una imagen válida o es demasiado grande.
+    """
     if foto_webcam_data:
-        # Decodificar imagen de base64
-        header, encoded = foto_webcam_data.split(",", 1)
-        image_data = base64.b64decode(encoded)
-        image_stream = BytesIO(image_data)
-        img = Image.open(image_stream)
-        
-        random_hex = secrets.token_hex(8)
-        _, f_ext = os.path.splitext('webcam.png') # Asumimos png
-        picture_fn = random_hex + f_ext
-        picture_path = os.path.join(current_app.root_path, current_app.config['UPLOAD_FOLDER'], picture_fn)
-
-        output_size = (250, 250)
-        img.thumbnail(output_size)
-        img.save(picture_path)
-
-        return picture_fn
-
+        return procesador_fotos.guardar(data_url=foto_webcam_data)
     elif form_picture:
-        random_hex = secrets.token_hex(8)
-        _, f_ext = os.path.splitext(form_picture.filename)
-        picture_fn = random_hex + f_ext
-        picture_path = os.path.join(current_app.root_path, current_app.config['UPLOAD_FOLDER'], picture_fn)
+        return procesador_fotos.guardar(archivo=form_picture)
+    return None
 
-        output_size = (250, 250)
-        i = Image.open(form_picture)
-        i.thumbnail(output_size)
-        i.save(picture_path)
+def _filtros_personas():
+    """Lee los filtros del listado de personas desde la query string."""
+    return {
+        'q': request.args.get('q', '').strip() or None,
+        'dpto_id': request.args.get('dpto', type=int),
+        'tipo_persona_id': request.args.get('tipo_persona', type=int),
+        'control_id': request.args.get('control', type=int),
+    }
 
-        return picture_fn
-    return None
+def _persona_json(persona):
+    return {
+        'id_persona': persona.id_persona,
+        'nombre_persona': persona.nombre_persona,
+        # Variantes de 48 px (128 px en pantallas 2x), como en la plantilla
+        'foto_url': foto_url(persona.foto, 48),
+        'foto_srcset': foto_srcset(persona.foto, 48),
+        'foto_srcset_webp': foto_srcset(persona.foto, 48, 'webp'),
+        'tipo_persona': catalogos.tipo_persona(persona.tipo_persona_id).nombre_tipopersona,
+        'dpto': catalogos.dpto(persona.dpto_id).nombre_dpto,
+        'edit_url': url_for('main.editar_persona', id_persona=persona.id_persona),
+        'delete_url': url_for('main.delete_persona', id_persona=persona.id_persona),
+    }
 
 @bp.route('/personas')
 @login_required
 @admin_required
 def list_personas():
-    personas = Persona.query.all()
-    return render_template('admin/personas.html', title='Personas', personas=personas)
+    # Primera página paginada por keyset; las siguientes las pide la tabla a /personas/pagina
+    filtros = _filtros_personas()
+    personas, siguiente = pagina_personas(cursor=request.args.get('cursor'), **filtros)
+    return render_template('admin/personas.html', title='Personas', personas=personas,
+                           siguiente=siguiente, filtros=filtros,
+                           dptos=catalogos.listar('dptos'),
+                           tipos_persona=catalogos.listar('tipos_persona'),
+                           tipos_control=catalogos.listar('tipos_control'))
+
+@bp.route('/personas/pagina')
+@login_required
+@admin_required
+def personas_pagina():
+    """Endpoint JSON con la misma paginación que /personas, para carga incremental."""
+    personas, siguiente = pagina_personas(
+        limite=request.args.get('limite', 50, type=int),
+        cursor=request.args.get('cursor'),
+        **_filtros_personas()
+    )
+    return jsonify({'personas': [_persona_json(p) for p in personas], 'siguiente': siguiente})
 
 # app/routes.py
 
@@ -312,7 +410,11 @@ def nueva_persona():
             return render_template('admin/form_persona.html', title='Nueva Persona', form=form, legend='Nueva Persona')
 
         # Procesar y guardar la foto
-        picture_file = save_picture(form.foto.data, form.foto_webcam.data)
+        try:
+            picture_file = save_picture(form.foto.data, form.foto_webcam.data)
+        except FotoInvalida as e:
+            flash(str(e), 'danger')
+            return render_template('admin/form_persona.html', title='Nueva Persona', form=form, legend='Nueva Persona')
 
         # Crear la nueva instancia de Persona
         nueva_persona = Persona(
@@ -329,6 +431,7 @@ def nueva_persona():
         
         db.session.add(nueva_persona)
         db.session.commit()
+        indice_personas.invalidar()
         
         flash('Persona creada exitosamente!', 'success')
         return redirect(url_for('main.list_personas'))
@@ -346,10 +449,10 @@ def editar_persona(id_persona):
     form = PersonaForm(obj=persona)
     
     if request.method == 'GET':
-        # Pre-poblar los campos de selección con los objetos correctos
-        form.dpto.data = persona.dpto_ref
-        form.tipo_persona.data = persona.tipo_persona_ref
-        form.control.data = persona.control_ref
+        # Pre-poblar los campos de selección con los elementos del catálogo en memoria
+        form.dpto.data = catalogos.dpto(persona.dpto_id)
+        form.tipo_persona.data = catalogos.tipo_persona(persona.tipo_persona_id)
+        form.control.data = catalogos.tipo_control(persona.control_id)
     
     # Quitar el validador de unicidad para la edición
     del form.id_persona.validators[-1]
@@ -357,9 +460,18 @@ def editar_persona(id_persona):
     if form.validate_on_submit():
         # Actualizar la foto si se proporcionó una nueva
         if form.foto.data or form.foto_webcam.data:
-            picture_file = save_picture(form.foto.data, form.foto_webcam.data)
-            persona.foto = picture_file
+            try:
+                persona.foto = save_picture(form.foto.data, form.foto_webcam.data)
+            except FotoInvalida as e:
+                flash(str(e), 'danger')
+                form.id_persona.render_kw = {'readonly': True}
+                return render_template('admin/form_persona.html', title='Editar Persona', form=form,
+                                       legend=f'Editar Persona: {persona.nombre_persona}')
         
+        # El índice de búsqueda guarda nombre y departamento; la copia del kiosco, además, el tipo de control
+        cambia_busqueda = ((persona.nombre_persona, persona.dpto_id, persona.control_id)
+                           != (form.nombre_persona.data, form.dpto.data.id_dpto, form.control.data.id_control))
+
         # === SOLUCIÓN CLAVE: Actualizar el objeto 'persona' existente ===
         # En lugar de crear uno nuevo, modificamos el que cargamos de la sesión.
         persona.nombre_persona = form.nombre_persona.data
@@ -369,6 +481,8 @@ def editar_persona(id_persona):
         persona.control_id = form.control.data.id_control
         
         db.session.commit()
+        if cambia_busqueda:
+            indice_personas.invalidar()
         flash('Persona actualizada exitosamente!', 'success')
         return redirect(url_for('main.list_personas'))
     
@@ -383,14 +497,15 @@ def editar_persona(id_persona):
 def delete_persona(id_persona):
     persona = Persona.query.get_or_404(id_persona)
     # === LA SOLUCIÓN ESTÁ AQUÍ ===
-    # Contamos cuántos registros tiene esta persona.
-    # El método .count() es muy eficiente para esto.
-    if persona.registros: # SQLAlchemy evalúa esto eficientemente
+    # Comprobamos con un EXISTS indexado si la persona tiene registros,
+    # sin cargar la lista completa de registros.
+    if db.session.execute(persona_tiene_registros(id_persona)).scalar():
         flash(f'No se puede eliminar a "{persona.nombre_persona}" porque tiene registros de almuerzo asociados.', 'danger')
     else:
         # Si no tiene registros, procedemos con la eliminación.
         db.session.delete(persona)
         db.session.commit()
+        indice_personas.invalidar()
         flash(f'Persona "{persona.nombre_persona}" eliminada correctamente.', 'success')
     # ============================
     return redirect(url_for('main.list_personas'))
@@ -457,40 +572,43 @@ def reportes():
         fecha_inicio = request.form.get('fecha_inicio')
         fecha_fin = request.form.get('fecha_fin')
         filtro_id = request.form.get('filtro_id')
-        
-        # Construir la consulta base
-        query = Registro.query
-        
-        # Filtros de fecha
-        if fecha_inicio:
-            query = query.filter(Registro.fecha_hora_registro >= datetime.strptime(fecha_inicio, '%Y-%m-%d'))
-        if fecha_fin:
-            # Añadir un día para incluir todo el día de fin
-            fecha_fin_dt = datetime.strptime(fecha_fin, '%Y-%m-%d')
-            query = query.filter(Registro.fecha_hora_registro < fecha_fin_dt.replace(day=fecha_fin_dt.day + 1))
-        
-        # Filtros específicos
-        if tipo_reporte == 'persona' and filtro_id:
-            query = query.filter(Registro.persona_id == filtro_id)
-        elif tipo_reporte == 'tipo_control' and filtro_id:
-            query = query.filter(Registro.tipo_control_id == filtro_id)
-        elif tipo_reporte == 'dpto' and filtro_id:
-            query = query.join(Persona).filter(Persona.dpto_id == filtro_id)
-        elif tipo_reporte == 'tipo_persona' and filtro_id:
-            query = query.join(Persona).filter(Persona.tipo_persona_id == filtro_id)
-            
-        resultados = query.order_by(Registro.fecha_hora_registro.desc()).all()
-        
-        return render_template('reports/ver_reporte.html',
-                               resultados=resultados,
-                               tipo_reporte=tipo_reporte,
-                               title='Resultados del Reporte')
+        formato = request.form.get('formato', 'html')
+
+        # Los resúmenes agregados tienen su propia URL (enlazable y con salida JSON)
+        if tipo_reporte and tipo_reporte.startswith('resumen_'):
+            return redirect(url_for('main.resumen_reporte', tipo=tipo_reporte[len('resumen_'):],
+                                    fecha_inicio=fecha_inicio or None, fecha_fin=fecha_fin or None,
+                                    formato=formato if formato != 'html' else None))
+
+        # Generador sobre un cursor del servidor: nada se materializa con .all()
+        filas = filas_reporte(tipo_reporte, parse_fecha(fecha_inicio), parse_fecha(fecha_fin), filtro_id)
+        nombre_archivo = secure_filename(f"reporte_{tipo_reporte}_{datetime.now():%Y%m%d_%H%M}")
+
+        if formato == 'csv':
+            return Response(
+                stream_with_context(generar_csv(filas)),
+                mimetype='text/csv',
+                headers={'Content-disposition': f'attachment; filename={nombre_archivo}.csv'}
+            )
+        if formato == 'xlsx':
+            return Response(
+                stream_with_context(generar_xlsx(filas)),
+                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                headers={'Content-disposition': f'attachment; filename={nombre_archivo}.xlsx'}
+            )
+
+        return Response(en_bloques(stream_template('reports/ver_reporte.html',
+                                                   resultados=filas,
+                                                   tipo_reporte=tipo_reporte or 'general',
+                                                   filtros=request.form,
+                                                   title='Resultados del Reporte')),
+                        mimetype='text/html')
 
     # Para el método GET, mostrar el selector
     personas = Persona.query.order_by(Persona.nombre_persona).all()
-    tipos_control = TipoControl.query.all()
-    dptos = Dpto.query.all()
-    tipos_persona = TipoPersona.query.all()
+    tipos_control = catalogos.listar('tipos_control')
+    dptos = catalogos.listar('dptos')
+    tipos_persona = catalogos.listar('tipos_persona')
     return render_template('reports/selector_reportes.html',
                            title='Generar Reportes',
                            personas=personas,
@@ -498,6 +616,47 @@ def reportes():
                            dptos=dptos,
                            tipos_persona=tipos_persona)
 
+@bp.route('/reportes/resumen/<tipo>')
+@login_required
+def resumen_reporte(tipo):
+    """Resúmenes calculados con GROUP BY en la BD: tabla HTML, JSON, CSV o XLSX."""
+    if tipo not in RESUMENES:
+        flash('Tipo de resumen no válido.', 'danger')
+        return redirect(url_for('main.reportes'))
+
+    formato = request.args.get('formato', 'html')
+    resumen, fecha_inicio, fecha_fin = generar_resumen(
+        tipo, parse_fecha(request.args.get('fecha_inicio')), parse_fecha(request.args.get('fecha_fin'))
+    )
+
+    if formato == 'json':
+        return jsonify({
+            'tipo': tipo,
+            'titulo': resumen.titulo,
+            'fecha_inicio': fecha_inicio.isoformat(),
+            'fecha_fin': fecha_fin.isoformat(),
+            'columnas': resumen.columnas,
+            'filas': resumen.filas,
+            'totales': resumen.totales,
+        })
+
+    filas = resumen.filas + ([resumen.totales] if resumen.totales else [])
+    nombre_archivo = f'resumen_{tipo}_{fecha_inicio:%Y%m%d}_{fecha_fin:%Y%m%d}'
+    if formato == 'csv':
+        return Response(generar_csv(filas, resumen.columnas), mimetype='text/csv',
+                        headers={'Content-disposition': f'attachment; filename={nombre_archivo}.csv'})
+    if formato == 'xlsx':
+        return Response(generar_xlsx(filas, 'Resumen', resumen.columnas),
+                        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                        headers={'Content-disposition': f'attachment; filename={nombre_archivo}.xlsx'})
+
+    return render_template('reports/ver_resumen.html',
+                           title=resumen.titulo,
+                           tipo=tipo,
+                           resumen=resumen,
+                           fecha_inicio=fecha_inicio,
+                           fecha_fin=fecha_fin)
+
 # app/routes.py (al final del archivo)
 
 # --- Rutas de Importación CSV ---
@@ -560,96 +719,47 @@ def importar_csv(modelo):
             return redirect(request.url)
 
         try:
-            raw_bytes = file.stream.read()
-            decoded_string = ""
-            try:
-                decoded_string = raw_bytes.decode('utf-8-sig')
-            except UnicodeDecodeError:
-                decoded_string = raw_bytes.decode('latin-1')
-            
-            stream = io.StringIO(decoded_string, newline=None)
-
-            # === INICIO DE LA MODIFICACIÓN: LÓGICA CONDICIONAL PARA EL LECTOR CSV ===
-            if modelo == 'dptos':
-                # Para archivos de una sola columna (dptos), no usamos Sniffer.
-                csv_reader = csv.reader(stream)
+            # Decodificación por partes: la codificación y el separador se detectan
+            # en los primeros KB (para dptos, de una sola columna, no usamos Sniffer)
+            if modelo == 'personas':
+                # Las personas se importan en segundo plano: se guarda el archivo y
+                # aquí sólo se lee la cabecera
+                id_trabajo, ruta = trabajos.guardar_subida(file)
+                with open(ruta, 'rb') as f:
+                    header_from_file = next(abrir_csv(f), [])
             else:
-                # Para archivos multi-columna (personas), el Sniffer es útil.
-                try:
-                    dialect = csv.Sniffer().sniff(stream.read(2048)) # Aumentamos un poco el tamaño de la muestra
-                    stream.seek(0)
-                except csv.Error:
-                    # Si el Sniffer falla (ej. archivo vacío o de una columna), asumimos comas.
-                    dialect = 'excel'
-                csv_reader = csv.reader(stream, dialect)
-            # === FIN DE LA MODIFICACIÓN ===
-            
-            header_from_file = next(csv_reader)
+                csv_reader = abrir_csv(file.stream, detectar_dialecto=False)
+                header_from_file = next(csv_reader, [])
             cleaned_header = [h.strip() for h in header_from_file]
 
             if cleaned_header != config[modelo]['headers']:
+                if modelo == 'personas':
+                    os.remove(ruta)
                 flash(f"La cabecera del archivo es incorrecta. Debería ser: {', '.join(config[modelo]['headers'])}", 'danger')
                 return render_template('admin/importar.html', title=f"Importar {modelo.capitalize()}", modelo=modelo, errors=[])
-            
-            # --- El resto de tu código de validación y upsert no necesita ningún cambio ---
+
+            if modelo == 'personas':
+                # Validación y upsert por lotes en un hilo (ver importacion.py y trabajos.py)
+                trabajos.enviar(id_trabajo, 'personas', trabajo_csv_personas, ruta, descripcion=file.filename,
+                                simular=bool(request.form.get('simular')))
+                return redirect(url_for('main.importar_csv', modelo=modelo, trabajo=id_trabajo))
+
             errors = []
             created_count = 0
             updated_count = 0
             
             if modelo == 'dptos':
-                existing_dptos = {d.nombre_dpto for d in Dpto.query.all()}
-
-            elif modelo == 'personas':
-                existing_persons_map = {p.id_persona: p for p in Persona.query.all()}
-                dptos_map = {d.nombre_dpto: d.id_dpto for d in Dpto.query.all()}
-                tipos_persona_map = {tp.nombre_tipopersona: tp.id_tipopersona for tp in TipoPersona.query.all()}
-                tipos_control_map = {tc.nombre_control: tc.id_control for tc in TipoControl.query.all()}
-                ids_in_file = set()
-
-            for i, row in enumerate(csv_reader, start=2):
-                row_errors = [] 
-                
-                if modelo == 'dptos':
+                existing_dptos = set(catalogos.mapa_nombres('dptos'))
+                for i, row in enumerate(csv_reader, start=2):
+                    row_errors = [] 
                     if len(row) != 1 or not row[0]: row_errors.append("Formato incorrecto o nombre de departamento vacío.")
                     elif row[0].strip() in existing_dptos: row_errors.append(f"El departamento '{row[0].strip()}' ya existe.")
                     if not row_errors:
                         db.session.add(Dpto(nombre_dpto=row[0].strip()))
                         existing_dptos.add(row[0].strip())
                         created_count += 1
-                elif modelo == 'personas':
-                    if len(row) != 6:
-                        row_errors.append(f"La fila debe tener 6 columnas, pero tiene {len(row)}.")
-                    else:
-                        id_p, nombre, sexo, dpto_n, tipo_p_n, control_n = [field.strip() for field in row]
-                        
-                        if not all([id_p, nombre, sexo, dpto_n, tipo_p_n, control_n]): row_errors.append(f"ID '{id_p}': Todos los campos son obligatorios.")
-                        if id_p in ids_in_file: row_errors.append(f"ID '{id_p}': está duplicado dentro del mismo archivo CSV.")
-                        if sexo.upper() not in ['M', 'F']: row_errors.append(f"ID '{id_p}': El sexo ('{sexo}') debe ser 'M' o 'F'.")
-                        if dpto_n not in dptos_map: row_errors.append(f"ID '{id_p}': El departamento '{dpto_n}' no es válido.")
-                        if tipo_p_n not in tipos_persona_map: row_errors.append(f"ID '{id_p}': El tipo de persona '{tipo_p_n}' no es válido.")
-                        if control_n not in tipos_control_map: row_errors.append(f"ID '{id_p}': El tipo de control '{control_n}' no es válido.")
-                        
-                        if not row_errors:
-                            ids_in_file.add(id_p)
-                            
-                            if id_p in existing_persons_map:
-                                person_to_update = existing_persons_map[id_p]
-                                person_to_update.nombre_persona = nombre
-                                person_to_update.sexo = sexo.upper()
-                                person_to_update.dpto_id = dptos_map[dpto_n]
-                                person_to_update.tipo_persona_id = tipos_persona_map[tipo_p_n]
-                                person_to_update.control_id = tipos_control_map[control_n]
-                                updated_count += 1
-                            else:
-                                new_person = Persona(
-                                    id_persona=id_p, nombre_persona=nombre, sexo=sexo.upper(),
-                                    dpto_id=dptos_map[dpto_n], tipo_persona_id=tipos_persona_map[tipo_p_n], control_id=tipos_control_map[control_n]
-                                )
-                                db.session.add(new_person)
-                                created_count += 1
-                
-                if row_errors:
-                    errors.extend([f"Fila {i}: {e}" for e in row_errors])
+                    if row_errors:
+                        errors.extend([f"Fila {i}: {e}" for e in row_errors])
 
             if errors:
                 db.session.rollback()
@@ -661,18 +771,61 @@ def importar_csv(modelo):
 
             else:
                 db.session.commit()
+                if modelo == 'dptos':
+                    catalogos.invalidar()
                 success_message = []
                 if created_count > 0: success_message.append(f"{created_count} personas creadas")
                 if updated_count > 0: success_message.append(f"{updated_count} personas actualizadas")
                 flash(f"Importación exitosa: {', '.join(success_message)}.", 'success')
                 return redirect(url_for(config[modelo]['list_route']))
 
+        except UnicodeDecodeError:
+            db.session.rollback()
+            flash('El archivo tiene caracteres que no se pueden leer con la codificación detectada. Guárdelo como CSV UTF-8 e inténtelo de nuevo.', 'danger')
+            return redirect(request.url)
         except Exception as e:
             db.session.rollback()
             flash(f'Ocurrió un error inesperado al procesar el archivo: {e}', 'danger')
             return redirect(request.url)
 
-    return render_template('admin/importar.html', title=f"Importar {modelo.capitalize()}", modelo=modelo)
+    return render_template('admin/importar.html', title=f"Importar {modelo.capitalize()}", modelo=modelo,
+                           trabajo=request.args.get('trabajo'))
+
+
+# Tipo de trabajo -> (función de importación, página que muestra su progreso)
+IMPORTACIONES = {
+    'personas': (trabajo_csv_personas, lambda id_trabajo: url_for('main.importar_csv', modelo='personas', trabajo=id_trabajo)),
+    'estudiantes': (trabajo_excel_estudiantes, lambda id_trabajo: url_for('main.importar_estudiantes_excel', trabajo=id_trabajo)),
+}
+
+
+@bp.route('/admin/trabajos/<id_trabajo>')
+@login_required
+@admin_required
+def estado_trabajo(id_trabajo):
+    """Progreso de una importación en segundo plano (lo consulta la página cada segundo)."""
+    estado = trabajos.estado(id_trabajo)
+    if estado is None:
+        return jsonify({'error': 'Trabajo no encontrado.'}), 404
+    return jsonify(estado)
+
+
+@bp.route('/admin/trabajos/<id_trabajo>/aplicar', methods=['POST'])
+@login_required
+@admin_required
+def aplicar_trabajo(id_trabajo):
+    """Aplica una simulación de importación: encola la importación real con el mismo archivo."""
+    estado = trabajos.estado(id_trabajo)
+    if estado is None or estado['tipo'] not in IMPORTACIONES:
+        flash('La simulación no existe o ha caducado.', 'warning')
+        return redirect(url_for('main.list_personas'))
+
+    funcion, pagina = IMPORTACIONES[estado['tipo']]
+    nuevo_id = trabajos.aplicar(id_trabajo, funcion)
+    if nuevo_id is None:
+        flash('Esta simulación ya se aplicó o no se puede aplicar. Sube el archivo de nuevo.', 'warning')
+        return redirect(pagina(None))
+    return redirect(pagina(nuevo_id))
 
 # app/routes.py (añadir al final del archivo)
 
@@ -682,11 +835,14 @@ def importar_csv(modelo):
 def delete_registro(id_registro):
     """Elimina un registro de almuerzo específico. Solo para administradores."""
     registro = Registro.query.get_or_404(id_registro)
+    # Se lee antes del commit: después el registro borrado ya no puede cargar su persona
+    mensaje = f'Registro de {registro.persona_ref.nombre_persona} a las {registro.fecha_hora_registro.strftime("%H:%M:%S")} ha sido eliminado.'
     
+    restar_registro(registro)
     db.session.delete(registro)
     db.session.commit()
     
-    flash(f'Registro de {registro.persona_ref.nombre_persona} a las {registro.fecha_hora_registro.strftime("%H:%M:%S")} ha sido eliminado.', 'success')
+    flash(mensaje, 'success')
     
     # Redirigir al usuario a la página desde la que vino (ya sea el registro o un reporte)
     return redirect(request.referrer or url_for('main.registro_almuerzo'))
@@ -714,11 +870,14 @@ def settings():
             if file and file.filename != '':
                 # Validar extensión
                 allowed_extensions = {'png', 'jpg', 'jpeg', 'svg'}
-                if '.' in file.filename and file.filename.rsplit('.', 1)[1].lower() in allowed_extensions:
-                    # Guardar el archivo de forma segura
-                    filename = secure_filename(file.filename)
-                    logo_path = os.path.join(current_app.root_path, 'static/logos', filename)
-                    file.save(logo_path)
+                extension = file.filename.rsplit('.', 1)[1].lower() if '.' in file.filename else ''
+                if extension in allowed_extensions:
+                    # El nombre es el hash del contenido: un logo nuevo nunca reutiliza la URL
+                    # de otro, así los navegadores pueden guardarlo en caché sin revalidar
+                    contenido = file.read()
+                    filename = f'{hashlib.blake2b(contenido, digest_size=8).hexdigest()}.{extension}'
+                    with open(os.path.join(current_app.static_folder, 'logos', filename), 'wb') as f:
+                        f.write(contenido)
                     
                     # Actualizar la entrada en la base de datos
                     logo_setting = Setting.query.get('LOGO_FILENAME')
@@ -730,14 +889,16 @@ def settings():
                     flash('Formato de archivo de logo no permitido. Usa png, jpg, jpeg o svg.', 'danger')
 
         db.session.commit()
+        # Invalida la caché de configuración en este y en los demás workers
+        settings_cache.invalidar()
         flash('Configuración guardada exitosamente.', 'success')
         return redirect(url_for('main.settings'))
 
-    # Para peticiones GET (no cambia)
-    settings_from_db = Setting.query.all()
-    settings_dict = {setting.key: setting.value for setting in settings_from_db}
+    # Para peticiones GET
+    settings_dict = settings_cache.todos()
     
-    return render_template('admin/settings.html', title='Configuración General', settings=settings_dict)
+    return render_template('admin/settings.html', title='Configuración General', settings=settings_dict,
+                           cache_stats=settings_cache.estadisticas())
 
 # app/routes.py (añadir al final del archivo)
 
@@ -820,35 +981,22 @@ def backup_download():
         flash('La configuración de la base de datos no es válida para esta operación.', 'danger')
         return redirect(url_for('main.backup_restore'))
 
+    timestamp = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+    backup_filename = f"backup_{timestamp}.sql.gz"
     try:
-        timestamp = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
-        backup_filename = f"backup_{timestamp}.sql.gz"
-        
-        mysqldump_cmd = current_app.config['MYSQLDUMP_PATH']
-        gzip_cmd = current_app.config['GZIP_PATH']
-
-        command = (
-            f"{mysqldump_cmd} --user={db_config['user']} --password='{db_config['password']}' "
-            f"--host={db_config['host']} --single-transaction --routines --triggers "
-            f"{db_config['database']} | {gzip_cmd}"
-        )
-        
-        process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        stdout, stderr = process.communicate()
-
-        if process.returncode != 0:
-            raise RuntimeError(f"Error al generar el backup: {stderr.decode('utf-8')}")
-
-        return Response(
-            stdout,
-            mimetype="application/gzip",
-            headers={"Content-disposition": f"attachment; filename={backup_filename}"}
-        )
-        
+        # Los errores de arranque (credenciales, BD inexistente) llegan aquí, antes de enviar nada
+        bloques = volcado_comprimido(db_config, current_app.config['MYSQLDUMP_PATH'], current_app.config['GZIP_PATH'])
     except Exception as e:
         flash(f'Error inesperado al generar la descarga: {e}', 'danger')
         return redirect(url_for('main.backup_restore'))
 
+    # El dump se envía en bloques a medida que mysqldump lo produce (ver backups.py)
+    return Response(
+        bloques,
+        mimetype="application/gzip",
+        headers={"Content-disposition": f"attachment; filename={backup_filename}"}
+    )
+
 
 @bp.route('/admin/restore/upload', methods=['POST'])
 @login_required
@@ -884,6 +1032,9 @@ def restore_from_upload():
         if process.returncode != 0:
             raise RuntimeError(f"Error al restaurar: {stderr}")
 
+        settings_cache.invalidar()
+        catalogos.invalidar()
+        indice_personas.invalidar()
         flash('Restauración desde archivo local completada.', 'success')
         flash('IMPORTANTE: Puede ser necesario reiniciar la aplicación para que todos los cambios surtan efecto.', 'warning')
             
@@ -924,6 +1075,9 @@ def restore_from_server():
         )
         
         _run_mysql_command(command)
+        settings_cache.invalidar()
+        catalogos.invalidar()
+        indice_personas.invalidar()
         flash(f'Restauración desde "{backup_filename}" completada.', 'success')
         flash('IMPORTANTE: Puede ser necesario reiniciar la aplicación para que todos los cambios surtan efecto.', 'warning')
             
@@ -936,34 +1090,46 @@ def restore_from_server():
 
 # ... (tus otras rutas) ...
 
+# El navegador reutiliza una búsqueda repetida durante este tiempo sin preguntar
+SEGUNDOS_CACHE_BUSQUEDA = 30
+
+
 @bp.route('/buscar_persona')
 @login_required
 def buscar_persona():
     """Endpoint de API para buscar personas por nombre."""
     search_term = request.args.get('q', '').strip()
 
-    # Evitar búsquedas vacías o muy cortas para no sobrecargar la BD
+    # Evitar búsquedas vacías o muy cortas (devolverían casi todo el listado)
     if len(search_term) < 3:
         return jsonify([])
 
-    # Buscar personas cuyo nombre contenga el término de búsqueda (insensible a mayúsculas)
-    # Usamos ilike para compatibilidad con PostgreSQL y otros dialectos.
-    personas_encontradas = Persona.query.filter(
-        Persona.nombre_persona.ilike(f"%{search_term}%")
-    ).order_by(Persona.nombre_persona).limit(20).all()
+    # El resultado sólo cambia con el índice de personas o con los nombres de los
+    # departamentos: si el navegador ya lo tiene, se responde 304 sin buscar
+    version = f'{indice_personas.version()}|{catalogos.version()}|{normalizar(search_term)}'
+    etag = hashlib.sha1(version.encode('utf-8')).hexdigest()
+    if etag in request.if_none_match:
+        respuesta = Response(status=304)
+    else:
+        # Índice de trigramas en memoria, sin distinguir mayúsculas ni tildes (ver indice_personas.py)
+        respuesta = jsonify(_resultados_busqueda(indice_personas.buscar(search_term, limite=20)))
+    respuesta.set_etag(etag)
+    respuesta.cache_control.private = True
+    respuesta.cache_control.max_age = SEGUNDOS_CACHE_BUSQUEDA
+    return respuesta
+
 
-    # Formatear los resultados para la respuesta JSON
-    resultados = [
+def _resultados_busqueda(personas_encontradas):
+    """Resultados de la búsqueda en el formato JSON que usa el kiosco."""
+    return [
         {
             'id_persona': p.id_persona,
             'nombre_persona': p.nombre_persona,
-            'dpto': p.dpto_ref.nombre_dpto
+            'dpto': catalogos.dpto(p.dpto_id).nombre_dpto
         }
         for p in personas_encontradas
     ]
 
-    return jsonify(resultados)
-
 # app/routes.py
 
 
@@ -985,105 +1151,19 @@ def importar_estudiantes_excel():
             return redirect(request.url)
 
         try:
-            updated_count = 0
-            created_count = 0
-            errors = []
-            
-            workbook = load_workbook(file)
-            sheet = workbook.active
-
-            tipos_persona_map = {tp.nombre_tipopersona: tp for tp in TipoPersona.query.all()}
-            dptos_map = {d.nombre_dpto: d for d in Dpto.query.all()}
-            tipos_control_map = {tc.nombre_control: tc for tc in TipoControl.query.all()}
-            
-            required_keys = ['Estudiante', 'Almuerzo Regular', 'Dieta Especial', 'No Aplica']
-            if any(key not in (list(tipos_persona_map.keys()) + list(tipos_control_map.keys())) for key in required_keys if key != 'Estudiante'):
-                 errors.append("Asegúrese de que los tipos de persona/control 'Estudiante', 'Almuerzo Regular', 'Dieta Especial' y 'No Aplica' existan en la base de datos.")
-
-            if errors:
-                return render_template('admin/importar_estudiantes_excel.html', title="Actualizar Estudiantes", errors=errors)
-
-            for i, row in enumerate(sheet.iter_rows(min_row=2, values_only=True), start=2):
-                if not any(row): continue # Saltar filas completamente vacías
-                seccion, nombre_raw, grupos, id_persona, sexo_raw = row[0:5]
-
-                if not id_persona or not nombre_raw:
-                    errors.append(f"Fila {i}: Faltan el ID o el Nombre del estudiante. Se omitirá esta fila.")
-                    continue
-                
-                id_persona = str(id_persona).strip()
-                
-                try:
-                    apellido, nombre = [part.strip() for part in nombre_raw.split(',', 1)]
-                    nombre_formateado = f"{nombre} {apellido}"
-                except (ValueError, TypeError):
-                    nombre_formateado = str(nombre_raw).strip() if nombre_raw else ''
-                
-                sexo = 'M' if sexo_raw and 'MASCULINO' in str(sexo_raw).upper() else 'F'
-                
-                seccion_obj = dptos_map.get(str(seccion).strip()) if seccion else None
-                if not seccion_obj:
-                    errors.append(f"Fila {i} (ID: {id_persona}): El departamento '{seccion}' no existe o está vacío. Se omitirá esta fila.")
-                    continue
-
-                # --- LÓGICA DE BÚSQUEDA DE SUBCADENA (CONFIRMADA) ---
-                grupos_str = str(grupos).upper() if grupos else ""
-                if 'ALMUERZO NORMAL' in grupos_str:
-                    control_obj = tipos_control_map.get('Almuerzo Regular')
-                elif 'ALMUERZO ESPECIAL' in grupos_str:
-                    control_obj = tipos_control_map.get('Dieta Especial')
-                else:
-                    control_obj = tipos_control_map.get('No Aplica')
-                # --- FIN DE LA LÓGICA ---
-                
-                if not control_obj:
-                    errors.append(f"Fila {i} (ID: {id_persona}): No se pudo asignar un tipo de control válido. Verifique que los tipos de control base existan.")
-                    continue
-                
-                persona = Persona.query.get(id_persona)
-                
-                if persona:
-                    persona.nombre_persona = nombre_formateado
-                    persona.sexo = sexo
-                    persona.dpto_id = seccion_obj.id_dpto
-                    persona.control_id = control_obj.id_control
-                    persona.tipo_persona_id = tipos_persona_map['Estudiante'].id_tipopersona
-                    updated_count += 1
-                else:
-                    new_person = Persona(
-                        id_persona=id_persona,
-                        nombre_persona=nombre_formateado,
-                        sexo=sexo,
-                        dpto_id=seccion_obj.id_dpto,
-                        control_id = control_obj.id_control,
-                        tipo_persona_id = tipos_persona_map['Estudiante'].id_tipopersona
-                    )
-                    db.session.add(new_person)
-                    created_count += 1
-            
-            if errors:
-                db.session.rollback()
-                flash("La importación se canceló debido a errores. Revisa la lista de problemas.", 'danger')
-                return render_template('admin/importar_estudiantes_excel.html', title="Actualizar Estudiantes", errors=errors)
-            
-            db.session.commit()
-            success_message = []
-            if updated_count > 0: success_message.append(f"{updated_count} estudiantes actualizados")
-            if created_count > 0: success_message.append(f"{created_count} estudiantes nuevos creados")
-            
-            if not success_message:
-                flash('El archivo no contenía estudiantes para procesar.', 'warning')
-            else:
-                flash(f"Proceso completado: {', '.join(success_message)}.", 'success')
-
-            return redirect(url_for('main.list_personas'))
+            # Lectura en streaming y upsert por lotes en un hilo en segundo plano
+            # (ver importacion.py y trabajos.py); la página consulta el progreso
+            id_trabajo, ruta = trabajos.guardar_subida(file)
+            trabajos.enviar(id_trabajo, 'estudiantes', trabajo_excel_estudiantes, ruta, descripcion=file.filename,
+                            simular=bool(request.form.get('simular')))
+            return redirect(url_for('main.importar_estudiantes_excel', trabajo=id_trabajo))
 
         except Exception as e:
-            db.session.rollback()
             flash(f'Ocurrió un error inesperado al procesar el archivo: {e}', 'danger')
             return redirect(request.url)
 
-    return render_template('admin/importar_estudiantes_excel.html', title="Actualizar Estudiantes")
+    return render_template('admin/importar_estudiantes_excel.html', title="Actualizar Estudiantes",
+                           trabajo=request.args.get('trabajo'))
 
 # app/routes.py
 
@@ -0,0 +1,112 @@
+# app/settings_cache.py
+"""
+Caché en memoria de la tabla `settings`.
+
+Los valores se leen de la BD una sola vez y se sirven desde memoria al
+context processor, al check-in, a los tickets, etc. Al guardar la
+configuración se reemplaza un archivo sello (ver cache.py) y cada worker
+recarga la tabla en su siguiente lectura.
+"""
+import os
+import threading
+
+from flask import current_app
+
+from app.cache import ArchivoSello
+
+# Valores por defecto si la tabla no existe o le falta alguna clave.
+# IMPRIME_TICKETS no tiene valor por defecto: si falta, no se imprime (más seguro).
+DEFAULT_SETTINGS = {
+    'NOMBRE_COLEGIO': 'Control de Almuerzos',
+    'LOGO_FILENAME': 'default_logo.png',
+}
+
+
+class _EstadoCache:
+    """Estado de la caché de una instancia de la aplicación."""
+
+    def __init__(self, stamp_path):
+        self.sello_archivo = ArchivoSello(stamp_path)
+        self.valores = None
+        self.sello = None
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+
+class SettingsCache:
+    """Servicio de configuración con caché e invalidación entre workers."""
+
+    def init_app(self, app):
+        stamp_path = app.config.get('SETTINGS_STAMP_FILE') or os.path.join(app.instance_path, 'settings.stamp')
+        app.extensions['settings_cache'] = _EstadoCache(stamp_path)
+
+    @staticmethod
+    def _estado():
+        return current_app.extensions['settings_cache']
+
+    def _valores(self):
+        estado = self._estado()
+        sello = estado.sello_archivo.leer()
+        if estado.valores is not None and sello == estado.sello:
+            estado.hits += 1
+            return estado.valores
+
+        with estado.lock:
+            estado.misses += 1
+            from app.models import Setting
+            try:
+                valores = dict(DEFAULT_SETTINGS)
+                valores.update({s.key: s.value for s in Setting.query.all()})
+            except Exception:
+                # Si la tabla aún no existe, usamos los valores por defecto sin cachearlos
+                return dict(DEFAULT_SETTINGS)
+            estado.valores = valores
+            estado.sello = sello
+            return valores
+
+    # --- Lectura ---
+
+    def todos(self):
+        """Copia de todas las configuraciones como diccionario {clave: valor}."""
+        return dict(self._valores())
+
+    def get(self, key, default=None):
+        return self._valores().get(key, default)
+
+    def get_bool(self, key, default=False):
+        valor = self.get(key)
+        if valor is None:
+            return default
+        return valor.strip().lower() == 'true'
+
+    @property
+    def imprime_tickets(self):
+        return self.get_bool('IMPRIME_TICKETS', False)
+
+    @property
+    def nombre_colegio(self):
+        return self.get('NOMBRE_COLEGIO', 'Colegio Privado')
+
+    @property
+    def logo_filename(self):
+        return self.get('LOGO_FILENAME', 'default_logo.png')
+
+    # --- Invalidación y métricas ---
+
+    def invalidar(self):
+        """Descarta la caché local y avisa al resto de workers reemplazando el sello."""
+        estado = self._estado()
+        estado.sello_archivo.tocar()
+        with estado.lock:
+            estado.valores = None
+            estado.sello = None
+
+    def estadisticas(self):
+        estado = self._estado()
+        total = estado.hits + estado.misses
+        return {
+            'hits': estado.hits,
+            'misses': estado.misses,
+            'hit_ratio': round(estado.hits / total, 4) if total else 0.0,
+        }
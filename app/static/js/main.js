@@ -40,70 +40,356 @@ $(document).ready(function() {
 
 
     // --- Lógica de Registro de Almuerzo con AJAX (Fetch API) ---
+    // El kiosco guarda en IndexedDB una copia del listado de personas (/api/roster)
+    // y una cola de escaneos. Si la red o el servidor fallan, el escaneo se valida
+    // con la copia local, se encola y se envía después por lotes a
+    // /api/registros/batch con la hora real en que se hizo.
+    const kiosco = (function() {
+        const LOTE = 200;                          // Escaneos por envío (el servidor acepta hasta 500)
+        const INTERVALO_ENVIO = 10 * 1000;         // Reintento del envío de la cola
+        const INTERVALO_ROSTER = 15 * 60 * 1000;   // Revalidación del listado local
+        const TIEMPO_MAXIMO = 4000;                // Espera máxima del registro en línea
+
+        const activo = $('#registro-form').length > 0 && 'indexedDB' in window;
+        let bd = null;
+        let roster = new Map();   // id_persona -> [id, nombre, dpto, habilitado, tipo_control]
+        let versionRoster = null;
+        let hoy = { fecha: null, ids: new Set() };   // Ya registrados hoy en este kiosco
+        let pendientes = 0;
+        let enviando = false;
+
+        function peticion(req) {
+            return new Promise((resolve, reject) => {
+                req.onsuccess = () => resolve(req.result);
+                req.onerror = () => reject(req.error);
+            });
+        }
+
+        function almacen(nombre, modo) {
+            return bd.transaction(nombre, modo || 'readonly').objectStore(nombre);
+        }
+
+        function abrir() {
+            const req = indexedDB.open('kiosco-almuerzos', 1);
+            req.onupgradeneeded = () => {
+                req.result.createObjectStore('meta');                            // roster y registrados de hoy
+                req.result.createObjectStore('cola', { autoIncrement: true });   // escaneos sin enviar
+            };
+            return peticion(req);
+        }
+
+        function fechaLocal() {
+            return new Date().toLocaleDateString('en-CA');   // AAAA-MM-DD en la hora del kiosco
+        }
+
+        function cargarRoster(datos) {
+            roster = new Map(datos.personas.map(p => [p[0], p]));
+            versionRoster = datos.version;
+        }
+
+        function actualizarRoster() {
+            const cabeceras = versionRoster ? { 'If-None-Match': `"${versionRoster}"` } : {};
+            return fetch('/api/roster', { headers: cabeceras })
+                .then(response => {
+                    if (response.status === 304) return null;
+                    if (!response.ok) throw new Error(`HTTP ${response.status}`);
+                    return response.json();
+                })
+                .then(datos => {
+                    if (!datos) return;
+                    cargarRoster(datos);
+                    return peticion(almacen('meta', 'readwrite').put(datos, 'roster'));
+                })
+                .catch(() => {});   // Sin conexión: se sigue con la copia guardada
+        }
+
+        function marcarHoy(idPersona) {
+            if (hoy.fecha !== fechaLocal()) hoy = { fecha: fechaLocal(), ids: new Set() };
+            hoy.ids.add(idPersona);
+            if (bd) almacen('meta', 'readwrite').put({ fecha: hoy.fecha, ids: [...hoy.ids] }, 'hoy');
+        }
+
+        function yaRegistrado(idPersona) {
+            return hoy.fecha === fechaLocal() && hoy.ids.has(idPersona);
+        }
+
+        function mostrarPendientes() {
+            const indicador = $('#kiosco-pendientes');
+            const texto = pendientes === 1 ? '1 registro pendiente de enviar' : `${pendientes} registros pendientes de enviar`;
+            indicador.toggleClass('d-none', pendientes === 0)
+                .html(`<i class="fas fa-cloud-upload-alt me-1"></i>${texto}${navigator.onLine ? '' : ' (sin conexión)'}`);
+        }
+
+        function contarPendientes() {
+            return peticion(almacen('cola').count()).then(n => {
+                pendientes = n;
+                mostrarPendientes();
+            });
+        }
+
+        // Registro en línea; rechaza si no hay red, se agota el tiempo o el servidor falla (5xx)
+        function registrarEnLinea(idPersona) {
+            const controlador = new AbortController();
+            const temporizador = setTimeout(() => controlador.abort(), TIEMPO_MAXIMO);
+            return fetch('/procesar_registro', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/x-www-form-urlencoded' },
+                body: `id_persona=${encodeURIComponent(idPersona)}`,
+                signal: controlador.signal
+            })
+            .then(response => {
+                if (response.status >= 500) throw new Error(`HTTP ${response.status}`);
+                return response.json();
+            })
+            .finally(() => clearTimeout(temporizador));
+        }
+
+        // Mismas validaciones que checkin.py, con la copia local del listado
+        function encolar(idPersona) {
+            const persona = roster.get(idPersona);
+            if (roster.size && !persona) {
+                return { success: false, estado: 'no_encontrado', message: 'Código no encontrado.' };
+            }
+            if (persona && !persona[3]) {
+                return { success: false, estado: 'no_habilitado', message: `"${persona[1]}" no está habilitado para tomar almuerzo.` };
+            }
+            if (yaRegistrado(idPersona)) {
+                return { success: false, estado: 'duplicado', message: '¡Ya tomó almuerzo hoy!' };
+            }
+
+            const escaneo = { id_persona: idPersona, scanned_at: new Date().toISOString() };
+            return peticion(almacen('cola', 'readwrite').add(escaneo)).then(() => {
+                marcarHoy(idPersona);
+                pendientes += 1;
+                mostrarPendientes();
+                return {
+                    success: true,
+                    estado: 'pendiente',
+                    message: 'Registrado sin conexión; se enviará al recuperar la red.',
+                    registro: {
+                        id_persona: idPersona,
+                        nombre_persona: persona ? persona[1] : idPersona,
+                        dpto: persona ? persona[2] : '',
+                        tipo_control: persona ? persona[4] : '',
+                        imprime_ticket: false
+                    }
+                };
+            });
+        }
+
+        function registrar(idPersona) {
+            return listo.then(() => {
+                if (!bd) return registrarEnLinea(idPersona);
+                // Con escaneos en cola se sigue encolando para conservar el orden
+                if (pendientes > 0 || !navigator.onLine) return encolar(idPersona);
+                return registrarEnLinea(idPersona)
+                    .then(data => {
+                        if (data.success || data.estado === 'duplicado') marcarHoy(idPersona);
+                        return data;
+                    })
+                    .catch(() => encolar(idPersona));
+            });
+        }
+
+        function leerLote() {
+            return new Promise((resolve, reject) => {
+                const claves = [];
+                const escaneos = [];
+                const req = almacen('cola').openCursor();
+                req.onsuccess = () => {
+                    const cursor = req.result;
+                    if (cursor && escaneos.length < LOTE) {
+                        claves.push(cursor.key);
+                        escaneos.push(cursor.value);
+                        cursor.continue();
+                    } else {
+                        resolve({ claves, escaneos });
+                    }
+                };
+                req.onerror = () => reject(req.error);
+            });
+        }
+
+        function enviarCola() {
+            if (!bd || enviando || pendientes === 0 || !navigator.onLine) return;
+            enviando = true;
+            leerLote()
+                .then(({ claves, escaneos }) => {
+                    if (!escaneos.length) return;
+                    return fetch('/api/registros/batch', {
+                        method: 'POST',
+                        headers: { 'Content-Type': 'application/json' },
+                        body: JSON.stringify({ registros: escaneos })
+                    })
+                    .then(response => {
+                        if (!response.ok) throw new Error(`HTTP ${response.status}`);
+                        return response.json();
+                    })
+                    .then(data => {
+                        const rango = IDBKeyRange.bound(claves[0], claves[claves.length - 1]);
+                        return peticion(almacen('cola', 'readwrite').delete(rango)).then(() => data);
+                    })
+                    .then(data => {
+                        // Un duplicado significa que el almuerzo ya estaba registrado: no es un error
+                        const rechazados = data.resultados.filter(r => !r.success && r.estado !== 'duplicado');
+                        if (rechazados.length) {
+                            const detalle = rechazados.map(r => `${escaparHtml(r.id_persona)}: ${escaparHtml(r.message)}`).join('<br>');
+                            $('#mensaje-registro').html(`<div class="alert alert-warning">Registros sin conexión rechazados por el servidor:<br>${detalle}</div>`);
+                        }
+                    });
+                })
+                .catch(error => console.error('Error al enviar la cola del kiosco:', error))
+                .finally(() => {
+                    enviando = false;
+                    contarPendientes().then(() => { if (pendientes > 0 && navigator.onLine) enviarCola(); });
+                });
+        }
+
+        const listo = !activo ? Promise.resolve() : abrir()
+            .then(abierta => {
+                bd = abierta;
+                return Promise.all([
+                    peticion(almacen('meta').get('roster')),
+                    peticion(almacen('meta').get('hoy'))
+                ]);
+            })
+            .then(([guardado, registradosHoy]) => {
+                if (guardado) cargarRoster(guardado);
+                if (registradosHoy) hoy = { fecha: registradosHoy.fecha, ids: new Set(registradosHoy.ids) };
+                return contarPendientes();
+            })
+            .then(() => {
+                actualizarRoster();
+                enviarCola();
+                setInterval(actualizarRoster, INTERVALO_ROSTER);
+                setInterval(enviarCola, INTERVALO_ENVIO);
+                window.addEventListener('online', enviarCola);
+                window.addEventListener('offline', mostrarPendientes);
+            })
+            .catch(error => {
+                // Sin IndexedDB (modo privado, cuota): el kiosco sólo registra en línea
+                console.error('Kiosco sin almacenamiento local:', error);
+                bd = null;
+            });
+
+        return { registrar };
+    })();
+
+    function accionesRegistro(idRegistro) {
+        // Construir el botón de eliminar SÓLO si el usuario es admin
+        let deleteButtonHtml = '';
+        if (typeof IS_ADMIN !== 'undefined' && IS_ADMIN) {
+            deleteButtonHtml = `
+                <form action="/registro/delete/${idRegistro}" method="POST" class="d-inline" onsubmit="return confirm('¿Estás seguro de que quieres eliminar este registro? Es una acción irreversible.');">
+                    <button type="submit" class="btn btn-sm btn-outline-danger" title="Eliminar Registro">
+                        <i class="fas fa-trash-alt"></i>
+                    </button>
+                </form>
+            `;
+        }
+        return `
+            <a href="/imprimir_ticket/${idRegistro}" target="_blank" class="btn btn-sm btn-outline-secondary" title="Reimprimir Ticket">
+                <i class="fas fa-print"></i>
+            </a>
+            ${deleteButtonHtml}`;
+    }
+
+    // Ids de los registros ya mostrados, también los que ya salieron de la tabla: la
+    // transmisión en vivo puede reenviar un registro al reconectarse o tras un check-in local
+    const MAX_REGISTROS_MOSTRADOS = 1000;
+    const registrosMostrados = new Set(
+        $('#tabla-registros-body tr[data-id-registro]').map(function() { return Number($(this).data('id-registro')); }).get()
+    );
+
+    function registroMostrado(idRegistro) {
+        return registrosMostrados.has(Number(idRegistro));
+    }
+
+    // Añade una fila al principio de la tabla de últimos registros
+    function agregarFilaRegistro(registro, hora, accionesHtml) {
+        if (registro.id_registro) {
+            registrosMostrados.add(Number(registro.id_registro));
+            if (registrosMostrados.size > MAX_REGISTROS_MOSTRADOS) {
+                registrosMostrados.delete(registrosMostrados.values().next().value); // El más antiguo
+            }
+        }
+        const atributoId = registro.id_registro ? ` data-id-registro="${registro.id_registro}"` : '';
+        $('#tabla-registros-body').prepend(`
+            <tr${atributoId}>
+                <td>${escaparHtml(hora)}</td>
+                <td>${escaparHtml(registro.id_persona)}</td>
+                <td>${escaparHtml(registro.nombre_persona)}</td>
+                <td>${escaparHtml(registro.dpto)}</td>
+                <td>${escaparHtml(registro.tipo_control)}</td>
+                <td>${accionesHtml}</td>
+            </tr>`);
+        $('#no-registros-row').hide(); // Ocultar mensaje de "no hay registros"
+    }
+
+    function mostrarRegistro(data) {
+        const mensajeDiv = $('#mensaje-registro');
+        if (data.success) {
+            const alerta = data.estado === 'pendiente' ? 'alert-warning' : 'alert-success';
+            mensajeDiv.html(`<div class="alert ${alerta}">${escaparHtml(data.registro.nombre_persona)}: ${data.message}</div>`);
+
+            // Un registro pendiente aún no tiene id_registro: sin ticket ni eliminación hasta que se envíe
+            const accionesHtml = data.estado === 'pendiente'
+                ? '<span class="badge bg-warning text-dark" title="Se enviará al recuperar la conexión"><i class="fas fa-clock me-1"></i>Pendiente</span>'
+                : accionesRegistro(data.registro.id_registro);
+            // La transmisión en vivo puede haber traído ya este registro
+            if (!data.registro.id_registro || !registroMostrado(data.registro.id_registro)) {
+                const hora = new Date().toLocaleTimeString('es-ES', { hour: '2-digit', minute: '2-digit', second: '2-digit' });
+                agregarFilaRegistro(data.registro, hora, accionesHtml);
+            }
+
+            // Imprimir ticket si está habilitado
+            if (data.registro.imprime_ticket) {
+                window.open(`/imprimir_ticket/${data.registro.id_registro}`, '_blank');
+            }
+        } else {
+            mensajeDiv.html(`<div class="alert alert-danger">${escaparHtml(data.message)}</div>`);
+        }
+        setTimeout(() => mensajeDiv.empty(), 4000); // Borrar mensaje después de 4 segundos
+    }
+
+    // --- Registros en vivo (Server-Sent Events) ---
+    // Los check-ins de cualquier kiosco aparecen en la tabla sin recargar la página.
+    // EventSource se reconecta solo y envía Last-Event-ID para no perder eventos.
+    if ($('#tabla-registros-body').length && window.EventSource) {
+        const MAX_FILAS = 50;
+        let ultimoEvento = null;
+
+        function conectarRegistrosEnVivo() {
+            const fuente = new EventSource('/registro/stream' + (ultimoEvento ? `?ultimo=${ultimoEvento}` : ''));
+            fuente.addEventListener('registro', function(e) {
+                ultimoEvento = e.lastEventId;
+                const registro = JSON.parse(e.data);
+                if (registroMostrado(registro.id_registro)) return;
+                agregarFilaRegistro(registro, registro.hora, accionesRegistro(registro.id_registro));
+                $('#tabla-registros-body tr[data-id-registro]').slice(MAX_FILAS).remove();
+            });
+            // Tras una respuesta de error (503 si el servidor no alcanza la BD) EventSource
+            // no se reconecta solo: se abre una conexión nueva pasados unos segundos
+            fuente.onerror = function() {
+                if (fuente.readyState === EventSource.CLOSED) {
+                    setTimeout(conectarRegistrosEnVivo, 5000);
+                }
+            };
+        }
+        conectarRegistrosEnVivo();
+    }
+
     $('#registro-form').on('submit', function(e) {
         e.preventDefault();
         const input = $('#id_persona_input');
-        const idPersona = input.val();
-
-        if (idPersona.trim() === '') return;
-
-        fetch('/procesar_registro', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/x-www-form-urlencoded',
-            },
-            body: `id_persona=${idPersona}`
-        })
-        .then(response => response.json())
-        .then(data => {
-            const mensajeDiv = $('#mensaje-registro');
-            if (data.success) {
-                mensajeDiv.html(`<div class="alert alert-success">${data.registro.nombre_persona}: ${data.message}</div>`);
-                // === INICIO DE CAMBIOS ===
-                // Construir el botón de eliminar SÓLO si el usuario es admin
-                let deleteButtonHtml = '';
-                if (typeof IS_ADMIN !== 'undefined' && IS_ADMIN) {
-                    deleteButtonHtml = `
-                        <form action="/registro/delete/${data.registro.id_registro}" method="POST" class="d-inline" onsubmit="return confirm('¿Estás seguro de que quieres eliminar este registro? Es una acción irreversible.');">
-                            <button type="submit" class="btn btn-sm btn-outline-danger" title="Eliminar Registro">
-                                <i class="fas fa-trash-alt"></i>
-                            </button>
-                        </form>
-                    `;
-                }
+        const idPersona = input.val().trim();
 
-                // Añadir a la tabla
-                const newRow = `
-                    <tr>
-                        <td>${new Date().toLocaleTimeString('es-ES', { hour: '2-digit', minute: '2-digit', second: '2-digit' })}</td>
-                        <td>${data.registro.id_persona}</td>
-                        <td>${data.registro.nombre_persona}</td>
-                        <td>${data.registro.dpto}</td>
-                        <td>${data.registro.tipo_control}</td>
-                        <td>
-                            <a href="/imprimir_ticket/${data.registro.id_registro}" target="_blank" class="btn btn-sm btn-outline-secondary" title="Reimprimir Ticket">
-                                <i class="fas fa-print"></i>
-                            </a>
-                            ${deleteButtonHtml}
-                        </td>
-                    </tr>`;
-                // === FIN DE CAMBIOS ===
-                
-                $('#tabla-registros-body').prepend(newRow);
-                $('#no-registros-row').hide(); // Ocultar mensaje de "no hay registros"
-                
-                // Imprimir ticket si está habilitado
-                if (data.registro.imprime_ticket) {
-                    window.open(`/imprimir_ticket/${data.registro.id_registro}`, '_blank');
-                }
+        if (idPersona === '') return;
 
-            } else {
-                mensajeDiv.html(`<div class="alert alert-danger">${data.message}</div>`);
-            }
-            input.val('').focus(); // Limpiar y enfocar el input
-            setTimeout(() => mensajeDiv.empty(), 4000); // Borrar mensaje después de 4 segundos
-        })
-        .catch(error => console.error('Error:', error));
+        input.val('').focus(); // Limpiar y enfocar el input para el siguiente escaneo
+        Promise.resolve(kiosco.registrar(idPersona))
+            .then(mostrarRegistro)
+            .catch(error => console.error('Error:', error));
     });
 
 
@@ -189,16 +475,288 @@ $(document).ready(function() {
         modal.find('.modal-title').text('Editar Usuario: ' + username);
     });
 
+    // --- Carga incremental del listado de personas (paginación por cursor) ---
+    function escaparHtml(texto) {
+        return $('<div>').text(texto).html();
+    }
+
+    $('#btn-cargar-personas').on('click', function() {
+        const boton = $(this);
+        const cursor = boton.data('next');
+        if (!cursor) return;
+
+        const url = new URL(boton.data('url'), window.location.origin);
+        url.searchParams.set('cursor', cursor);
+        boton.prop('disabled', true);
+
+        fetch(url)
+            .then(response => response.json())
+            .then(data => {
+                const body = $('#tabla-personas-body');
+                data.personas.forEach(persona => {
+                    body.append(`
+                        <tr>
+                            <td>
+                                <picture>
+                                    ${persona.foto_srcset_webp ? `<source type="image/webp" srcset="${persona.foto_srcset_webp}">` : ''}
+                                    <img src="${persona.foto_url}" srcset="${persona.foto_srcset}" alt="Foto" class="rounded-circle" width="50" height="50" style="object-fit: cover;" loading="lazy">
+                                </picture>
+                            </td>
+                            <td>${escaparHtml(persona.id_persona)}</td>
+                            <td>${escaparHtml(persona.nombre_persona)}</td>
+                            <td>${escaparHtml(persona.tipo_persona)}</td>
+                            <td>${escaparHtml(persona.dpto)}</td>
+                            <td class="text-end">
+                                <a href="${persona.edit_url}" class="btn btn-sm btn-outline-primary"><i class="fas fa-edit"></i></a>
+                                <form action="${persona.delete_url}" method="POST" class="d-inline" onsubmit="return confirm('¿Estás seguro de que quieres eliminar a esta persona?');">
+                                    <button type="submit" class="btn btn-sm btn-outline-danger"><i class="fas fa-trash"></i></button>
+                                </form>
+                            </td>
+                        </tr>`);
+                });
+                // jQuery cachea data-*; se actualiza con .data() y no con .attr()
+                boton.data('next', data.siguiente || '');
+                boton.toggleClass('d-none', !data.siguiente);
+            })
+            .catch(error => console.error('Error al cargar personas:', error))
+            .finally(() => boton.prop('disabled', false));
+    });
+
+    // --- Progreso de importaciones en segundo plano ---
+    const panelProgreso = $('#progreso-importacion');
+    if (panelProgreso.length) {
+        const FASES = { validando: 'Validando y comparando filas...', importando: 'Guardando cambios...' };
+
+        function formatearEta(segundos) {
+            if (segundos === null) return '';
+            if (segundos < 60) return ` · quedan ~${segundos} s`;
+            return ` · quedan ~${Math.ceil(segundos / 60)} min`;
+        }
+
+        function tablaDiferencias(estado) {
+            return `
+                <table class="table table-sm mb-3" style="max-width: 420px;">
+                    <tbody>
+                        <tr><td>Personas nuevas</td><td class="text-end fw-bold">${estado.creados}</td></tr>
+                        <tr><td>Personas con cambios</td><td class="text-end fw-bold">${estado.actualizados}</td></tr>
+                        <tr><td>Sin cambios (no se escriben)</td><td class="text-end">${estado.sin_cambios}</td></tr>
+                        <tr><td>Registradas que no están en el archivo (no se modifican)</td><td class="text-end">${estado.ausentes}</td></tr>
+                    </tbody>
+                </table>`;
+        }
+
+        function mostrarResultado(estado) {
+            const resultado = $('#progreso-resultado');
+            $('#progreso-icono').removeClass('fa-spinner fa-spin');
+            $('#progreso-barra').removeClass('progress-bar-animated progress-bar-striped');
+            if (estado.estado === 'completado') {
+                $('#progreso-icono').addClass('fa-check-circle text-success');
+                $('#progreso-titulo').text('Importación completada');
+                $('#progreso-barra').addClass('bg-success');
+                resultado.html(`
+                    ${tablaDiferencias(estado)}
+                    <a href="${panelProgreso.data('lista')}" class="btn btn-success btn-sm">Ver el listado</a>`);
+            } else if (estado.estado === 'simulado') {
+                $('#progreso-icono').addClass('fa-search text-primary');
+                $('#progreso-titulo').text('Simulación terminada: todavía no se guardó nada');
+                $('#progreso-barra').addClass('bg-info');
+                const hayCambios = estado.creados + estado.actualizados > 0;
+                resultado.html(`
+                    ${tablaDiferencias(estado)}
+                    <form method="POST" action="${panelProgreso.data('aplicar')}">
+                        <button type="submit" class="btn btn-primary" ${hayCambios ? '' : 'disabled'}>
+                            <i class="fas fa-check me-1"></i> ${hayCambios ? 'Aplicar cambios' : 'No hay cambios que aplicar'}
+                        </button>
+                    </form>`);
+            } else if (estado.estado === 'aplicado') {
+                $('#progreso-icono').addClass('fa-check-circle text-success');
+                $('#progreso-titulo').text('Simulación aplicada');
+                $('#progreso-barra').addClass('bg-success');
+                resultado.html(`<a href="${window.location.pathname}?trabajo=${encodeURIComponent(estado.aplicado_en)}" class="btn btn-outline-primary btn-sm">Ver la importación</a>`);
+            } else if (estado.estado === 'rechazado') {
+                $('#progreso-icono').addClass('fa-exclamation-triangle text-danger');
+                $('#progreso-titulo').text('Importación cancelada');
+                $('#progreso-barra').addClass('bg-danger');
+                const errores = estado.errores.map(e => `<li>${escaparHtml(e)}</li>`).join('');
+                resultado.html(`
+                    <div class="alert alert-danger mb-0">
+                        <p>No se guardó ningún cambio. Corrige los siguientes problemas y vuelve a intentarlo:</p>
+                        <ul class="mb-0" style="max-height: 300px; overflow-y: auto;">${errores}</ul>
+                    </div>`);
+            } else {
+                $('#progreso-icono').addClass('fa-times-circle text-danger');
+                $('#progreso-titulo').text('Error en la importación');
+                $('#progreso-barra').addClass('bg-danger');
+                resultado.html(`<div class="alert alert-danger mb-0">${escaparHtml(estado.mensaje || 'Error desconocido.')}</div>`);
+            }
+        }
+
+        function consultarProgreso() {
+            fetch(panelProgreso.data('url'))
+                .then(response => {
+                    if (!response.ok) throw new Error(`HTTP ${response.status}`);
+                    return response.json();
+                })
+                .then(estado => {
+                    const porcentaje = estado.porcentaje || 0;
+                    $('#progreso-barra').css('width', `${porcentaje}%`).text(`${porcentaje}%`);
+                    if (estado.terminado) {
+                        $('#progreso-fase').text(estado.descripcion);
+                        $('#progreso-detalle').text(`${estado.filas_procesadas} filas procesadas`);
+                        mostrarResultado(estado);
+                        return;
+                    }
+                    $('#progreso-fase').text(FASES[estado.fase] || 'En cola...');
+                    const total = estado.total_filas ? ` de ~${estado.total_filas}` : '';
+                    $('#progreso-detalle').text(
+                        `${estado.filas_procesadas}${total} filas · ${estado.errores_encontrados} errores${formatearEta(estado.eta_segundos)}`
+                    );
+                    setTimeout(consultarProgreso, 1000);
+                })
+                .catch(error => {
+                    console.error('Error al consultar el progreso:', error);
+                    $('#progreso-fase').text('No se pudo consultar el progreso de la importación.');
+                });
+        }
+        consultarProgreso();
+    }
+
     // --- INICIO DE NUEVA LÓGICA: BÚSQUEDA POR NOMBRE ---
+    // Búsqueda mientras se escribe: espera a que se deje de teclear, cancela la
+    // petición anterior y guarda los últimos resultados. Si un término más corto
+    // contenido en el actual ya devolvió la lista completa (menos de LIMITE
+    // resultados), el nuevo término se filtra en el navegador sin ir al servidor.
+    const busquedaPersonas = (function() {
+        const LIMITE = 20;          // Igual que el límite de /buscar_persona
+        const MAX_CACHE = 50;       // Términos recordados (LRU)
+        const VIGENCIA_MS = 30000;  // Igual que el max-age de /buscar_persona: luego hay que ver altas y cambios
+        const cache = new Map();    // término normalizado -> {resultados, guardado} (el orden de inserción hace de LRU)
+        let controlador = null;
+
+        // Misma normalización que el servidor: minúsculas y sin tildes (la ñ como n)
+        function normalizar(texto) {
+            return texto.normalize('NFD').replace(/[\u0300-\u036f]/g, '').toLowerCase().split(/\s+/).filter(Boolean).join(' ');
+        }
+
+        function vigente(entrada) {
+            return Date.now() - entrada.guardado < VIGENCIA_MS;
+        }
+
+        function leerCache(clave) {
+            const entrada = cache.get(clave);
+            if (!entrada) return null;
+            cache.delete(clave);
+            if (!vigente(entrada)) return null;
+            cache.set(clave, entrada);  // Pasa a ser el más reciente
+            return entrada;
+        }
+
+        function guardarCache(clave, resultados, guardado) {
+            cache.set(clave, { resultados: resultados, guardado: guardado });
+            if (cache.size > MAX_CACHE) cache.delete(cache.keys().next().value);
+        }
+
+        // Un término más largo que otro ya buscado con la lista completa (menos de LIMITE
+        // resultados) se filtra en el navegador. El resultado hereda la hora de la lista
+        // de la que sale, así refinar no alarga su vigencia.
+        function refinarLocal(clave) {
+            for (const [previa, entrada] of cache) {
+                if (vigente(entrada) && entrada.resultados.length < LIMITE && clave.includes(previa)) {
+                    return {
+                        resultados: entrada.resultados.filter(p => normalizar(p.nombre_persona).includes(clave)),
+                        guardado: entrada.guardado
+                    };
+                }
+            }
+            return null;
+        }
+
+        function buscar(termino) {
+            const clave = normalizar(termino);
+            const local = leerCache(clave) || refinarLocal(clave);
+            if (local) {
+                guardarCache(clave, local.resultados, local.guardado);
+                return Promise.resolve(local.resultados);
+            }
+
+            if (controlador) controlador.abort();  // La respuesta anterior ya no interesa
+            controlador = new AbortController();
+            return fetch(`/buscar_persona?q=${encodeURIComponent(termino)}`, { signal: controlador.signal })
+                .then(response => {
+                    if (!response.ok) throw new Error(`HTTP ${response.status}`);
+                    return response.json();
+                })
+                .then(data => {
+                    guardarCache(clave, data, Date.now());
+                    return data;
+                });
+        }
+
+        return { buscar: buscar };
+    })();
+
+    const ESPERA_BUSQUEDA_MS = 250;
     const searchForm = $('#search-form');
     const searchInput = $('#nombre_search_input');
+    const searchSuggestions = $('#search-sugerencias');
     const searchResultsBody = $('#searchResultsBody');
-    const searchModal = new bootstrap.Modal(document.getElementById('searchResultsModal'));
     const mainIdInput = $('#id_persona_input');
     const mainForm = $('#registro-form');
+    let temporizadorBusqueda = null;
+
+    function listaResultados(data) {
+        const list = $('<div class="list-group"></div>');
+        data.forEach(person => {
+            list.append(`
+                <a href="#" class="list-group-item list-group-item-action search-result-item" data-id="${escaparHtml(person.id_persona)}">
+                    <div class="d-flex w-100 justify-content-between">
+                        <h5 class="mb-1">${escaparHtml(person.nombre_persona)}</h5>
+                        <small class="text-muted">ID: ${escaparHtml(person.id_persona)}</small>
+                    </div>
+                    <p class="mb-1 text-muted">${escaparHtml(person.dpto)}</p>
+                </a>
+            `);
+        });
+        return list;
+    }
+
+    function esCancelacion(error) {
+        return error.name === 'AbortError';
+    }
+
+    // Sugerencias bajo el campo mientras se escribe
+    searchInput.on('input', function() {
+        clearTimeout(temporizadorBusqueda);
+        const searchTerm = searchInput.val().trim();
+        if (searchTerm.length < 3) {
+            searchSuggestions.empty().addClass('d-none');
+            return;
+        }
+        temporizadorBusqueda = setTimeout(() => {
+            busquedaPersonas.buscar(searchTerm)
+                .then(data => {
+                    // Descartar respuestas de un término que ya no está en el campo
+                    if (searchInput.val().trim() !== searchTerm) return;
+                    if (data.length > 0) {
+                        searchSuggestions.html(listaResultados(data).html()).removeClass('d-none');
+                    } else {
+                        searchSuggestions.html('<div class="list-group-item text-muted">Sin resultados.</div>').removeClass('d-none');
+                    }
+                })
+                .catch(error => {
+                    if (!esCancelacion(error)) console.error('Error en la búsqueda:', error);
+                });
+        }, ESPERA_BUSQUEDA_MS);
+    });
+
+    searchInput.on('keydown', function(e) {
+        if (e.key === 'Escape') searchSuggestions.empty().addClass('d-none');
+    });
 
     searchForm.on('submit', function(e) {
         e.preventDefault();
+        clearTimeout(temporizadorBusqueda);
+        searchSuggestions.empty().addClass('d-none');
         const searchTerm = searchInput.val().trim();
 
         if (searchTerm.length < 3) {
@@ -207,49 +765,39 @@ $(document).ready(function() {
         }
 
         // Mostrar un indicador de carga
+        const searchModal = bootstrap.Modal.getOrCreateInstance(document.getElementById('searchResultsModal'));
         searchResultsBody.html('<p class="text-center"><i class="fas fa-spinner fa-spin"></i> Buscando...</p>');
         searchModal.show();
 
-        fetch(`/buscar_persona?q=${encodeURIComponent(searchTerm)}`)
-            .then(response => response.json())
+        busquedaPersonas.buscar(searchTerm)
             .then(data => {
                 searchResultsBody.empty(); // Limpiar el indicador de carga
 
                 if (data.length > 0) {
-                    const list = $('<div class="list-group"></div>');
-                    data.forEach(person => {
-                        const item = $(`
-                            <a href="#" class="list-group-item list-group-item-action search-result-item" data-id="${person.id_persona}">
-                                <div class="d-flex w-100 justify-content-between">
-                                    <h5 class="mb-1">${person.nombre_persona}</h5>
-                                    <small class="text-muted">ID: ${person.id_persona}</small>
-                                </div>
-                                <p class="mb-1 text-muted">${person.dpto}</p>
-                            </a>
-                        `);
-                        list.append(item);
-                    });
-                    searchResultsBody.append(list);
+                    searchResultsBody.append(listaResultados(data));
                 } else {
                     searchResultsBody.html('<p class="text-center text-muted">No se encontraron resultados para su búsqueda.</p>');
                 }
             })
             .catch(error => {
+                if (esCancelacion(error)) return;
                 console.error('Error en la búsqueda:', error);
                 searchResultsBody.html('<p class="text-center text-danger">Ocurrió un error al realizar la búsqueda.</p>');
             });
     });
 
-    // Manejar el clic en un resultado de la búsqueda (usando delegación de eventos)
-    searchResultsBody.on('click', '.search-result-item', function(e) {
+    // Manejar el clic en un resultado de la búsqueda, en el modal o en las sugerencias (delegación de eventos)
+    searchResultsBody.add(searchSuggestions).on('click', '.search-result-item', function(e) {
         e.preventDefault();
         const personId = $(this).data('id');
         
         // Poner el ID en el campo principal
         mainIdInput.val(personId);
         
-        // Cerrar el modal
-        searchModal.hide();
+        // Cerrar el modal y las sugerencias
+        const modalAbierto = bootstrap.Modal.getInstance(document.getElementById('searchResultsModal'));
+        if (modalAbierto) modalAbierto.hide();
+        searchSuggestions.empty().addClass('d-none');
 
         // Limpiar el campo de búsqueda
         searchInput.val('');
@@ -0,0 +1,254 @@
+# app/trabajos.py
+"""
+Trabajos en segundo plano (importaciones masivas) sin broker externo.
+
+Cada worker de gunicorn tiene un ThreadPoolExecutor pequeño (IMPORT_WORKERS
+hilos, 1 por defecto) que ejecuta los trabajos con su propio contexto de
+aplicación y su propia sesión de BD, así la petición que sube el archivo
+responde enseguida y el worker sigue atendiendo check-ins mientras importa.
+
+El estado de cada trabajo se guarda como JSON en instance/trabajos/<id>.json
+(escritura atómica con os.replace), de modo que cualquier worker puede
+responder a la consulta de progreso aunque el trabajo corra en otro.
+El archivo subido se guarda junto al estado y se borra al terminar, salvo
+en las simulaciones, que lo conservan para aplicarlo después sin volver a
+subirlo.
+"""
+import json
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from flask import current_app
+
+# Cada cuánto (segundos) se reescribe el estado mientras avanza un trabajo
+INTERVALO_GUARDADO = 0.5
+
+# Los estados de trabajos terminados se borran pasado este tiempo
+ANTIGUEDAD_MAXIMA = 7 * 24 * 3600
+
+ESTADOS_FINALES = ('completado', 'simulado', 'aplicado', 'rechazado', 'fallido')
+
+
+class _EstadoTrabajos:
+    """Carpeta y pool de hilos de una instancia de la aplicación."""
+
+    def __init__(self, directorio, hilos):
+        self.directorio = directorio
+        os.makedirs(directorio, exist_ok=True)
+        self.hilos = hilos
+        self.pool = None
+        self.lock = threading.Lock()
+
+    def executor(self):
+        # Se crea al primer uso: gunicorn hace fork después de create_app()
+        with self.lock:
+            if self.pool is None:
+                self.pool = ThreadPoolExecutor(max_workers=self.hilos, thread_name_prefix='importacion')
+            return self.pool
+
+
+class Progreso:
+    """Avance de un trabajo en curso; lo usan las funciones de trabajo."""
+
+    def __init__(self, trabajos, datos):
+        self._trabajos = trabajos
+        self.datos = datos
+        self._ultimo_guardado = 0.0
+
+    def fase(self, nombre, total=None):
+        """Empieza una fase (ej. 'validando', 'importando') de `total` filas estimadas."""
+        self.datos.update(fase=nombre, total_filas=total, filas_procesadas=0, errores_encontrados=0,
+                          inicio_fase=time.time())
+        self.guardar()
+
+    def avance(self, filas_procesadas, errores_encontrados=0):
+        self.datos.update(filas_procesadas=filas_procesadas, errores_encontrados=errores_encontrados)
+        if time.monotonic() - self._ultimo_guardado >= INTERVALO_GUARDADO:
+            self.guardar()
+
+    def guardar(self):
+        self._ultimo_guardado = time.monotonic()
+        self._trabajos._escribir(self.datos)
+
+
+class Trabajos:
+    """Cola local de trabajos con estado compartido entre workers en disco."""
+
+    def init_app(self, app):
+        directorio = app.config.get('TRABAJOS_DIR') or os.path.join(app.instance_path, 'trabajos')
+        app.extensions['trabajos'] = _EstadoTrabajos(directorio, app.config.get('IMPORT_WORKERS', 1))
+
+    @staticmethod
+    def _estado():
+        return current_app.extensions['trabajos']
+
+    def _ruta(self, id_trabajo, extension='.json'):
+        return os.path.join(self._estado().directorio, f'{id_trabajo}{extension}')
+
+    def _escribir(self, datos):
+        ruta = self._ruta(datos['id'])
+        tmp_path = f'{ruta}.{secrets.token_hex(4)}'
+        with open(tmp_path, 'w') as f:
+            json.dump(datos, f)
+        os.replace(tmp_path, ruta)
+
+    # --- Envío ---
+
+    def guardar_subida(self, archivo):
+        """Guarda el FileStorage subido en la carpeta de trabajos. Devuelve (id, ruta)."""
+        id_trabajo = secrets.token_hex(8)
+        _, extension = os.path.splitext(archivo.filename or '')
+        ruta = self._ruta(id_trabajo, extension.lower() or '.dat')
+        archivo.save(ruta)
+        return id_trabajo, ruta
+
+    def enviar(self, id_trabajo, tipo, funcion, ruta, descripcion='', simular=False):
+        """
+        Encola `funcion(ruta, progreso, simular)`, que debe devolver un
+        ResultadoImportacion. El trabajo queda 'pendiente' hasta que un hilo lo toma.
+        """
+        self.limpiar()
+        datos = {
+            'id': id_trabajo,
+            'tipo': tipo,
+            'descripcion': descripcion,
+            'simulacion': simular,
+            'archivo': os.path.basename(ruta),
+            'estado': 'pendiente',
+            'fase': None,
+            'creado': datetime.utcnow().isoformat(),
+            'total_filas': None,
+            'filas_procesadas': 0,
+            'errores_encontrados': 0,
+            'inicio_fase': None,
+            'fin': None,
+            'creados': 0,
+            'actualizados': 0,
+            'sin_cambios': 0,
+            'ausentes': 0,
+            'errores': [],
+            'mensaje': None,
+        }
+        self._escribir(datos)
+        app = current_app._get_current_object()
+        self._estado().executor().submit(self._ejecutar, app, datos, funcion, ruta)
+        return id_trabajo
+
+    def aplicar(self, id_trabajo, funcion):
+        """
+        Encola como trabajo nuevo la importación real de una simulación
+        terminada sin errores, con el mismo archivo. Devuelve el id nuevo o
+        None si la simulación no existe, no se puede aplicar o ya se aplicó.
+        """
+        datos = self.estado(id_trabajo)
+        if not datos or datos['estado'] != 'simulado':
+            return None
+        ruta = os.path.join(self._estado().directorio, datos['archivo'])
+        if not os.path.exists(ruta):
+            return None
+
+        # Dos clics (o dos workers) pueden pasar la comprobación anterior a la vez: sólo
+        # quien crea la marca (creación exclusiva, atómica en el sistema de archivos) aplica
+        marca = self._ruta(id_trabajo, '.aplicada')
+        try:
+            os.close(os.open(marca, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            return None
+
+        nuevo_id = secrets.token_hex(8)
+        datos.update(estado='aplicado', aplicado_en=nuevo_id)
+        self._escribir(datos)
+        try:
+            self.enviar(nuevo_id, datos['tipo'], funcion, ruta, datos['descripcion'])
+        except Exception:
+            # Sin trabajo encolado, la simulación vuelve a poder aplicarse
+            datos['estado'] = 'simulado'
+            datos.pop('aplicado_en')
+            self._escribir(datos)
+            os.remove(marca)
+            raise
+        return nuevo_id
+
+    def _ejecutar(self, app, datos, funcion, ruta):
+        from app import db
+        with app.app_context():
+            progreso = Progreso(self, datos)
+            datos['estado'] = 'en_curso'
+            progreso.guardar()
+            try:
+                resultado = funcion(ruta, progreso, simular=datos['simulacion'])
+                if resultado.errores:
+                    estado = 'rechazado'
+                else:
+                    estado = 'simulado' if datos['simulacion'] else 'completado'
+                datos.update(
+                    estado=estado,
+                    creados=resultado.creados,
+                    actualizados=resultado.actualizados,
+                    sin_cambios=resultado.sin_cambios,
+                    ausentes=resultado.ausentes,
+                    errores=resultado.errores,
+                )
+            except Exception as e:
+                db.session.rollback()
+                app.logger.exception('Error en el trabajo de importación %s', datos['id'])
+                datos.update(estado='fallido', mensaje=str(e))
+            finally:
+                db.session.remove()
+                datos['fin'] = time.time()
+                progreso.guardar()
+                if datos['estado'] != 'simulado':
+                    try:
+                        os.remove(ruta)
+                    except OSError:
+                        pass
+
+    # --- Consulta ---
+
+    def estado(self, id_trabajo):
+        """Estado del trabajo con porcentaje y segundos restantes estimados (None si no existe)."""
+        if not id_trabajo.isalnum():
+            return None
+        try:
+            with open(self._ruta(id_trabajo)) as f:
+                datos = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+        datos['terminado'] = datos['estado'] in ESTADOS_FINALES
+        datos['porcentaje'] = None
+        datos['eta_segundos'] = None
+        total, hechas = datos['total_filas'], datos['filas_procesadas']
+        if datos['terminado']:
+            datos['porcentaje'] = 100
+        elif total and datos['inicio_fase']:
+            # Las importaciones leen el archivo dos veces (validar y escribir): cada pasada es
+            # la mitad. Las simulaciones sólo validan.
+            avance = min(hechas / total, 1.0)
+            if datos['simulacion']:
+                datos['porcentaje'] = min(99, int(100 * avance))
+            else:
+                datos['porcentaje'] = min(99, int(50 * avance) + (50 if datos['fase'] == 'importando' else 0))
+            transcurrido = time.time() - datos['inicio_fase']
+            if hechas and transcurrido > 0:
+                restantes = max(total - hechas, 0)
+                if datos['fase'] == 'validando' and not datos['simulacion']:
+                    restantes += total  # Falta además la pasada de escritura
+                datos['eta_segundos'] = int(restantes * transcurrido / hechas)
+        return datos
+
+    def limpiar(self):
+        """Borra los archivos de trabajos con más de ANTIGUEDAD_MAXIMA segundos."""
+        limite = time.time() - ANTIGUEDAD_MAXIMA
+        directorio = self._estado().directorio
+        for nombre in os.listdir(directorio):
+            ruta = os.path.join(directorio, nombre)
+            try:
+                if os.path.getmtime(ruta) < limite:
+                    os.remove(ruta)
+            except OSError:
+                pass
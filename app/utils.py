@@ -1,28 +1,35 @@
 import qrcode
-from io import BytesIO
-import base64
+from datetime import datetime, time, timedelta
+from functools import lru_cache
+from itertools import groupby
 import pytz # <-- Añadir esta importación
 
-def generate_qr_code(data_string):
+
+@lru_cache(maxsize=512)
+def generate_qr_svg(data_string):
     """
-    Genera un código QR a partir de una cadena de texto y lo devuelve como una imagen base64.
+    Genera el código QR de una cadena como un SVG compacto: un solo <path> con
+    los módulos oscuros agrupados en tramos horizontales (~2 KB, sin PIL ni base64).
+    Se usa una máscara fija: qrcode prueba por defecto las ocho y se queda con la
+    de menor penalización, lo que cuadruplica el tiempo; cualquiera es un QR válido.
+    Los resultados se guardan en memoria (las reimpresiones no lo recalculan).
     """
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=3,
-        border=1,
-    )
+    qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_L, border=1, mask_pattern=0)
     qr.add_data(data_string)
     qr.make(fit=True)
+    matriz = qr.get_matrix()
 
-    img = qr.make_image(fill_color="black", back_color="white")
-    
-    buffered = BytesIO()
-    img.save(buffered, format="PNG")
-    img_str = base64.b64encode(buffered.getvalue()).decode("utf-8")
-    
-    return f"data:image/png;base64,{img_str}"
+    tramos = []
+    for y, fila in enumerate(matriz):
+        x = 0
+        for oscuro, grupo in groupby(fila):
+            ancho = len(list(grupo))
+            if oscuro:
+                tramos.append(f'M{x} {y}h{ancho}v1h-{ancho}z')
+            x += ancho
+    lado = len(matriz)
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {lado} {lado}" shape-rendering="crispEdges">'
+            f'<rect width="{lado}" height="{lado}" fill="#fff"/><path d="{"".join(tramos)}"/></svg>')
 
 # === INICIO DE NUEVA FUNCIÓN DE AYUDA ===
 def convert_utc_to_local(utc_dt, timezone_str="America/Bogota"):
@@ -36,4 +43,22 @@ def convert_utc_to_local(utc_dt, timezone_str="America/Bogota"):
     except Exception:
         # Si algo falla, devuelve la hora original para no romper la app
         return utc_dt
-# === FIN DE NUEVA FUNCIÓN ===
\ No newline at end of file
+# === FIN DE NUEVA FUNCIÓN ===
+
+def local_today(timezone_str="America/Bogota"):
+    """Devuelve la fecha actual en la zona horaria local."""
+    return datetime.now(pytz.timezone(timezone_str)).date()
+
+def local_day_bounds_utc(fecha_local=None, timezone_str="America/Bogota"):
+    """
+    Devuelve el rango [inicio, fin) en UTC (sin tzinfo, como se guarda en la BD)
+    que corresponde a un día local. Sirve para filtrar por rango sobre la columna
+    de fecha en lugar de aplicar funciones que impiden usar índices.
+    """
+    local_tz = pytz.timezone(timezone_str)
+    if fecha_local is None:
+        fecha_local = local_today(timezone_str)
+    inicio = local_tz.localize(datetime.combine(fecha_local, time.min))
+    fin = local_tz.localize(datetime.combine(fecha_local + timedelta(days=1), time.min))
+    return (inicio.astimezone(pytz.utc).replace(tzinfo=None),
+            fin.astimezone(pytz.utc).replace(tzinfo=None))
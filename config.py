@@ -9,6 +9,8 @@ class Config:
     # --- Claves y Configuraciones Generales ---
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'una-clave-secreta-de-desarrollo'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Zona horaria local del colegio (los registros se guardan en UTC)
+    TIMEZONE = os.environ.get('TIMEZONE') or 'America/Bogota'
     
     # --- Configuración de la Base de Datos (Dinámica) ---
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL')
@@ -36,6 +38,21 @@ class Config:
     # Carpeta para almacenar los backups de la base de datos
     BACKUP_FOLDER = os.path.join(basedir, 'backups')
 
+    # Hilos por worker que ejecutan las importaciones en segundo plano (ver app/trabajos.py)
+    IMPORT_WORKERS = int(os.environ.get('IMPORT_WORKERS') or 1)
+
+    # Transmisión en vivo de registros (ver app/en_vivo.py): segundos entre sondeos
+    # de la BD por worker y duración máxima de cada conexión antes de reconectar
+    FEED_INTERVALO = float(os.environ.get('FEED_INTERVALO') or 1.0)
+    FEED_DURACION_MAX = int(os.environ.get('FEED_DURACION_MAX') or 300)
+
+    # Fotos de personas (ver app/fotos.py): hilos por worker que las procesan,
+    # límites de tamaño comprobados antes de decodificar y espera máxima de la petición
+    FOTOS_HILOS = int(os.environ.get('FOTOS_HILOS') or 2)
+    FOTOS_MAX_BYTES = int(os.environ.get('FOTOS_MAX_BYTES') or 15 * 1024 * 1024)
+    FOTOS_MAX_PIXELES = int(os.environ.get('FOTOS_MAX_PIXELES') or 50_000_000)
+    FOTOS_ESPERA_MAX = float(os.environ.get('FOTOS_ESPERA_MAX') or 30)
+
     # --- Lógica de Compatibilidad para SQLite (Si alguna vez se usa en desarrollo) ---
     # La variable DB_PATH solo es relevante para backups de SQLite.
     DB_PATH = None
@@ -0,0 +1,39 @@
+"""Indices compuestos en registros y personas
+
+Revision ID: 2f1b1dcef93a
+Revises: 500e7a051ae4
+Create Date: 2026-10-18 10:03:51.276904
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '2f1b1dcef93a'
+down_revision = '500e7a051ae4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('registros', schema=None) as batch_op:
+        batch_op.create_index('ix_registros_fecha_hora_registro', ['fecha_hora_registro'], unique=False)
+        batch_op.create_index('ix_registros_persona_fecha', ['persona_id', 'fecha_hora_registro'], unique=False)
+        batch_op.create_index('ix_registros_control_fecha', ['tipo_control_id', 'fecha_hora_registro'], unique=False)
+
+    with op.batch_alter_table('personas', schema=None) as batch_op:
+        batch_op.create_index('ix_personas_dpto_id', ['dpto_id'], unique=False)
+        batch_op.create_index('ix_personas_tipo_persona_id', ['tipo_persona_id'], unique=False)
+        batch_op.create_index('ix_personas_nombre_persona', ['nombre_persona'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('personas', schema=None) as batch_op:
+        batch_op.drop_index('ix_personas_nombre_persona')
+        batch_op.drop_index('ix_personas_tipo_persona_id')
+        batch_op.drop_index('ix_personas_dpto_id')
+
+    with op.batch_alter_table('registros', schema=None) as batch_op:
+        batch_op.drop_index('ix_registros_control_fecha')
+        batch_op.drop_index('ix_registros_persona_fecha')
+        batch_op.drop_index('ix_registros_fecha_hora_registro')
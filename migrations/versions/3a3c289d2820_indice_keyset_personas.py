@@ -0,0 +1,27 @@
+"""Indice (nombre, id) para el listado paginado de personas
+
+Revision ID: 3a3c289d2820
+Revises: 2f1b1dcef93a
+Create Date: 2026-10-18 11:26:40.915532
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '3a3c289d2820'
+down_revision = '2f1b1dcef93a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('personas', schema=None) as batch_op:
+        batch_op.drop_index('ix_personas_nombre_persona')
+        batch_op.create_index('ix_personas_nombre_id', ['nombre_persona', 'id_persona'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('personas', schema=None) as batch_op:
+        batch_op.drop_index('ix_personas_nombre_id')
+        batch_op.create_index('ix_personas_nombre_persona', ['nombre_persona'], unique=False)
@@ -0,0 +1,129 @@
+"""Fecha local y registro unico por dia
+
+Revision ID: 500e7a051ae4
+Revises: d8cbde8f8040
+Create Date: 2026-10-18 09:12:37.418220
+
+"""
+import logging
+
+from alembic import op
+import sqlalchemy as sa
+import pytz
+from flask import current_app
+
+
+# revision identifiers, used by Alembic.
+revision = '500e7a051ae4'
+down_revision = 'd8cbde8f8040'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+logger = logging.getLogger('alembic.runtime.migration')
+
+registros = sa.table(
+    'registros',
+    sa.column('id_registro', sa.Integer),
+    sa.column('fecha_hora_registro', sa.DateTime),
+    sa.column('fecha_local', sa.Date),
+    sa.column('persona_id', sa.String),
+    sa.column('tipo_control_id', sa.Integer),
+)
+
+
+def _backfill_fecha_local(conn):
+    """Calcula fecha_local (zona horaria del colegio) para los registros existentes."""
+    local_tz = pytz.timezone(current_app.config.get('TIMEZONE', 'America/Bogota'))
+    ultimo_id = 0
+    while True:
+        filas = conn.execute(
+            sa.select(registros.c.id_registro, registros.c.fecha_hora_registro)
+            .where(registros.c.id_registro > ultimo_id)
+            .order_by(registros.c.id_registro)
+            .limit(BATCH_SIZE)
+        ).fetchall()
+        if not filas:
+            break
+        conn.execute(
+            registros.update()
+            .where(registros.c.id_registro == sa.bindparam('b_id'))
+            .values(fecha_local=sa.bindparam('b_fecha')),
+            [
+                {'b_id': id_registro,
+                 'b_fecha': fecha_hora.replace(tzinfo=pytz.utc).astimezone(local_tz).date()}
+                for id_registro, fecha_hora in filas
+            ]
+        )
+        ultimo_id = filas[-1].id_registro
+
+
+def _duplicados(conn):
+    """
+    Grupos (persona_id, fecha_local, tipo_control_id, [id_registro, ...]) con más
+    de un registro, que pudo dejar la antigua verificación leer-y-luego-insertar
+    (dos workers registrando a la vez). Se recorre la tabla ordenada por persona,
+    control y fecha: los registros del mismo día local quedan contiguos.
+    """
+    local_tz = pytz.timezone(current_app.config.get('TIMEZONE', 'America/Bogota'))
+    filas = conn.execute(
+        sa.select(registros.c.persona_id, registros.c.tipo_control_id,
+                  registros.c.fecha_hora_registro, registros.c.id_registro)
+        .order_by(registros.c.persona_id, registros.c.tipo_control_id,
+                  registros.c.fecha_hora_registro, registros.c.id_registro)
+        .execution_options(yield_per=BATCH_SIZE)
+    )
+    grupos, clave_anterior, ids = [], None, []
+    for persona_id, tipo_control_id, fecha_hora, id_registro in filas:
+        clave = (persona_id, fecha_hora.replace(tzinfo=pytz.utc).astimezone(local_tz).date(), tipo_control_id)
+        if clave != clave_anterior:
+            if len(ids) > 1:
+                grupos.append((*clave_anterior, ids))
+            clave_anterior, ids = clave, []
+        ids.append(id_registro)
+    if len(ids) > 1:
+        grupos.append((*clave_anterior, ids))
+    return grupos
+
+
+def _comprobar_duplicados(conn):
+    """
+    Aborta la migración si hay más de un registro por persona, día local y tipo
+    de control: la restricción única no se podría crear, y borrar registros
+    históricos es una decisión del operador, no de la migración. Se llama antes
+    de cualquier cambio de esquema, así la migración se puede repetir tal cual.
+    """
+    grupos = _duplicados(conn)
+    if not grupos:
+        return
+    for persona_id, fecha_local, tipo_control_id, ids in grupos:
+        logger.error('Registros duplicados: persona %s, día %s, tipo de control %s -> id_registro %s',
+                     persona_id, fecha_local, tipo_control_id, ', '.join(map(str, ids)))
+    raise RuntimeError(
+        f'Hay {len(grupos)} grupos de registros duplicados (misma persona, día local y tipo de control; '
+        'ver el log de arriba). Elimine los registros sobrantes de cada grupo (normalmente, '
+        'todos menos el de id_registro menor) y vuelva a ejecutar "flask db upgrade".'
+    )
+
+
+def upgrade():
+    conn = op.get_bind()
+    _comprobar_duplicados(conn)
+
+    with op.batch_alter_table('registros', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('fecha_local', sa.Date(), nullable=True))
+
+    _backfill_fecha_local(conn)
+
+    with op.batch_alter_table('registros', schema=None) as batch_op:
+        batch_op.alter_column('fecha_local', existing_type=sa.Date(), nullable=False)
+        batch_op.create_unique_constraint(
+            'uq_registros_persona_dia_control', ['persona_id', 'fecha_local', 'tipo_control_id']
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('registros', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_registros_persona_dia_control', type_='unique')
+        batch_op.drop_column('fecha_local')
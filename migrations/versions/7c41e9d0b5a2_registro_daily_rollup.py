@@ -0,0 +1,61 @@
+"""Tabla registro_daily_rollup con conteos diarios
+
+Revision ID: 7c41e9d0b5a2
+Revises: 3a3c289d2820
+Create Date: 2026-10-18 17:05:12.640118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c41e9d0b5a2'
+down_revision = '3a3c289d2820'
+branch_labels = None
+depends_on = None
+
+registros = sa.table(
+    'registros',
+    sa.column('fecha_local', sa.Date),
+    sa.column('persona_id', sa.String),
+    sa.column('tipo_control_id', sa.Integer),
+)
+
+personas = sa.table(
+    'personas',
+    sa.column('id_persona', sa.String),
+    sa.column('dpto_id', sa.Integer),
+    sa.column('tipo_persona_id', sa.Integer),
+)
+
+
+def upgrade():
+    rollup = op.create_table('registro_daily_rollup',
+        sa.Column('fecha_local', sa.Date(), nullable=False),
+        sa.Column('dpto_id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('tipo_persona_id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('tipo_control_id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('total', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('fecha_local', 'dpto_id', 'tipo_persona_id', 'tipo_control_id')
+    )
+
+    # Conteos de los registros existentes (un solo INSERT ... SELECT en la BD)
+    conteos = (
+        sa.select(
+            registros.c.fecha_local,
+            personas.c.dpto_id,
+            personas.c.tipo_persona_id,
+            registros.c.tipo_control_id,
+            sa.func.count(),
+        )
+        .select_from(registros.join(personas, registros.c.persona_id == personas.c.id_persona))
+        .group_by(registros.c.fecha_local, personas.c.dpto_id, personas.c.tipo_persona_id, registros.c.tipo_control_id)
+    )
+    op.execute(rollup.insert().from_select(
+        ['fecha_local', 'dpto_id', 'tipo_persona_id', 'tipo_control_id', 'total'], conteos
+    ))
+
+
+def downgrade():
+    op.drop_table('registro_daily_rollup')
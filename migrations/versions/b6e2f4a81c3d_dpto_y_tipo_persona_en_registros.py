@@ -0,0 +1,67 @@
+"""Dpto y tipo de persona guardados en cada registro
+
+Revision ID: b6e2f4a81c3d
+Revises: 7c41e9d0b5a2
+Create Date: 2026-10-19 10:02:51.204117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6e2f4a81c3d'
+down_revision = '7c41e9d0b5a2'
+branch_labels = None
+depends_on = None
+
+registros = sa.table(
+    'registros',
+    sa.column('persona_id', sa.String),
+    sa.column('dpto_id', sa.Integer),
+    sa.column('tipo_persona_id', sa.Integer),
+)
+
+personas = sa.table(
+    'personas',
+    sa.column('id_persona', sa.String),
+    sa.column('dpto_id', sa.Integer),
+    sa.column('tipo_persona_id', sa.Integer),
+)
+
+
+def upgrade():
+    with op.batch_alter_table('registros', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('dpto_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('tipo_persona_id', sa.Integer(), nullable=True))
+
+    # Los registros existentes no guardaban el dpto ni el tipo del momento del
+    # check-in: se toman los actuales de la persona, los mismos con que la
+    # migración 7c41e9d0b5a2 llenó el rollup, así ambos quedan consistentes.
+    persona = personas.c.id_persona == registros.c.persona_id
+    op.execute(registros.update().values(
+        dpto_id=sa.select(personas.c.dpto_id).where(persona).scalar_subquery(),
+        tipo_persona_id=sa.select(personas.c.tipo_persona_id).where(persona).scalar_subquery(),
+    ))
+
+    with op.batch_alter_table('registros', schema=None) as batch_op:
+        batch_op.alter_column('dpto_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.alter_column('tipo_persona_id', existing_type=sa.Integer(), nullable=False)
+        # Filtros por dpto y tipo de persona de los reportes; en MySQL también
+        # sirven de índice a las llaves foráneas
+        batch_op.create_index('ix_registros_dpto_fecha', ['dpto_id', 'fecha_hora_registro'], unique=False)
+        batch_op.create_index('ix_registros_tipo_persona_fecha', ['tipo_persona_id', 'fecha_hora_registro'],
+                              unique=False)
+        batch_op.create_foreign_key('fk_registros_dpto_id', 'dptos', ['dpto_id'], ['id_dpto'])
+        batch_op.create_foreign_key('fk_registros_tipo_persona_id', 'tipos_persona',
+                                    ['tipo_persona_id'], ['id_tipopersona'])
+
+
+def downgrade():
+    with op.batch_alter_table('registros', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_registros_tipo_persona_id', type_='foreignkey')
+        batch_op.drop_constraint('fk_registros_dpto_id', type_='foreignkey')
+        batch_op.drop_index('ix_registros_tipo_persona_fecha')
+        batch_op.drop_index('ix_registros_dpto_fecha')
+        batch_op.drop_column('tipo_persona_id')
+        batch_op.drop_column('dpto_id')